@@ -0,0 +1,97 @@
+"""Benchmark of the storage options of the NumpyHDFStorage
+
+This script compares write and read throughput as well as the disk footprint of different chunking and compression
+settings of :py:class:`pailab.ml_repo.numpy_handler_hdf.NumpyHDFStorage` using the example datasets bundled with pailab.
+
+Usage::
+
+    python hdf_storage_benchmark.py [n_repeat]
+
+where n_repeat (default 20) is the number of times the datasets are repeated to obtain larger data. Note that the repetition
+overstates the compression ratios compared to real data of the same size.
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from pailab.ml_repo.numpy_handler_hdf import NumpyHDFStorage
+
+_EXAMPLE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STORAGE_OPTIONS = {
+    'raw': {},
+    'chunked': {'chunk_rows': 10000},
+    'gzip': {'chunk_rows': 10000, 'compression': 'gzip'},
+    'gzip+shuffle': {'chunk_rows': 10000, 'compression': 'gzip', 'shuffle': True},
+    'lzf+shuffle': {'chunk_rows': 10000, 'compression': 'lzf', 'shuffle': True},
+    'blosc': {'chunk_rows': 10000, 'compression': 'blosc'},
+    'gzip+shuffle+float32': {'chunk_rows': 10000, 'compression': 'gzip', 'shuffle': True, 'dtype': 'float32'},
+}
+
+
+def load_datasets(n_repeat):
+    """ Load the numeric columns of the bundled example datasets
+
+    Args:
+        n_repeat (int): number of times the data is repeated
+
+    Returns:
+        dict -- dictionary of dataset names and numpy matrices
+    """
+
+    result = {}
+    for name, filename in [('boston_housing', 'boston_housing/housing.csv'),
+                           ('adult_census_income', 'adult-census-income/adult.csv')]:
+        data = pd.read_csv(_EXAMPLE_DIR + '/' + filename).select_dtypes(include=[np.number])
+        result[name] = np.tile(data.values.astype(np.float64), (n_repeat, 1))
+    return result
+
+
+def _get_size(directory):
+    size = 0
+    for path, _, files in os.walk(directory):
+        for f in files:
+            size += os.path.getsize(path + '/' + f)
+    return size
+
+
+def run_benchmark(datasets):
+    """ Run the benchmark for all storage options and datasets
+
+    Args:
+        datasets (dict): dictionary of dataset names and numpy matrices
+
+    Returns:
+        pandas.DataFrame -- write/read throughput (MB/s) and disk footprint relative to the in-memory size
+    """
+
+    rows = []
+    for option_name, options in STORAGE_OPTIONS.items():
+        for data_name, data in datasets.items():
+            directory = tempfile.mkdtemp()
+            try:
+                store = NumpyHDFStorage(directory, storage_options={'default': options})
+                mb = data.nbytes / 1024.0**2
+                start = time.perf_counter()
+                store.add(data_name, '1', {'x_data': data})
+                write_time = time.perf_counter() - start
+                start = time.perf_counter()
+                store.get(data_name, '1')
+                read_time = time.perf_counter() - start
+                rows.append({'options': option_name, 'data': data_name, 'size (MB)': mb,
+                             'write (MB/s)': mb / write_time, 'read (MB/s)': mb / read_time,
+                             'disk/memory': _get_size(directory) / data.nbytes})
+            finally:
+                shutil.rmtree(directory)
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    n_repeat = 20
+    if len(sys.argv) > 1:
+        n_repeat = int(sys.argv[1])
+    result = run_benchmark(load_datasets(n_repeat))
+    print(result.to_string(index=False, float_format='{:.2f}'.format))
@@ -292,7 +292,7 @@ def get_pointwise_model_errors(ml_repo, models, data, coord_name=None, data_vers
 
 
 def get_ptws_error_dist_mmd(ml_repo, model, data, x_coords=None, y_coords=None, start_index=0, end_index=-1, percentile=0.1,
-                            cache=True, scale=True, metric='rbf',  **kwds):
+                            cache=True, scale=True, metric='rbf', estimator='quadratic', n_jobs=1, **kwds):
     """Returns Squared Maximum Mean Distance (MMD) between the distributions of the x-data w.r.t. a percentile of the absolute pointwise
         errors along the y-coordinates.
 
@@ -317,6 +317,9 @@ def get_ptws_error_dist_mmd(ml_repo, model, data, x_coords=None, y_coords=None,
             The callable should take two arrays from X as input and return a value indicating the distance between them. 
             Currently, sklearn provides the following strings: ‘additive_chi2’, ‘chi2’, ‘linear’, ‘poly’, ‘polynomial’, ‘rbf’,
                                                 ‘laplacian’, ‘sigmoid’, ‘cosine’ 
+        estimator (str, optional): The MMD estimator, 'quadratic' uses all pairs of points, 'linear' (unbiased linear time estimator) and 
+            'rff' (random Fourier features, only for the metrics 'rbf' and 'laplacian') scale linearly in the number of points. Defaults to 'quadratic'.
+        n_jobs (int, optional): Number of threads computing the x-coordinates in parallel. Defaults to 1.
         **kwds: optional keyword parameters that are passed directly to the kernel function.
 
     Returns:
@@ -380,7 +383,8 @@ def get_ptws_error_dist_mmd(ml_repo, model, data, x_coords=None, y_coords=None,
             tmp = ml_repo.get(d.repo_info.name,
                               version=d.repo_info.version, full_object=True)
             mmd = _get_MMD2_X_vs_abs_ptw_error_percentile(
-                tmp, eval_data, x_coords, y_coords, cache=cache_, percentile=percentile, scale=scale, metric=metric, **kwds)
+                tmp, eval_data, x_coords, y_coords, cache=cache_, percentile=percentile, scale=scale, metric=metric,
+                estimator=estimator, n_jobs=n_jobs, **kwds)
             if x_coords is not None:
                 x_coord_names = [d.x_coord_names[i] for i in x_coords]
             else:
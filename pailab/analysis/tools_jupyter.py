@@ -89,14 +89,12 @@ class _MLRepoModel:
             model_rows = []
             model_names = ml_repo.get_names(MLObjectType.CALIBRATED_MODEL)
             for model_name in model_names:
-                models = ml_repo.get(model_name, version=(
-                    FIRST_VERSION, LAST_VERSION), full_object=False)
+                models = ml_repo.get_history(model_name, repo_info_fields=[RepoInfoKey.NAME, RepoInfoKey.VERSION, RepoInfoKey.CLASSNAME,
+                                                                           RepoInfoKey.DESCRIPTION, RepoInfoKey.CATEGORY, RepoInfoKey.COMMIT_MESSAGE,
+                                                                           RepoInfoKey.AUTHOR, RepoInfoKey.COMMIT_DATE], obj_member_fields=[])
                 for model in models:
-                    tmp = copy.deepcopy(model.repo_info.get_dictionary())
+                    tmp = model['repo_info']
                     tmp['model'] = tmp['name']
-                    del tmp['big_objects']
-                    del tmp['modifiers']
-                    del tmp['modification_info']
                     tmp['label'] = self.model_to_label[(tmp['model'], tmp['version'],)]
                     tmp['widget_key'] =  tmp['commit_date'][0:16] + ' | ' +  tmp['author'] + ' | ' + str(tmp['label']) + ' | ' + tmp['version']
                     model_rows.append(tmp)
@@ -349,7 +347,8 @@ class _DataSelectorWithVersion:
     def _update_version(self, change):
         self._updating_version = True
         data_selected = self._selection_data.value
-        tmp = widget_repo.ml_repo.get_history(data_selected)
+        tmp = widget_repo.ml_repo.get_history(data_selected, repo_info_fields=[RepoInfoKey.VERSION, RepoInfoKey.AUTHOR,
+                                                                               RepoInfoKey.COMMIT_DATE], obj_member_fields=[])
         key_to_version = {}
         versions = []
         for x in tmp:
@@ -772,7 +771,8 @@ class ObjectView:
                   RepoInfoKey.VERSION.value: [],
                   RepoInfoKey.COMMIT_DATE.value: []}
         for k in self._names.value:
-            history = widget_repo.ml_repo.get_history(k)
+            history = widget_repo.ml_repo.get_history(
+                k, repo_info_fields=list(result.keys()), obj_member_fields=[])
             for l in history:
                 for m in result.keys():
                     result[m].append(l['repo_info'][m])
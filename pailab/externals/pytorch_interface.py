@@ -49,12 +49,14 @@ def _get_object_from_classname(classname, data):
 
 class PytorchModelWrapper:
     @repo_object_init(['state_dict'])
-    def __init__(self, pytorch_model, param):
+    def __init__(self, pytorch_model, param, eval_batch_size=1024, num_threads=None):
         self.classname = pytorch_model.__class__.__module__ + \
             '.' + pytorch_model.__class__.__name__
         self.state_dict_order = []
         self.state_dict = {}
         self.model_param = param
+        self.eval_batch_size = eval_batch_size
+        self.num_threads = num_threads
         for k, v in pytorch_model.state_dict().items():
             self.state_dict_order.append(k)
             self.state_dict[k] = v.numpy()
@@ -99,9 +101,12 @@ class _PytorchDataset(Dataset):
 
 class PytorchTrainingParameter:
     @repo_object_init()
-    def __init__(self, batch_size, epochs, loss='MSE', optimizer='Adam', optim_param={}):
+    def __init__(self, batch_size, epochs, loss='MSE', optimizer='Adam', optim_param={}, eval_batch_size=1024, num_threads=None):
         self.batch_size = batch_size
         self.epochs = epochs
+        # batch size and number of intra-op threads used to evaluate the trained model (stored in the PytorchModelWrapper)
+        self.eval_batch_size = eval_batch_size
+        self.num_threads = num_threads
         self.loss = loss
         self.loss = 'MSE'
         self.optimizer = optimizer
@@ -136,41 +141,57 @@ class PytorchModelParameter:
         return model
 
 
-def eval_pytorch(model: PytorchModelWrapper, data, num_workers=0):
-    d = _PytorchDataset(data)
-    loader = torch.utils.data.DataLoader(
-        d, batch_size=1, num_workers=num_workers)
+def eval_pytorch(model: PytorchModelWrapper, data, num_workers=0, batch_size=None):
+    """Evaluate a PyTorch model on the x_data of the given data.
+
+    The data is evaluated in batches without computing gradients and the outputs are copied into a preallocated numpy array.
+    The batch size and the number of intra-op threads are taken from the model (see PytorchTrainingParameter).
+
+    Args:
+        model (PytorchModelWrapper): the model to evaluate
+        data (RawData or DataSet): the data to evaluate
+        num_workers (int): if larger than zero, the batches are created by a torch DataLoader using num_workers worker processes. Defaults to 0.
+        batch_size (int or None): the batch size, if None the eval_batch_size of the model is used. Defaults to None.
+
+    Returns:
+        numpy array -- the output of the model (the first output if the model returns several outputs), an empty array of shape (0, n_out) if the data is empty
+    """
+    if batch_size is None:
+        batch_size = getattr(model, 'eval_batch_size', 1024)
+    num_threads = getattr(model, 'num_threads', None)
     m = model.get_model()
     m.eval()
-    # determine number of data
-    n_data = len(loader)
-    result = None
-    is_tuple = False
-    for x in loader:
-        if isinstance(x, list):
-            output = m(x[0])
-        else:
-            output = m(x)
-        if isinstance(output, list):
-            result = np.empty((n_data, ) + tuple(output[0].shape[1:]))
-            is_tuple = True
-        else:
-            result = np.empty((n_data, ) + tuple(output.shape[1:]))
-        break
-    if is_tuple:
-        for i, x in enumerate(loader):
-            if isinstance(x, list):
-                output = m(x[0])
-            else:
-                output = m(x)
-            result[i] = output.data
+    x_data = data.x_data
+    n_data = x_data.shape[0]
+    if n_data == 0:
+        # evaluate the empty input once so that the result has the output shape of the model
+        batches = [torch.tensor(x_data, dtype=torch.float)]
+    elif num_workers > 0:
+        batches = torch.utils.data.DataLoader(
+            _PytorchDataset(data), batch_size=batch_size, num_workers=num_workers)
     else:
-        for i, x in enumerate(loader):
-            if isinstance(x, list):
-                output = m(x[0])
-            else:
+        # only the current batch is converted to a float tensor
+        batches = (torch.tensor(x_data[i:i+batch_size], dtype=torch.float)
+                   for i in range(0, n_data, batch_size))
+    result = None
+    old_num_threads = torch.get_num_threads()
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+    try:
+        with torch.no_grad():
+            start = 0
+            for x in batches:
+                if isinstance(x, list):
+                    x = x[0]
                 output = m(x)
-            result[i] = output.data  # .detach.numpy()
+                if isinstance(output, (list, tuple)):
+                    output = output[0]
+                if result is None:
+                    result = np.empty((n_data, ) + tuple(output.shape[1:]))
+                result[start:start+output.shape[0]] = output.numpy()
+                start += output.shape[0]
+    finally:
+        torch.set_num_threads(old_num_threads)
     return result
 
 
@@ -223,12 +244,13 @@ def train_pytorch(model_param: PytorchModelParameter, train_param: PytorchTraini
         ))
 
     logger.info('Finished training with train loss ' + str(train_loss))
-    result = PytorchModelWrapper(model, model_param.get_param(), repo_info={})
+    result = PytorchModelWrapper(model, model_param.get_param(), eval_batch_size=getattr(train_param, 'eval_batch_size', 1024),
+                                 num_threads=getattr(train_param, 'num_threads', None), repo_info={})
     return result
 
 
 def add_model(repo, pytorch_model, model_param, model_name,
-              batch_size, epochs, loss='MSE', optimizer='Adam', optim_param={}):
+              batch_size, epochs, loss='MSE', optimizer='Adam', optim_param={}, eval_batch_size=1024, num_threads=None):
     """Add a PyTorch model.
 
     This method adds all relevant objects to train the PyTorch model: The training and evaluation functions as well as training- and model parameter.
@@ -245,6 +267,8 @@ def add_model(repo, pytorch_model, model_param, model_name,
         loss (str, optional): [description]. Defaults to 'MSE'.
         optimizer (str, optional): [description]. Defaults to 'Adam'.
         optim_param (dict, optional): [description]. Defaults to {}.
+        eval_batch_size (int, optional): batch size used to evaluate the trained model. Defaults to 1024.
+        num_threads (int, optional): number of intra-op threads used to evaluate the trained model, if None the torch default is used. Defaults to None.
     """
     repo.add_eval_function(eval_pytorch,
                            repo_name='eval_pytorch')
@@ -252,7 +276,7 @@ def add_model(repo, pytorch_model, model_param, model_name,
         train_pytorch, repo_name='train_pytorch')
 
     train_param = PytorchTrainingParameter(
-        batch_size, epochs, loss, optimizer, optim_param,  repo_info={RepoInfoKey.NAME.value: model_name + '/training_param',
+        batch_size, epochs, loss, optimizer, optim_param, eval_batch_size, num_threads, repo_info={RepoInfoKey.NAME.value: model_name + '/training_param',
                                                                       RepoInfoKey.CATEGORY: MLObjectType.TRAINING_PARAM})
     model_param = PytorchModelParameter(
         pytorch_model, **model_param, repo_info={RepoInfoKey.NAME.value: model_name + '/model_param',
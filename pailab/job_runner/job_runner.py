@@ -1,7 +1,14 @@
 from contextlib import closing
+import asyncio
+import concurrent.futures
+import copy
+import multiprocessing
+import threading
 import traceback
 import datetime
 import os
+import select
+import socket
 import sqlite3
 import time
 import abc
@@ -123,33 +130,676 @@ class SimpleJobRunner(JobRunnerBase):
         return []
 
 
+# repo used by the worker processes of the ProcessPoolJobRunner
+_worker_repo = None
+
+
+def _create_worker_repo(config, user, write_lock):
+    """ Opens the repo in a worker of the ProcessPoolJobRunner or the AsyncJobRunner
+
+    Args:
+        config (dict): the configuration of the MLRepo
+        user (str): the user
+        write_lock (RLock): lock shared by all workers writing to the repo
+
+    Returns:
+        MLRepo -- the repo
+    """
+
+    from pailab.ml_repo.repo import MLRepo
+    config = copy.deepcopy(config)
+    # the config must not be saved to the workspace by the worker and jobs are run directly in the worker
+    config['workspace'] = None
+    config['job_runner'] = {'type': 'simple',
+                            'config': {'throw_job_error': True}}
+    repo = MLRepo(user=user, config=config)
+    repo._set_write_lock(write_lock)
+    return repo
+
+
+def _init_worker(config, user, write_lock):
+    """ Initializes a worker process of the ProcessPoolJobRunner
+
+    Args:
+        config (dict): the configuration of the MLRepo
+        user (str): the user
+        write_lock (multiprocessing.RLock): lock shared by all processes writing to the repo
+    """
+
+    global _worker_repo
+    _worker_repo = _create_worker_repo(config, user, write_lock)
+
+
+def _run_job_in_worker(job_name, job_version, job_id):
+    """ Runs a job in a worker process of the ProcessPoolJobRunner
+
+    Args:
+        job_name (str): name of the job
+        job_version (str): version of the job
+        job_id (str): the job id
+
+    Returns:
+        tuple of str -- error message and stack trace (empty strings if the job finished successfully)
+    """
+
+    job = _worker_repo.get(job_name, version=job_version)
+    try:
+        job.run(_worker_repo, job_id)
+    except Exception as e:
+        logger.error(str(e) + ': ' + str(traceback.format_exc()))
+        return str(e), traceback.format_exc()
+    return '', ''
+
+
+class ProcessPoolJobRunner(JobRunnerBase):
+    """ Job runner executing the jobs concurrently in a pool of processes
+
+    A job is submitted to the pool as soon as all its predecessor jobs have finished successfully, so that independent jobs 
+    (e.g. the evaluation and measure jobs of different datasets) run in parallel. Each worker process opens the repo using the configuration of
+    the MLRepo, writes to the repo are serialized by a lock shared between all processes. Therefore the repo must be stored on disk
+    (e.g. disk_handler or git_handler together with hdf_handler). 
+    Jobs whose predecessor failed are set to failed without running them.
+    """
+
+    def __init__(self, repo, max_workers=None):
+        """Constructor
+
+        Args:
+            repo (MLRepo): repository
+            max_workers (int): maximal number of worker processes, if None the number of cores is used. Defaults to None.
+
+        Raises:
+            Exception: raises an exception if the repo or the numpy store is kept in memory
+        """
+
+        if repo._config['repo_store']['type'] == 'memory_handler' or repo._config['numpy_store']['type'] == 'memory_handler':
+            raise Exception(
+                'ProcessPoolJobRunner cannot be used with a repo in memory, please use a repo stored on disk.')
+        self._repo = repo
+        self._max_workers = max_workers
+        self._context = multiprocessing.get_context('spawn')
+        self._write_lock = self._context.RLock()
+        self._repo._set_write_lock(self._write_lock)
+        self._executor = None
+        self._lock = threading.RLock()
+        self._finished = threading.Condition(self._lock)
+        self._job_info = {}
+        # job ids of unfinished predecessors and of successors of the jobs
+        self._predecessors = {}
+        self._successors = {}
+
+    def set_repo(self, repo):
+        self._repo = repo
+        self._repo._set_write_lock(self._write_lock)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self._max_workers, mp_context=self._context,
+                                                                    initializer=_init_worker,
+                                                                    initargs=(self._repo._config, self._repo._user, self._write_lock))
+        return self._executor
+
+    def _submit(self, job_id):
+        job_name, job_version = job_id.rsplit(':', 1)
+        job_info = self._job_info[job_id]
+        job_info.set_state(JobState.RUNNING)
+        job_info.set_start_time()
+        future = self._get_executor().submit(
+            _run_job_in_worker, job_name, job_version, job_id)
+        future.add_done_callback(
+            lambda f: self._set_finished(job_id, f))
+
+    def _set_failed(self, job_id, error_message, stack_trace=None):
+        job_info = self._job_info[job_id]
+        job_info.set_end_time()
+        job_info.set_state(JobState.FAILED)
+        job_info.error_message = error_message
+        job_info.trace_back = stack_trace
+        for successor in self._successors.pop(job_id, []):
+            self._set_failed(successor, 'Predecessor job ' +
+                             job_id + ' failed.')
+
+    def _set_finished(self, job_id, future):
+        """ Callback called when a job has been finished, it submits the successors whose predecessors have all been finished
+        """
+
+        with self._lock:
+            try:
+                error_message, stack_trace = future.result()
+            except Exception as e:
+                error_message, stack_trace = str(e), traceback.format_exc()
+            if error_message != '' or stack_trace != '':
+                logger.error('Finished running job ' + job_id + ' with errors: ' +
+                             error_message + '   stacktrace: ' + stack_trace)
+                self._set_failed(job_id, error_message, stack_trace)
+            else:
+                logger.info('Finished running job ' +
+                            job_id + ' successfully.')
+                job_info = self._job_info[job_id]
+                job_info.set_end_time()
+                job_info.set_state(JobState.SUCCESSFULLY_FINISHED)
+                for successor in self._successors.pop(job_id, []):
+                    predecessors = self._predecessors[successor]
+                    predecessors.discard(job_id)
+                    if len(predecessors) == 0:
+                        self._submit(successor)
+            self._finished.notify_all()
+
+    def add(self, job_name, job_version, user):
+        job_id = job_name + ':' + str(job_version)
+        job = self._repo.get(job_name, version=job_version)
+        with self._lock:
+            job_info = JobInfo(user)
+            job_info.submission_time = datetime.datetime.now()
+            self._job_info[job_id] = job_info
+            predecessors = set()
+            for predecessor in job.get_predecessor_jobs():
+                predecessor_id = predecessor[0] + ':' + str(predecessor[1])
+                # predecessors not handled by this job runner are assumed to be finished
+                predecessor_info = self._job_info.get(predecessor_id)
+                if predecessor_info is None or predecessor_info.state == JobState.SUCCESSFULLY_FINISHED.value:
+                    continue
+                if predecessor_info.state == JobState.FAILED.value:
+                    self._set_failed(job_id, 'Predecessor job ' +
+                                     predecessor_id + ' failed.')
+                    return job_id
+                predecessors.add(predecessor_id)
+                self._successors.setdefault(
+                    predecessor_id, []).append(job_id)
+            self._predecessors[job_id] = predecessors
+            if len(predecessors) == 0:
+                self._submit(job_id)
+            else:
+                job_info.set_state(JobState.WAITING_PRED)
+        return job_id
+
+    def get_info(self, job_name, job_version):
+        jobid = job_name + ':' + str(job_version)
+        return self._job_info[jobid]
+
+    def get_waiting_jobs(self):
+        """Return list of open jobs
+
+        Returns:
+            list of tuples: list containing tuples of job names and versions of the jobs currently waiting or running
+        """
+
+        with self._lock:
+            return [tuple(k.rsplit(':', 1)) for k, v in self._job_info.items()
+                    if v.state in (JobState.WAITING_PRED.value, JobState.RUNNING.value)]
+
+    def wait(self, timeout=None):
+        """ Wait until all jobs have been finished
+
+        Args:
+            timeout (float): maximal time in seconds to wait, if None it waits until all jobs are finished. Defaults to None.
+
+        Returns:
+            bool -- True if all jobs have been finished, False if the timeout occured
+        """
+
+        with self._lock:
+            return self._finished.wait_for(lambda: len(self.get_waiting_jobs()) == 0, timeout)
+
+    def close_connection(self):
+        """Shuts down the worker processes after all jobs have been finished
+        """
+
+        self.wait()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class AsyncJobRunner(JobRunnerBase):
+    """ Job runner scheduling the jobs with asyncio and running them in a pool of threads
+
+    The runner is suited for jobs which are mainly I/O bound (e.g. loading data from a remote storage). The jobs are scheduled
+    by an asyncio event loop running in a background thread. A job is started as soon as all its predecessor jobs have
+    finished successfully, jobs whose predecessor failed are set to failed without running them. The number of jobs running
+    concurrently is bounded by the number of threads and, optionally, per job class (e.g. TrainingJob, EvalJob, MeasureJob,
+    RegressionTest).
+
+    If the repo is stored on disk, each thread opens the repo using the configuration of the MLRepo and writes to the repo are serialized 
+    by a lock. Otherwise the MLRepo is shared by all threads and, since the stores in memory are not thread safe, the jobs are run one at a time.
+
+    For each job an awaitable is returned by :py:meth:`wait_for_job` so that the completion of a job can be awaited, e.g. in a notebook::
+
+        job_info = await ml_repo._job_runner.wait_for_job(job_name, job_version)
+    """
+
+    def __init__(self, repo, max_workers=None, max_concurrency=None):
+        """Constructor
+
+        Args:
+            repo (MLRepo): repository
+            max_workers (int): maximal number of threads running jobs, if None the default of concurrent.futures.ThreadPoolExecutor is used. Defaults to None.
+            max_concurrency (dict): dictionary of job class names (e.g. 'EvalJob') and the maximal number of jobs of the respective
+                class running concurrently. Classes not contained in the dictionary are only bounded by max_workers. Defaults to None.
+        """
+
+        self._repo = repo
+        self._max_workers = max_workers
+        self._max_concurrency = max_concurrency
+        if self._max_concurrency is None:
+            self._max_concurrency = {}
+        self._write_lock = threading.RLock()
+        self._repo._set_write_lock(self._write_lock)
+        # lock serializing the jobs run on a repo shared by all threads
+        self._shared_repo_lock = threading.Lock()
+        self._thread_local = threading.local()
+        self._executor = None
+        self._loop = None
+        self._loop_thread = None
+        self._semaphores = {}
+        self._lock = threading.RLock()
+        self._job_info = {}
+        self._futures = {}
+
+    def set_repo(self, repo):
+        self._repo = repo
+        self._repo._set_write_lock(self._write_lock)
+
+    def _start(self):
+        if self._loop is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._max_workers)
+            self._loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+            self._loop_thread.start()
+
+    def _is_shared_repo(self):
+        """ Returns True if the repo is kept in memory and therefore shared by all threads
+        """
+
+        return self._repo._config['repo_store']['type'] == 'memory_handler' or self._repo._config['numpy_store']['type'] == 'memory_handler'
+
+    def _get_repo(self):
+        """ Returns the repo used by the current thread
+        """
+
+        if self._is_shared_repo():
+            return self._repo
+        repo = getattr(self._thread_local, 'repo', None)
+        if repo is None:
+            repo = _create_worker_repo(self._repo._config, self._repo._user, self._write_lock)
+            self._thread_local.repo = repo
+        return repo
+
+    def _run_job(self, job_name, job_version, job_id):
+        if self._is_shared_repo():
+            with self._shared_repo_lock:
+                return self._run_job_on_repo(self._repo, job_name, job_version, job_id)
+        return self._run_job_on_repo(self._get_repo(), job_name, job_version, job_id)
+
+    @staticmethod
+    def _run_job_on_repo(repo, job_name, job_version, job_id):
+        job = repo.get(job_name, version=job_version)
+        try:
+            job.run(repo, job_id)
+        except Exception as e:
+            logger.error(str(e) + ': ' + str(traceback.format_exc()))
+            return str(e), traceback.format_exc()
+        return '', ''
+
+    def _get_semaphore(self, job_class):
+        if job_class not in self._max_concurrency:
+            return None
+        if job_class not in self._semaphores:
+            self._semaphores[job_class] = asyncio.Semaphore(self._max_concurrency[job_class])
+        return self._semaphores[job_class]
+
+    async def _execute(self, job_name, job_version, job_id, job_class, predecessors):
+        """ Coroutine waiting for the predecessors and running the job in the thread pool
+
+        Returns:
+            JobInfo -- the info of the finished job
+        """
+
+        job_info = self._job_info[job_id]
+        for predecessor_id in predecessors:
+            predecessor_info = await asyncio.wrap_future(self._futures[predecessor_id])
+            if predecessor_info.state == JobState.FAILED.value:
+                job_info.set_end_time()
+                job_info.set_state(JobState.FAILED)
+                job_info.error_message = 'Predecessor job ' + predecessor_id + ' failed.'
+                return job_info
+        semaphore = self._get_semaphore(job_class)
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            job_info.set_state(JobState.RUNNING)
+            job_info.set_start_time()
+            error_message, stack_trace = await self._loop.run_in_executor(self._executor, self._run_job, job_name, job_version, job_id)
+            job_info.set_end_time()
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+        if error_message != '' or stack_trace != '':
+            logger.error('Finished running job ' + job_id + ' with errors: ' +
+                         error_message + '   stacktrace: ' + stack_trace)
+            job_info.set_state(JobState.FAILED)
+            job_info.error_message = error_message
+            job_info.trace_back = stack_trace
+        else:
+            logger.info('Finished running job ' + job_id + ' successfully.')
+            job_info.set_state(JobState.SUCCESSFULLY_FINISHED)
+        return job_info
+
+    def add(self, job_name, job_version, user):
+        job_id = job_name + ':' + str(job_version)
+        job = self._repo.get(job_name, version=job_version)
+        with self._lock:
+            self._start()
+            job_info = JobInfo(user)
+            job_info.submission_time = datetime.datetime.now()
+            job_info.set_state(JobState.WAITING_PRED)
+            self._job_info[job_id] = job_info
+            # predecessors not handled by this job runner are assumed to be finished
+            predecessors = [predecessor[0] + ':' + str(predecessor[1]) for predecessor in job.get_predecessor_jobs()
+                            if predecessor[0] + ':' + str(predecessor[1]) in self._futures]
+            self._futures[job_id] = asyncio.run_coroutine_threadsafe(
+                self._execute(job_name, job_version, job_id, job.__class__.__name__, predecessors), self._loop)
+        return job_id
+
+    def get_info(self, job_name, job_version):
+        jobid = job_name + ':' + str(job_version)
+        return self._job_info[jobid]
+
+    async def wait_for_job(self, job_name, job_version):
+        """ Wait until the job has been finished
+
+        Args:
+            job_name (str): name of the job
+            job_version (str): version of the job
+
+        Returns:
+            JobInfo -- the info of the finished job
+        """
+
+        with self._lock:
+            future = self._futures[job_name + ':' + str(job_version)]
+        return await asyncio.wrap_future(future)
+
+    def get_waiting_jobs(self):
+        """Return list of open jobs
+
+        Returns:
+            list of tuples: list containing tuples of job names and versions of the jobs currently waiting or running
+        """
+
+        with self._lock:
+            return [tuple(k.rsplit(':', 1)) for k, v in self._futures.items() if not v.done()]
+
+    def wait(self, timeout=None):
+        """ Wait until all jobs have been finished
+
+        Args:
+            timeout (float): maximal time in seconds to wait, if None it waits until all jobs are finished. Defaults to None.
+
+        Returns:
+            bool -- True if all jobs have been finished, False if the timeout occured
+        """
+
+        with self._lock:
+            futures = list(self._futures.values())
+        _, not_done = concurrent.futures.wait(futures, timeout)
+        return len(not_done) == 0
+
+    def close_connection(self):
+        """Stops the event loop and the threads after all jobs have been finished
+        """
+
+        self.wait()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+            self._loop.close()
+            self._loop = None
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class _SQLiteWriteLock:
+    """ Lock shared by all processes using the same lock file
+
+    The lock is held by an immediate transaction on a sqlite database used only for this purpose, so that the lock works across
+    processes on every platform supported by sqlite. Within a process the lock is reentrant.
+    """
+
+    def __init__(self, filename, timeout):
+        """Constructor
+
+        Args:
+            filename (str): the file of the sqlite database used as lock
+            timeout (float): time in seconds to wait for the lock before an exception is raised
+        """
+
+        self._filename = filename
+        self._timeout = timeout
+        self._lock = threading.RLock()
+        self._count = 0
+        self._conn = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._count == 0:
+            try:
+                if self._conn is None:
+                    self._conn = sqlite3.connect(self._filename, timeout=self._timeout, isolation_level=None)
+                self._conn.execute('BEGIN IMMEDIATE')
+            except:
+                self._lock.release()
+                raise
+        self._count += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._count -= 1
+        try:
+            if self._count == 0:
+                self._conn.execute('ROLLBACK')
+        finally:
+            self._lock.release()
+        return False
+
+    def close(self):
+        """Closes the connection to the lock file
+        """
+
+        with self._lock:
+            if self._conn is not None and self._count == 0:
+                self._conn.close()
+                self._conn = None
+
+
 class SQLiteJobRunner(JobRunnerBase):
+    """Job runner using a sqlite database as job queue
+
+    Several job runners (e.g. in different processes on the same machine) may work on the same database. Each runner
+    identifies itself by a worker id and claims a job atomically within an immediate transaction. A claimed job is leased to the
+    worker for lease_time seconds, the lease is renewed by a heartbeat while the job is running. Jobs whose lease expired
+    (e.g. because the worker crashed) are put back into the waiting state and are picked up by another worker.
+
+    Runners waiting for jobs register a local UDP socket in the workers table. Adding a job or finishing a job sends a datagram
+    to all registered workers so that they wake up immediately, polling the database every sleep seconds is only used as fallback.
+
+    Writes to the repo of all runners on the same database are serialized by a lock (an immediate transaction on the file sqlite_db_name + '.write_lock'),
+    the mapping of the repo is reloaded under the lock so that runners do not overwrite the mapping entries added by other runners.
+    """
+    _SCHEMA_VERSION = 3
+    # statements to migrate the db to the respective schema version
+    _MIGRATION_STATEMENTS = {
+        1: [
+            'ALTER TABLE jobs ADD COLUMN worker_id TEXT',
+            'ALTER TABLE jobs ADD COLUMN lease_expiry REAL',
+            'CREATE INDEX IF NOT EXISTS jobs_state_insert_time ON jobs (job_state, insert_time)',
+        ],
+        2: [
+            'CREATE TABLE IF NOT EXISTS workers (worker_id TEXT NOT NULL, port INTEGER NOT NULL, PRIMARY KEY(worker_id))',
+        ],
+        # the original primary key allowed only one predecessor per job
+        3: [
+            'ALTER TABLE predecessors RENAME TO predecessors_old',
+            '''CREATE TABLE predecessors (job_name TEXT NOT NULL, job_version TEXT NOT NULL, predecessor_name TEXT NOT NULL, predecessor_version TEXT NOT NULL,
+                                            PRIMARY KEY(job_name, job_version, predecessor_name, predecessor_version))''',
+            'INSERT INTO predecessors SELECT job_name, job_version, predecessor_name, predecessor_version FROM predecessors_old',
+            'DROP TABLE predecessors_old',
+            'CREATE INDEX IF NOT EXISTS predecessors_predecessor ON predecessors (predecessor_name, predecessor_version)',
+        ],
+    }
+
     # region private
+    def _connect(self):
+        # autocommit mode, transactions are started explicitly by BEGIN IMMEDIATE
+        conn = sqlite3.connect(self._sqlite_db_name, timeout=self._timeout, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
     def _create_new_db(self):
         logger.info('Creating new database for job runner.')
-        self._conn = sqlite3.connect(self._sqlite_db_name)
+        self._conn = self._connect()
         with closing(self._conn.cursor()) as cursor:
-            cursor.execute('''CREATE TABLE predecessors (job_name TEXT NOT NULL, job_version TEXT NOT NULL, predecessor_name TEXT NOT NULL, predecessor_version TEXT NOT NULL, PRIMARY KEY(job_name, job_version))''')
+            cursor.execute('''CREATE TABLE IF NOT EXISTS predecessors (job_name TEXT NOT NULL, job_version TEXT NOT NULL, predecessor_name TEXT NOT NULL, predecessor_version TEXT NOT NULL, PRIMARY KEY(job_name, job_version))''')
             cursor.execute(
-                '''CREATE TABLE jobs (job_name TEXT NOT NULL, job_version TEXT NOT NULL, job_state TEXT NOT NULL, start_time TIMESTAMP,
+                '''CREATE TABLE IF NOT EXISTS jobs (job_name TEXT NOT NULL, job_version TEXT NOT NULL, job_state TEXT NOT NULL, start_time TIMESTAMP,
                                             end_time TIMESTAMP, error_message TEXT, stack_trace TEXT, insert_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
                                             unfinished_pred_jobs INTEGER, user TEXT NOT NULL, PRIMARY KEY(job_name, job_version))''')
             self._conn.commit()
-        
+
+    def _migrate_schema(self):
+        """Brings the schema of the sqlite db up to date
+
+        The schema version is stored in the user_version of the db. Older dbs get the worker and lease columns, the
+        index used to select the next waiting job, the table of workers to be notified and a predecessors table allowing
+        several predecessors per job.
+        """
+        with closing(self._conn.cursor()) as cursor:
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                schema_version = cursor.execute('PRAGMA user_version').fetchone()[0]
+                if schema_version < SQLiteJobRunner._SCHEMA_VERSION:
+                    logger.info('Migrating job runner db from schema version ' + str(schema_version) +
+                                ' to ' + str(SQLiteJobRunner._SCHEMA_VERSION))
+                    for version in range(schema_version + 1, SQLiteJobRunner._SCHEMA_VERSION + 1):
+                        for statement in SQLiteJobRunner._MIGRATION_STATEMENTS[version]:
+                            cursor.execute(statement)
+                    cursor.execute('PRAGMA user_version = ' + str(SQLiteJobRunner._SCHEMA_VERSION))
+                self._conn.commit()
+            except:
+                logger.error('An error occured during migration of the job runner db, rolling back.')
+                self._conn.rollback()
+                raise
+
     def _setup_new(self):
         if not os.path.exists(self._sqlite_db_name):
             self._create_new_db()
         else:
-            self._conn = sqlite3.connect(self._sqlite_db_name)
+            self._conn = self._connect()
+        self._migrate_schema()
 
     @staticmethod
     def sqlite_name(name):
         return "'" + name + "'"
 
+    def _register_worker(self):
+        """Open the wakeup socket of this worker and register it in the db
+        """
+        if self._wakeup_socket is not None:
+            return
+        self._wakeup_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._wakeup_socket.bind(('127.0.0.1', 0))
+        self._wakeup_socket.setblocking(False)
+        self._conn.execute('insert or replace into workers (worker_id, port) values (?, ?)',
+                           (self._id, self._wakeup_socket.getsockname()[1]))
+
+    def _notify_workers(self):
+        """Wake up all registered workers
+        """
+        ports = [row[0] for row in self._conn.execute('select port from workers')]
+        if len(ports) == 0:
+            return
+        with closing(socket.socket(socket.AF_INET, socket.SOCK_DGRAM)) as sock:
+            for port in ports:
+                try:
+                    sock.sendto(b'\0', ('127.0.0.1', port))
+                except OSError as e:
+                    logger.debug('Could not notify worker on port ' + str(port) + ': ' + str(e))
+
+    def _wait_for_notification(self, timeout):
+        """Wait until a notification is received or the timeout is reached
+
+        Args:
+            timeout (float): time in seconds to wait at most
+
+        Returns:
+            bool -- True if a notification has been received, False otherwise
+        """
+        if self._wakeup_socket is None:
+            time.sleep(timeout)
+            return False
+        ready, _, _ = select.select([self._wakeup_socket], [], [], timeout)
+        if len(ready) == 0:
+            return False
+        # drain all pending notifications, one claim handles all of them
+        try:
+            while True:
+                self._wakeup_socket.recv(16)
+        except OSError:
+            pass
+        return True
+
+    def _claim_job(self):
+        """Claim the latest waiting job for this worker
+
+        Jobs whose lease has expired are put back into the waiting state before. Selecting and updating the job is done
+        within one immediate transaction so that no other worker can claim the same job.
+
+        Returns:
+            tuple -- name and version of the claimed job or None if there is no waiting job
+        """
+        now = time.time()
+        with closing(self._conn.cursor()) as cursor:
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.execute('update jobs set job_state = ?, start_time = NULL, worker_id = NULL, lease_expiry = NULL'
+                               ' where job_state = ? and lease_expiry < ?', (JobState.WAITING.value, JobState.RUNNING.value, now))
+                if cursor.rowcount > 0:
+                    logger.warning('Reclaimed ' + str(cursor.rowcount) + ' job(s) with expired lease.')
+                cursor.execute('select job_name, job_version from jobs where job_state = ? order by insert_time desc limit 1',
+                               (JobState.WAITING.value,))
+                row = cursor.fetchone()
+                if row is not None:
+                    cursor.execute('update jobs set start_time = ?, job_state = ?, worker_id = ?, lease_expiry = ?'
+                                   ' where job_name = ? and job_version = ?',
+                                   (str(datetime.datetime.now()), JobState.RUNNING.value, self._id, now + self._lease_time, row[0], row[1]))
+                self._conn.commit()
+            except:
+                self._conn.rollback()
+                raise
+        return row
+
+    def _renew_lease(self, job_name, job_version, stop):
+        """Renew the lease of a running job until stop is set
+
+        Args:
+            job_name (str): name of job
+            job_version (str): version of job
+            stop (threading.Event): event signaling that the job has finished
+        """
+        conn = self._connect()
+        try:
+            while not stop.wait(self._lease_time / 3.0):
+                with conn:
+                    conn.execute('update jobs set lease_expiry = ? where job_name = ? and job_version = ? and worker_id = ? and job_state = ?',
+                                 (time.time() + self._lease_time, job_name, job_version, self._id, JobState.RUNNING.value))
+        finally:
+            conn.close()
+
     def _set_finished(self, job_name, job_version, error_message='', stack_trace=''):
         '''Set the job finished
 
-            It sets the job to finished and removes predecessor conditions respectively
+            It sets the job to finished and removes predecessor conditions respectively. If the job is no longer leased by
+            this worker (since the lease expired and the job has been reclaimed), nothing is changed.
         Args:
             job_name (str): name of job
             job_version (str): version of job
@@ -159,32 +809,33 @@ class SQLiteJobRunner(JobRunnerBase):
         successfull = True
         if error_message != '' or stack_trace != '':
             successfull = False
-        # first update jobs waiting for the job to be finished
+        job_state = JobState.SUCCESSFULLY_FINISHED.value
+        if not successfull:
+            job_state = JobState.FAILED.value
         with closing(self._conn.cursor()) as cursor:
-            if successfull:
-                candidates = []
-                for row in cursor.execute("select job_name, job_version from predecessors where predecessor_name = '"
-                                        + job_name + "'" + " and predecessor_version = '" + job_version + "'"):
-                    candidates.append((row[0], row[1]))
-                cursor.execute( "delete from predecessors where predecessor_name = '"
-                            + job_name + "'" + " and predecessor_version = '" + job_version + "'")
-                self._conn.commit()
-                for c in candidates:
-                    cursor.execute("update jobs SET unfinished_pred_jobs=unfinished_pred_jobs-1  where job_name='" +
-                                c[0] + "' and job_version='" + c[1] + "'")
-                    self._conn.commit()
-                    cursor.execute("update jobs SET job_state='" + JobState.WAITING.value + "' where job_name='" +
-                                c[0] + "' and job_version='" + c[1] + "' and unfinished_pred_jobs <= 0")
-                    self._conn.commit()
-                cursor.execute("update jobs SET job_state='" + JobState.SUCCESSFULLY_FINISHED.value + "', end_time='" + str(datetime.datetime.now())
-                            + "' where job_name = '" + job_name + "' and job_version = '" + job_version + "'")
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.execute('update jobs set job_state = ?, error_message = ?, stack_trace = ?, end_time = ?, lease_expiry = NULL'
+                               ' where job_name = ? and job_version = ? and worker_id = ? and job_state = ?',
+                               (job_state, error_message, stack_trace, str(datetime.datetime.now()),
+                                job_name, str(job_version), self._id, JobState.RUNNING.value))
+                if cursor.rowcount == 0:
+                    logger.warning('Job ' + job_name + ', version ' + str(job_version) + ' is no longer leased by worker ' + self._id +
+                                   ', result is discarded.')
+                elif successfull:
+                    # update all jobs waiting for the job to be finished at once
+                    cursor.execute('update jobs set unfinished_pred_jobs = unfinished_pred_jobs - 1,'
+                                   ' job_state = case when unfinished_pred_jobs <= 1 and job_state = ? then ? else job_state end'
+                                   ' where (job_name, job_version) in (select job_name, job_version from predecessors'
+                                   ' where predecessor_name = ? and predecessor_version = ?)',
+                                   (JobState.WAITING_PRED.value, JobState.WAITING.value, job_name, str(job_version)))
+                    cursor.execute('delete from predecessors where predecessor_name = ? and predecessor_version = ?',
+                                   (job_name, str(job_version)))
                 self._conn.commit()
-            else:
-                cursor.execute("update jobs SET job_state='" + JobState.FAILED.value + "', error_message='" + error_message.replace("'", "") + "', stack_trace='" + stack_trace.replace("'", "") + "', end_time='"
-                            + str(datetime.datetime.now()) + "' where job_name = '" +
-                            job_name + "' and job_version = '" + str(job_version) + "'")
-                self._conn.commit()
-        
+            except:
+                self._conn.rollback()
+                raise
+        self._notify_workers()
 
     def _run_job(self, job_name, job_version):
         job = self._repo.get(job_name, version=job_version)
@@ -197,92 +848,113 @@ class SQLiteJobRunner(JobRunnerBase):
 
     # endregion
 
-    def __init__(self, sqlite_db_name, repo, sleep = 1, steps_to_heartbeat = 30):
+    def __init__(self, sqlite_db_name, repo, sleep = 1, steps_to_heartbeat = 30, worker_id = None, lease_time = 60.0, timeout = 30.0,
+                 write_lock_timeout = 600.0):
         '''Contructor
 
         Args:
             sqlite_db_name (str): filename of sqlite database used
+            repo (MLRepo): repository the jobs belong to
+            sleep (int, optional): Defaults to 1. Time in seconds to wait before new request for open jobs to db if no
+                notification is received.
+            steps_to_heartbeat (int, optional): Defaults to 30. Time in seconds between heartbeat log messages of an idle runner.
+            worker_id (str, optional): Defaults to None. Id of the worker, if None a new uuid is used.
+            lease_time (float, optional): Defaults to 60.0. Time in seconds a claimed job is leased to the worker, the lease
+                is renewed by a heartbeat while the job is running.
+            timeout (float, optional): Defaults to 30.0. Time in seconds to wait for a lock on the database.
+            write_lock_timeout (float, optional): Defaults to 600.0. Time in seconds to wait for the lock serializing the writes to the repo.
         '''
         self._sqlite_db_name = sqlite_db_name
+        self._timeout = timeout
         self._setup_new()
         self._sleep = sleep  # time to wait in sec before new request for open jobs to db
         self._steps_to_heartbeat = steps_to_heartbeat
+        self._lease_time = lease_time
+        self._write_lock = _SQLiteWriteLock(sqlite_db_name + '.write_lock', write_lock_timeout)
         self._repo = repo
-        self._id = str(uuid.uuid1())
+        self._repo._set_write_lock(self._write_lock)
+        self._id = worker_id
+        if self._id is None:
+            self._id = str(uuid.uuid1())
+        self._wakeup_socket = None
         self._conn.set_trace_callback(logger_sql.info)
 
     def set_repo(self, repo):
         self._repo = repo
+        self._repo._set_write_lock(self._write_lock)
 
     def add(self, job_name, job_version, user):
+        """Add a job to the queue
+
+        Only predecessors which are contained in the queue and have not yet been finished successfully are taken into account.
+        The predecessor conditions and the job are inserted within one transaction.
+
+        Args:
+            job_name (str): name of job
+            job_version (str): version of job
+            user (str): user adding the job
+        """
+        job = self._repo.get(job_name, version=job_version)
+        job_name = job.repo_info[RepoInfoKey.NAME]
+        job_version = str(job.repo_info[RepoInfoKey.VERSION])
         with closing(self._conn.cursor()) as cursor:
-            job = self._repo.get(job_name, version=job_version)
-            predecessors = job.get_predecessor_jobs()
-            for predecessor in predecessors:
-                cursor.execute("insert into predecessors (job_name, job_version, predecessor_name, predecessor_version) VALUES ("
-                            + SQLiteJobRunner.sqlite_name(job_name) +
-                            ", "
-                            + SQLiteJobRunner.sqlite_name(str(job_version)) +
-                            ","
-                            + SQLiteJobRunner.sqlite_name(predecessor[0]) +
-                            ","
-                            + SQLiteJobRunner.sqlite_name(str(predecessor[1])) +
-                            ")")
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.executemany('insert or ignore into predecessors (job_name, job_version, predecessor_name, predecessor_version)'
+                                   ' select ?, ?, job_name, job_version from jobs where job_name = ? and job_version = ? and job_state != ?',
+                                   [(job_name, job_version, predecessor[0], str(predecessor[1]), JobState.SUCCESSFULLY_FINISHED.value)
+                                    for predecessor in job.get_predecessor_jobs()])
+                unfinished_pred_jobs = cursor.execute('select count(*) from predecessors where job_name = ? and job_version = ?',
+                                                      (job_name, job_version)).fetchone()[0]
+                job_state = JobState.WAITING.value
+                if unfinished_pred_jobs > 0:
+                    job_state = JobState.WAITING_PRED.value
+                cursor.execute('insert into jobs (job_name, job_version, job_state, unfinished_pred_jobs, user) values (?, ?, ?, ?, ?)',
+                               (job_name, job_version, job_state, unfinished_pred_jobs, user))
                 self._conn.commit()
-            job_state = JobState.WAITING.value
-            if len(predecessors) > 0:
-                job_state = JobState.WAITING_PRED.value
-            cursor.execute("insert into jobs ( job_name, job_version, job_state,  unfinished_pred_jobs, user ) VALUES ("
-                        + SQLiteJobRunner.sqlite_name(job.repo_info[RepoInfoKey.NAME]) +
-                        ", "
-                        + SQLiteJobRunner.sqlite_name(str(job.repo_info[RepoInfoKey.VERSION])) +
-                        ",'"
-                        + job_state +
-                        "',"
-                        + str(len(predecessors)) +
-                        ", '" + user + "')")
-            self._conn.commit()
+            except:
+                self._conn.rollback()
+                raise
+        self._notify_workers()
 
     def run(self, max_steps=None):
         wait = self._sleep
         step = 0
-        with closing(self._conn.cursor()) as cursor: 
-            while True:
-                if max_steps is not None:
-                    step += 1
-                    if step > max_steps:
-                        return
-                if wait > self._steps_to_heartbeat:
-                    logger.info('heartbeat')
-                    wait = 0
-                row = None
-                with self._conn:
-                    cursor.execute("select job_name, job_version from jobs where job_state = '"
-                                        + JobState.WAITING.value + "' order by insert_time desc")
-                    row = cursor.fetchone()
-                    if row is not None:
-                        cursor.execute("update jobs SET start_time = '" + str(
-                            datetime.datetime.now()) + "', job_state='" + JobState.RUNNING.value + "' where job_name = '"
-                            + row[0] + "' and job_version='" + row[1] + "'")
-                        self._conn.commit()
-                    
-                #logger.error('len(rows): ' + str(len(rows)))
-                if row is not None:
-                    logger.info('Start running job ' +
-                                row[0] + ', version ' + row[1])
+        self._register_worker()
+        while True:
+            if max_steps is not None:
+                step += 1
+                if step > max_steps:
+                    return
+            if wait > self._steps_to_heartbeat:
+                logger.info('heartbeat')
+                wait = 0
+            row = self._claim_job()
+
+            #logger.error('len(rows): ' + str(len(rows)))
+            if row is not None:
+                logger.info('Start running job ' +
+                            row[0] + ', version ' + row[1])
+                stop = threading.Event()
+                heartbeat = threading.Thread(target=self._renew_lease, args=(row[0], row[1], stop), daemon=True)
+                heartbeat.start()
+                try:
                     error, stack_trace = self._run_job(row[0], row[1])
-                    self._set_finished(row[0], row[1], error, stack_trace)
-                    if error == '' and stack_trace == '':
-                        logger.info('Finished running job ' +
-                                    row[0] + ', version ' + row[1] + ' successfully.')
-                    else:
-                        logger.error('Finished running job ' + row[0] + ', version ' +
-                                    row[1] + ' with errors: ' + error + '   stacktrace: ' + stack_trace)
-                    wait = 0
+                finally:
+                    stop.set()
+                    heartbeat.join()
+                self._set_finished(row[0], row[1], error, stack_trace)
+                if error == '' and stack_trace == '':
+                    logger.info('Finished running job ' +
+                                row[0] + ', version ' + row[1] + ' successfully.')
                 else:
-                    time.sleep(self._sleep)
-                    wait += self._sleep
-        
+                    logger.error('Finished running job ' + row[0] + ', version ' +
+                                row[1] + ' with errors: ' + error + '   stacktrace: ' + stack_trace)
+                wait = 0
+            else:
+                self._wait_for_notification(self._sleep)
+                wait += self._sleep
+
     def get_info(self, job_name, job_version):
         result = {}
         with closing(self._conn.cursor()) as cursor:
@@ -312,4 +984,9 @@ class SQLiteJobRunner(JobRunnerBase):
     def close_connection(self):
         """Closes the database connection
         """
+        if self._wakeup_socket is not None:
+            self._conn.execute('delete from workers where worker_id = ?', (self._id,))
+            self._wakeup_socket.close()
+            self._wakeup_socket = None
         self._conn.close()
+        self._write_lock.close()
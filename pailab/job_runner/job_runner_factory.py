@@ -2,7 +2,7 @@ class JobRunnerFactory:
 
     @staticmethod
     def get_job_runners():
-        return ['simple', 'sqlite']
+        return ['simple', 'sqlite', 'process_pool', 'asyncio']
 
     @staticmethod
     def get(job_runner_type, repo, **kwargs):
@@ -12,5 +12,11 @@ class JobRunnerFactory:
         elif job_runner_type == 'sqlite':
             from pailab.job_runner.job_runner import SQLiteJobRunner
             return SQLiteJobRunner(repo=repo, **kwargs)
+        elif job_runner_type == 'process_pool':
+            from pailab.job_runner.job_runner import ProcessPoolJobRunner
+            return ProcessPoolJobRunner(repo=repo, **kwargs)
+        elif job_runner_type == 'asyncio':
+            from pailab.job_runner.job_runner import AsyncJobRunner
+            return AsyncJobRunner(repo=repo, **kwargs)
         raise Exception('Cannot create JobRunner: Unknown JobRunner type ' + job_runner_type +
                         '. Use only types from the list returned by JobRunnerFactory.get_job_runners().')
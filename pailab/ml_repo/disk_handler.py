@@ -1,13 +1,15 @@
 
 
 import os
+import bisect
+import json
 from contextlib import closing
 import sqlite3
 from datetime import datetime, timedelta
 
 import pathlib
 import pailab.ml_repo.repo_objects as repo_objects
-from pailab.ml_repo.repo_store import RepoInfoKey, _time_from_version
+from pailab.ml_repo.repo_store import RepoInfoKey, _time_from_version, _version_key, _project, FIRST_VERSION, LAST_VERSION
 import pailab.ml_repo.repo as repo
 from pailab.ml_repo.repo_store import RepoStore
 from shutil import copy
@@ -31,6 +33,47 @@ class RepoObjectDiskStorage(RepoStore):
 
     # endregion
 
+    # region sql schema
+    _SCHEMA_VERSION = 4
+    _STATEMENT_CACHE_SIZE = 256
+    # statements to migrate the db to the respective schema version
+    _MIGRATION_STATEMENTS = {
+        # the indexes cover the lookups of _get, get_latest_version, get_first_version, get_version and get_names
+        1: [
+            'CREATE INDEX IF NOT EXISTS versions_name_time ON versions (name, uuid_time, version)',
+            'CREATE INDEX IF NOT EXISTS modification_info_modifier_version ON modification_info (name, modifier, modifier_version, version)',
+            'CREATE INDEX IF NOT EXISTS modification_info_modifier_time ON modification_info (name, modifier, modifier_uuid_time, version)',
+            'CREATE INDEX IF NOT EXISTS mapping_category ON mapping (category, name)',
+        ],
+        # repo_info columns so that history queries do not need to load the object files
+        2: [
+            'ALTER TABLE versions ADD COLUMN classname TEXT',
+            'ALTER TABLE versions ADD COLUMN description TEXT',
+            'ALTER TABLE versions ADD COLUMN commit_message TEXT',
+            'ALTER TABLE versions ADD COLUMN author TEXT',
+            'ALTER TABLE versions ADD COLUMN commit_date TEXT',
+        ],
+        # integer version keys (see repo_store._version_key) so that version intervals are index range scans on integers,
+        # the keys of existing rows are filled by _fill_version_keys
+        3: [
+            'ALTER TABLE versions ADD COLUMN version_key INTEGER',
+            'ALTER TABLE modification_info ADD COLUMN modifier_version_key INTEGER',
+            'CREATE INDEX IF NOT EXISTS versions_name_key ON versions (name, version_key, version)',
+            'CREATE INDEX IF NOT EXISTS modification_info_modifier_key ON modification_info (name, modifier, modifier_version_key, version)',
+        ],
+        # json encoded state member of the objects (e.g. the state of jobs), NULL for rows written before the migration
+        4: [
+            'ALTER TABLE versions ADD COLUMN state TEXT',
+        ],
+    }
+    # repo_info fields which are stored in the db (category is taken from the mapping table)
+    _REPO_INFO_COLUMNS = ['classname', 'description',
+                          'commit_message', 'author', 'commit_date']
+    _REPO_INFO_SQL_FIELDS = set(
+        ['name', 'version', 'category'] + _REPO_INFO_COLUMNS)
+
+    # endregion
+
     def _sqlite_db_name(self):
         """ return the sqlite db path and file name
         
@@ -40,11 +83,25 @@ class RepoObjectDiskStorage(RepoStore):
 
         return self._main_dir + '/.version.sqlite'
 
+    def _connect(self):
+        """ Open a connection to the sqlite db
+
+        The connection keeps a cache of prepared statements so that the parameterized queries of this class are parsed and planned only once.
+
+        Returns:
+            sqlite3.Connection -- the connection
+        """
+
+        conn = sqlite3.connect(self._sqlite_db_name(),
+                               cached_statements=RepoObjectDiskStorage._STATEMENT_CACHE_SIZE)
+        conn.set_trace_callback(logger_sql.info)
+        return conn
+
     def _create_new_db(self):
         """ Creates a new sqlite db
         """
 
-        self._conn = sqlite3.connect(self._sqlite_db_name())
+        self._conn = self._connect()
         # three tables: one with category->name mapping, one with category, version, and one with modification info
         # mapping
         with closing(self._conn.cursor()) as cursor:
@@ -65,7 +122,60 @@ class RepoObjectDiskStorage(RepoStore):
                 logger.error(
                     'An error occured during creation of new db, rolling back.')
                 self._conn.rollback()
-        
+
+    def _migrate_schema(self):
+        """ Brings the schema of the sqlite db up to date
+
+        The schema version is stored in the user_version of the db. Older dbs (also those pulled from a remote) get the
+        secondary indexes used by the queries of this class and the repo_info columns of the versions table. Rows written before
+        the migration have NULL repo_info columns, for those rows the repo_info is read from the object files. The integer version keys
+        of rows written before the migration are computed from their versions.
+        """
+
+        with closing(self._conn.cursor()) as cursor:
+            schema_version = cursor.execute('PRAGMA user_version').fetchone()[0]
+            if schema_version >= RepoObjectDiskStorage._SCHEMA_VERSION:
+                return
+            try:
+                logger.info('Migrating sqlite db from schema version ' + str(schema_version) +
+                            ' to ' + str(RepoObjectDiskStorage._SCHEMA_VERSION))
+                for version in range(schema_version + 1, RepoObjectDiskStorage._SCHEMA_VERSION + 1):
+                    for statement in RepoObjectDiskStorage._MIGRATION_STATEMENTS[version]:
+                        cursor.execute(statement)
+                if schema_version < 3:
+                    RepoObjectDiskStorage._fill_version_keys(cursor)
+                cursor.execute('PRAGMA user_version = ' +
+                               str(RepoObjectDiskStorage._SCHEMA_VERSION))
+                self._conn.commit()
+            except:
+                logger.error(
+                    'An error occured during migration of the db, rolling back.')
+                self._conn.rollback()
+                raise
+
+    @staticmethod
+    def _fill_version_keys(cursor):
+        """ Fill the integer version keys of all rows written without keys
+
+        Args:
+            cursor (sqlite3.Cursor): the cursor used to update the rows
+        """
+
+        def key(version):
+            try:
+                return _version_key(version)
+            except ValueError:
+                return None
+
+        rows = cursor.execute(
+            'select name, version from versions where version_key is null').fetchall()
+        cursor.executemany('update versions set version_key = ? where name = ? and version = ?',
+                           [(key(version), name, version) for name, version in rows])
+        rows = cursor.execute(
+            'select distinct modifier_version from modification_info where modifier_version_key is null').fetchall()
+        cursor.executemany('update modification_info set modifier_version_key = ? where modifier_version = ?',
+                           [(key(row[0]), row[0]) for row in rows])
+
     def _setup_new(self):
         """ Setup of the handler
         """
@@ -75,8 +185,45 @@ class RepoObjectDiskStorage(RepoStore):
         if not os.path.exists(self._sqlite_db_name()):
             self._create_new_db()
         else:
-            self._conn = sqlite3.connect(self._sqlite_db_name())
-        self._conn.set_trace_callback(logger_sql.info)
+            self._conn = self._connect()
+        self._migrate_schema()
+        self._reset_version_index()
+
+    def _reset_version_index(self):
+        """ Clears the in-memory version index
+        """
+
+        # maps each object name to the list of (version_key, version) tuples of all its versions, ordered by version_key
+        self._version_index = {}
+        self._data_version = None
+
+    def _refresh_version_index(self):
+        """ Clears the version index if the db has been changed by another connection (e.g. a job runner in another process)
+        """
+
+        with closing(self._conn.cursor()) as cursor:
+            data_version = cursor.execute('PRAGMA data_version').fetchone()[0]
+        if data_version != self._data_version:
+            self._version_index = {}
+            self._data_version = data_version
+
+    def _get_version_list(self, name):
+        """ Return the versions of an object from the version index, the versions are read from the db if the object is not yet indexed
+        
+        Args:
+            name (str):identifier of the object
+        
+        Returns:
+            list of tuple -- list of (version_key, version) tuples ordered by version_key
+        """
+
+        versions = self._version_index.get(name)
+        if versions is None:
+            with closing(self._conn.cursor()) as cursor:
+                versions = cursor.execute(
+                    'select version_key, version from versions where name = ? order by version_key ASC', (name,)).fetchall()
+            self._version_index[name] = versions
+        return versions
     # endregion
 
     def __init__(self, folder, file_format='pickle'):
@@ -101,8 +248,10 @@ class RepoObjectDiskStorage(RepoStore):
             import pickle
 
             def __pickle_save(file_prefix, obj):
-                with open(file_prefix + '.pck', 'wb') as f:
+                # write to a temporary file first so that readers never see a partially written object
+                with open(file_prefix + '.pck.tmp', 'wb') as f:
                     pickle.dump(obj, f)
+                os.replace(file_prefix + '.pck.tmp', file_prefix + '.pck')
 
             def __pickle_load(file_prefix):
                 with open(file_prefix+'.pck', 'rb') as f:
@@ -140,9 +289,11 @@ class RepoObjectDiskStorage(RepoStore):
                     return json.load(f, cls=CustomDecoder)
 
             def __json_save(file_prefix, obj):
-                with open(file_prefix + '.json', 'w') as f:
+                # write to a temporary file first so that readers never see a partially written object
+                with open(file_prefix + '.json.tmp', 'w') as f:
                     json.dump(obj, f, cls=CustomEncoder,
                               indent=4, separators=(',', ': '))
+                os.replace(file_prefix + '.json.tmp', file_prefix + '.json')
 
             self._save_function = __json_save
             self._load_function = __json_load
@@ -161,25 +312,21 @@ class RepoObjectDiskStorage(RepoStore):
             Exception: an exception is raised if the object does not exists
         """
 
-        condition = " where name='"+  name + "' and version='" + version + "'"
-        delete_statement = "delete from modification_info " + condition
         with closing(self._conn.cursor()) as cursor:
-            cursor.execute(delete_statement)
-            select_statement = "select path, file from versions " + condition
+            cursor.execute('delete from modification_info where name = ? and version = ?', (name, version))
             files = [row[0] + '/' + row[1]
-                    for row in cursor.execute(select_statement)]
+                    for row in cursor.execute('select path, file from versions where name = ? and version = ?', (name, version))]
             if len(files) == 0:
                 raise Exception('Deletion failed: Object ' + name + " with version " + version +' does not exist.')
             for filename in files:
                 os.remove(self._main_dir + '/' + filename + self._extension)
-            delete_statement = "delete from versions " + condition
-            cursor.execute(delete_statement)
+            cursor.execute('delete from versions where name = ? and version = ?', (name, version))
+            if name in self._version_index:
+                self._version_index[name] = [
+                    v for v in self._version_index[name] if v[1] != version]
             #if there is no object with this name anymore, we have to remove it from mapping
-            select_statement = "select path, file from versions where name='"+  name + "'"
-            depp = [0 for r in cursor.execute(select_statement)]
-            if len(depp) == 0:
-                delete_statement = "delete from mapping where name='" + name + "'"
-                cursor.execute(delete_statement)        
+            if cursor.execute('select 1 from versions where name = ? LIMIT 1', (name,)).fetchone() is None:
+                cursor.execute('delete from mapping where name = ?', (name,))
             self._conn.commit()
         
     def get_config(self):
@@ -201,97 +348,227 @@ class RepoObjectDiskStorage(RepoStore):
             list of str -- a list of all objects in the category
         """
         with closing(self._conn.cursor()) as cursor: 
-            result = []
-            for row in cursor.execute("select name, category from  mapping where category = '" + ml_obj_type + "'"):
-                result.append(row[0])
-            return result
+            return [row[0] for row in cursor.execute('select name from mapping where category = ?', (ml_obj_type,))]
 
-    def _add(self, obj):
-        """Add an object to the storage.
+    @staticmethod
+    def _modification_info_rows(name, version, modification_info):
+        """ Returns the rows of the modification_info table for an object
+        
+        Args:
+            name (str):identifier of the object
+            version (str):version of the object
+            modification_info (dict):dictionary of modifier names and modifier versions
+        
+        Returns:
+            list of tuple -- the rows to be inserted
+        """
+
+        return [(name, version, k, str(v), str(_time_from_version(v)), _version_key(v)) for k, v in modification_info.items()]
+
+    @staticmethod
+    def _state_column(obj):
+        """ Return the value of the state column of the versions table
 
         Args:
-            obj (RepoObject):repository object
+            obj (dict): the object dictionary
+
+        Returns:
+            str or None -- json encoded dictionary containing the state member of the object (empty if the object has no state) or None if the state cannot be encoded
+        """
+
+        try:
+            return json.dumps({'state': obj['state']} if 'state' in obj else {})
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _repo_info_columns(repo_info):
+        """ Return the values of the repo_info columns of the versions table
+        
+        Args:
+            repo_info (dict): the repo_info of the object
+        
+        Returns:
+            tuple -- the values in the order of _REPO_INFO_COLUMNS
+        """
+
+        result = []
+        for k in RepoObjectDiskStorage._REPO_INFO_COLUMNS:
+            v = repo_info.get(k)
+            result.append(None if v is None else str(v))
+        return tuple(result)
+
+    def _write_objects(self, objs, replace_objs=None):
+        """ Write a list of objects to the storage.
+
+        All rows (mapping, versions and modification info) of the new and the replaced objects are written within one transaction, 
+        the object files are written after the transaction has been committed.
+
+        Args:
+            objs (list of RepoObject):list of repository objects
+            replace_objs (list of RepoObject):list of existing repository objects which are overwritten without incrementing the version. Defaults to None.
 
         Raises:
-            Exception if an object with same name already exists.
+            Exception: raises the exception of the database if the transaction has been rolled back
         """
+        if replace_objs is None:
+            replace_objs = []
+        mapping_rows = []
+        version_rows = []
+        modification_info_rows = []
+        files = []
+        for obj in objs:
+            version_key = _version_key(
+                obj['repo_info'][repo_objects.RepoInfoKey.VERSION.value])
+            uid_time = _time_from_version(
+                obj['repo_info'][repo_objects.RepoInfoKey.VERSION.value])
+            name = obj['repo_info'][repo_objects.RepoInfoKey.NAME.value]
+            if isinstance(obj['repo_info'][repo_objects.RepoInfoKey.CATEGORY.value], repo.MLObjectType):
+                category = obj['repo_info'][repo_objects.RepoInfoKey.CATEGORY.value].name
+            else:
+                category = obj['repo_info'][repo_objects.RepoInfoKey.CATEGORY.value]
+            version = obj['repo_info'][repo_objects.RepoInfoKey.VERSION.value]
+            file_sub_dir = category + '/' + name + '/'
+            filename = version
+            mapping_rows.append((name, category))
+            version_rows.append((name, version, file_sub_dir, filename, str(uid_time), version_key) +
+                                RepoObjectDiskStorage._repo_info_columns(obj['repo_info']) + (RepoObjectDiskStorage._state_column(obj),))
+            if repo_objects.RepoInfoKey.MODIFICATION_INFO.value in obj['repo_info']:
+                modification_info_rows.extend(RepoObjectDiskStorage._modification_info_rows(name, version,
+                                                                                            obj['repo_info'][repo_objects.RepoInfoKey.MODIFICATION_INFO.value]))
+            files.append((file_sub_dir, filename, obj))
         with self._conn:
             with closing(self._conn.cursor()) as cursor:    
                 try:
-                    uid_time = _time_from_version(
-                        obj['repo_info'][repo_objects.RepoInfoKey.VERSION.value])
-                    name = obj['repo_info'][repo_objects.RepoInfoKey.NAME.value]
-                    if isinstance(obj['repo_info'][repo_objects.RepoInfoKey.CATEGORY.value], repo.MLObjectType):
-                        category = obj['repo_info'][repo_objects.RepoInfoKey.CATEGORY.value].name
-                    else:
-                        category = obj['repo_info'][repo_objects.RepoInfoKey.CATEGORY.value]
-                    exists = False
-                    # region write mapping
-                    for row in cursor.execute('select * from mapping where name = ' + "'" + name + "'"):
-                        exists = True
-                        break
-                    if not exists:
-                        cursor.execute(
-                                "insert into mapping (name, category) VALUES ('" + name + "', '" + category + "')")
-                    # endregion
-                    # region write file info
-                    version = obj['repo_info'][repo_objects.RepoInfoKey.VERSION.value]
-                    file_sub_dir = category + '/' + name + '/'
-                    os.makedirs(self._main_dir + '/' + file_sub_dir, exist_ok=True)
-                    filename = version
-                    cursor.execute("insert into versions (name, version, path, file, uuid_time) VALUES('" +
-                            name + "', '" + version + "','" + file_sub_dir + "','" + filename + "','" + str(uid_time) + "')")
-                    # endregion
-                    # region write modification info
-                    if repo_objects.RepoInfoKey.MODIFICATION_INFO.value in obj['repo_info']:
-                        for k, v in obj['repo_info'][repo_objects.RepoInfoKey.MODIFICATION_INFO.value].items():
-                            tmp = _time_from_version(v)
-                            cursor.execute("insert into modification_info (name, version, modifier, modifier_version, modifier_uuid_time) VALUES ('"
-                                    + name + "','" + version + "','" + k + "','" + str(v) + "','" + str(tmp) + "')")
-                    # endregion
+                    cursor.executemany(
+                        'insert or ignore into mapping (name, category) VALUES (?, ?)', mapping_rows)
+                    cursor.executemany('insert into versions (name, version, path, file, uuid_time, version_key, ' +
+                                       ', '.join(RepoObjectDiskStorage._REPO_INFO_COLUMNS) + ', state) VALUES (' +
+                                       ', '.join(['?']*(7 + len(RepoObjectDiskStorage._REPO_INFO_COLUMNS))) + ')', version_rows)
+                    cursor.executemany('insert into modification_info (name, version, modifier, modifier_version, modifier_uuid_time, modifier_version_key) VALUES (?, ?, ?, ?, ?, ?)',
+                                       modification_info_rows)
+                    for obj in replace_objs:
+                        files.extend(self._replace_rows(cursor, obj))
                     self._conn.commit()
-                    # region write file
-                    logger.debug(
-                        'Write object as json file with filename ' + filename)
-
-                    self._save_function(self._main_dir + '/' +
-                                        file_sub_dir + '/' + filename, obj)
-                    # endregion
                 except Exception as e:
                     logger.error('Error: ' + str(e) + ', rolling back changes.')
                     self._conn.rollback()
+                    raise
+        for name, version, _, _, _, version_key, *_ in version_rows:
+            if name in self._version_index:
+                bisect.insort(self._version_index[name], (version_key, version))
+        for file_sub_dir, filename, obj in files:
+            logger.debug(
+                'Write object as file with filename ' + filename)
+            os.makedirs(self._main_dir + '/' + file_sub_dir, exist_ok=True)
+            self._save_function(self._main_dir + '/' +
+                                file_sub_dir + '/' + filename, obj)
 
-    def get_version_condition(self, name, versions, version_column, time_column):
-        """ returns the condition part of the versions for the sql statement
+    def _add(self, obj):
+        """Add an object to the storage.
+
+        Args:
+            obj (RepoObject):repository object
+
+        Raises:
+            Exception if an object with same name already exists.
+        """
+        self._write_objects([obj])
+
+    def _add_many(self, objs, replace_objs=None):
+        """Add a list of objects to the storage within one transaction.
+
+        Args:
+            objs (list of RepoObject):list of repository objects
+            replace_objs (list of RepoObject):list of existing repository objects which are overwritten within the same transaction. Defaults to None.
+        """
+        self._write_objects(objs, replace_objs)
+
+    def _get_modification_infos(self, names):
+        """ Return the versions and modification infos of all objects with the given names read from the modification_info table.
+
+        Args:
+            names (set of str):names of the objects
+
+        Returns:
+            dict -- dictionary of object names and lists of tuples of version and modification info (ordered by version)
+        """
+
+        names = list(names)
+        result = {}
+        with closing(self._conn.cursor()) as cursor:
+            # stay below the maximal number of parameters of older sqlite versions
+            for i in range(0, len(names), 500):
+                chunk = names[i:i+500]
+                rows = cursor.execute('select m.name, m.version, m.modifier, m.modifier_version from modification_info m'
+                                      ' join versions v on v.name = m.name and v.version = m.version'
+                                      ' where m.name in (' + ', '.join(['?']*len(chunk)) + ') order by v.version_key', chunk)
+                versions = {}
+                for name, version, modifier, modifier_version in rows:
+                    if (name, version) not in versions:
+                        versions[(name, version)] = {}
+                        result.setdefault(name, []).append((version, versions[(name, version)]))
+                    versions[(name, version)][modifier] = modifier_version
+        return result
+
+    def get_states(self, objects):
+        """ Return the state member (e.g. the state of a job) of many objects at once.
+
+        The states are read from the versions table, only objects written before the state column has been added are loaded from disk.
+
+        Args:
+            objects (list of tuple): list of tuples of object name and version
+
+        Returns:
+            list -- for each object the value of its state member or None if the object has no state
+        """
+
+        objects = [(name, str(version)) for name, version in objects]
+        states = {}
+        with closing(self._conn.cursor()) as cursor:
+            # stay below the maximal number of parameters of older sqlite versions
+            for i in range(0, len(objects), 250):
+                chunk = objects[i:i+250]
+                rows = cursor.execute('select name, version, state from versions where (name, version) in (values ' +
+                                      ', '.join(['(?, ?)']*len(chunk)) + ')', [x for obj in chunk for x in obj])
+                for name, version, state in rows:
+                    if state is not None:
+                        states[(name, version)] = json.loads(state).get('state')
+        result = []
+        for name, version in objects:
+            if (name, version) in states:
+                result.append(states[(name, version)])
+            else:
+                result.extend(super(RepoObjectDiskStorage, self).get_states([(name, version)]))
+        return result
+
+    def get_version_condition(self, name, versions, version_column, key_column):
+        """ returns the condition part of the versions for the sql statement together with the parameters to be bound
         
         Args:
             name (str):not used
             versions (str or list of str):a or the versions to condition on
             version_column (str):version column name
-            time_column (str):time column name
+            key_column (str):integer version key column name
         
         Returns:
-            str -- the condition for the versions
+            tuple of str and list -- the condition for the versions and the list of its parameters
         """
 
         version_condition = ''
-        if versions is not None:
-            version_condition = ' and '
+        params = []
         if isinstance(versions, str):
-            version_condition += version_column + " = '" + versions + "'"
-        else:
-            if isinstance(versions, tuple):
-                start_time = _time_from_version(versions[0])
-                end_time = _time_from_version(versions[1])
-                version_condition += "'" + str(
-                    start_time) + "' <= " + time_column + " and " + time_column + "<= '" + str(end_time) + "'"
-            else:
-                if isinstance(versions, list):
-                    version_condition += version_column + ' in ('
-                    tmp = "','"
-                    tmp = tmp.join([v for v in versions])
-                    version_condition += "'" + tmp + "')"
-        return version_condition
+            version_condition = ' and ' + version_column + ' = ?'
+            params.append(versions)
+        elif isinstance(versions, tuple):
+            version_condition = ' and ? <= ' + key_column + ' and ' + key_column + ' <= ?'
+            params.append(_version_key(versions[0]))
+            params.append(_version_key(versions[1]))
+        elif isinstance(versions, list):
+            version_condition = ' and ' + version_column + \
+                ' in (' + ', '.join(['?']*len(versions)) + ')'
+            params.extend(versions)
+        return version_condition, params
 
     def _get(self, name, versions=None, modifier_versions=None, obj_fields=None,  repo_info_fields=None,
              throw_error_not_exist=True, throw_error_not_unique=True):
@@ -307,16 +584,16 @@ class RepoObjectDiskStorage(RepoStore):
                     all versions between the first and last entry (both including) are returned. In addition FIRST_VERSION and LAST_VERSION can be used for versions to access
                     the last/first version.
             modifier_versions (dictionary):modifier ids together with version specs which are matched by the returned object.. Defaults to None.
-            obj_fields (list of strings or string):list of strings identifying the fields which will be returned in the dictionary,
-                                                        if None, no fields are returned, if set to 'all', all fields will be returned . Defaults to None.
-            repo_info_fields (list of strings or string):list of strings identifying the fields of the repo_info dict which will be returned in the dictionary,
-                                                        if None, no fields are returned, if set to 'all', all fields will be returned. Defaults to None.
+            obj_fields (list of strings):list of strings identifying the fields which will be returned in the dictionary,
+                                                        if None, all fields will be returned . Defaults to None.
+            repo_info_fields (list of strings):list of strings identifying the fields of the repo_info dict which will be returned in the dictionary,
+                                                        if None, all fields will be returned. Defaults to None.
+
+        If no member fields and only repo_info fields stored in the db are requested, the objects are not loaded from disk.
         """
 
-        category = None
         with closing(self._conn.cursor()) as cursor:
-            for row in cursor.execute('select category from mapping where name = ' + "'" + name + "'"):
-                category = repo.MLObjectType(row[0])
+            category = cursor.execute('select category from mapping where name = ?', (name,)).fetchone()
             if category is None:
                 if throw_error_not_exist:
                     logger.error('no object ' + name + ' in storage.')
@@ -324,27 +601,69 @@ class RepoObjectDiskStorage(RepoStore):
                 else:
                     return []
 
-            version_condition = self.get_version_condition(
-                name, versions, 'version', 'uuid_time')
-
-            select_statement = "select path, file from versions where name = '" + \
-                name + "'" + version_condition
+            version_condition, params = self.get_version_condition(
+                name, versions, 'version', 'version_key')
+            select_statement = 'select path, file, version, ' + ', '.join(RepoObjectDiskStorage._REPO_INFO_COLUMNS) + \
+                ' from versions where name = ?' + version_condition
+            params = [name] + params
             if modifier_versions is not None:
                 for k, v in modifier_versions.items():
-                    tmp = self.get_version_condition(
-                        k, v, 'modifier_version', 'modifier_uuid_time')
+                    tmp, tmp_params = self.get_version_condition(
+                        k, v, 'modifier_version', 'modifier_version_key')
                     if tmp != '':
-                        select_statement += " and version in ( select version from modification_info where name ='" + \
-                            name + "' and modifier = '" + k + "'" + tmp + ")"
-            files = [row[0] + '/' + row[1]
-                    for row in cursor.execute(select_statement)]
-            objects = []
-            for filename in files:
-                objects.append(self._load_function(
-                    self._main_dir + '/' + filename))
+                        select_statement += ' and version in (select version from modification_info where name = ? and modifier = ?' + tmp + ')'
+                        params += [name, k] + tmp_params
+            rows = cursor.execute(select_statement, params).fetchall()
             self._conn.commit()
+        projected = obj_fields is not None or repo_info_fields is not None
+        from_db = obj_fields is not None and len(obj_fields) == 0 and repo_info_fields is not None and \
+            set(repo_info_fields).issubset(RepoObjectDiskStorage._REPO_INFO_SQL_FIELDS)
+        objects = []
+        for row in rows:
+            # classname is always set for objects written with schema version 2 or higher
+            if from_db and row[3] is not None:
+                values = dict(zip(RepoObjectDiskStorage._REPO_INFO_COLUMNS, row[3:]))
+                values['name'] = name
+                values['version'] = row[2]
+                values['category'] = category[0]
+                objects.append({'repo_info': {k: values[k] for k in repo_info_fields}})
+                continue
+            obj = self._load_function(self._main_dir + '/' + row[0] + '/' + row[1])
+            if projected:
+                obj = _project(obj, obj_fields, repo_info_fields)
+            objects.append(obj)
         return objects
 
+    def _resolve_version(self, name, version, throw_error_not_exist=True):
+        """ Resolve a version placeholder using the version index
+        
+        Args:
+            name (str):identifier of the object
+            version (str or int):FIRST_VERSION, LAST_VERSION or an integer offset
+            throw_error_not_exist (bool):true - throw error if not exists, else return []. Defaults to True.
+        
+        Raises:
+            Exception: Raises an exception if the object does not exists
+        
+        Returns:
+            str -- the version
+        """
+
+        versions = self._get_version_list(name)
+        if len(versions) == 0:
+            if throw_error_not_exist:
+                logger.error('No object with name ' + name + ' exists.')
+                raise Exception('No object with name ' + name + ' exists.')
+            else:
+                return []
+        if version == LAST_VERSION:
+            return versions[-1][1]
+        if version == FIRST_VERSION or version == 0:
+            return versions[0][1]
+        if version > 0:
+            return versions[min(version, len(versions))-1][1]
+        return versions[max(len(versions) + version, 0)][1]
+
     def get_latest_version(self, name, throw_error_not_exist=True):
         """ Determine the latest version of the object
         
@@ -359,15 +678,8 @@ class RepoObjectDiskStorage(RepoStore):
             str -- the latest version string of the object
         """
 
-        with closing(self._conn.cursor()) as cursor:
-            for row in cursor.execute("select version from versions where name = '" + name + "' order by uuid_time DESC LIMIT 1"):
-                result = row[0]
-                return result
-        if throw_error_not_exist:
-            logger.error('No object with name ' + name + ' exists.')
-            raise Exception('No object with name ' + name + ' exists.')
-        else:
-            return []
+        self._refresh_version_index()
+        return self._resolve_version(name, LAST_VERSION, throw_error_not_exist)
 
     def get_first_version(self, name, throw_error_not_exist=True):
         """ Determine the first version of the object
@@ -382,15 +694,9 @@ class RepoObjectDiskStorage(RepoStore):
         Returns:
             str -- the first version string of the object
         """
-        with closing(self._conn.cursor()) as cursor:
-            for row in cursor.execute("select version from versions where name = '" + name + "' order by uuid_time ASC LIMIT 1"):
-                result = row[0]
-                return result
-        if throw_error_not_exist:
-            logger.error('No object with name ' + name + ' exists.')
-            raise Exception('No object with name ' + name + ' exists.')
-        else:
-            return []
+
+        self._refresh_version_index()
+        return self._resolve_version(name, FIRST_VERSION, throw_error_not_exist)
 
     def get_version(self, name, offset, throw_error_not_exist=True):
         """ Return the newest version up to offset versions
@@ -406,28 +712,9 @@ class RepoObjectDiskStorage(RepoStore):
         Returns:
             str -- the version
         """
-        with closing(self._conn.cursor()) as cursor:
-            if offset > 0:
-                inner_select = "(select version, uuid_time from versions where name = '" + \
-                    name + "' order by uuid_time ASC LIMIT " + str(offset) + ")"
-                stmt = "select version from " + inner_select + " order by uuid_time DESC LIMIT 1"
-                for row in cursor.execute(stmt):
-                    result = row[0]
-                    return result
-            elif offset < 0:
-                inner_select = "(select version, uuid_time from versions where name = '" + \
-                    name + "' order by uuid_time DESC LIMIT " + str(-offset) + ")"
-                stmt = "select version from " + inner_select + " order by uuid_time ASC LIMIT 1"
-                for row in cursor.execute(stmt):
-                    result = row[0]
-                    return result
-            if offset == 0:
-                return self.get_first_version(name)
-            if throw_error_not_exist:
-                logger.error('No object with name ' + name + ' exists.')
-                raise Exception('No object with name ' + name + ' exists.')
-            else:
-                return []
+
+        self._refresh_version_index()
+        return self._resolve_version(name, offset, throw_error_not_exist)
 
     def replace(self, obj):
         """ Overwrite existing object without incrementing version
@@ -436,25 +723,40 @@ class RepoObjectDiskStorage(RepoStore):
             obj (RepoObject): repo object to be overwritten
         """
 
-        logger.info('Replacing ' + obj["repo_info"][RepoInfoKey.NAME.value] +
-                    ', version ' + str(obj["repo_info"][RepoInfoKey.VERSION.value]))
-        select_statement = "select path, file from versions where name = '" +\
-            obj["repo_info"][RepoInfoKey.NAME.value] + "' and version = '" +\
-            str(obj["repo_info"][RepoInfoKey.VERSION.value]) + "'"
         with closing(self._conn.cursor()) as cursor:
-            for row in cursor.execute(select_statement):
-                self._save_function(self._main_dir + '/' +
-                                    str(row[0]) + '/' + str(row[1]), obj)
-            # delete all modification infos
-            cursor.execute("delete from modification_info where name='" + obj["repo_info"][RepoInfoKey.NAME.value] + "' and version = '" +
-                    str(obj["repo_info"][RepoInfoKey.VERSION.value]) + "'")
-            if repo_objects.RepoInfoKey.MODIFICATION_INFO.value in obj['repo_info']:
-                for k, v in obj['repo_info'][repo_objects.RepoInfoKey.MODIFICATION_INFO.value].items():
-                    tmp = _time_from_version(v)
-                    cursor.execute("insert into modification_info (name, version, modifier, modifier_version, modifier_uuid_time) VALUES ('"
-                            + obj["repo_info"][RepoInfoKey.NAME.value] + "','" + str(obj["repo_info"][RepoInfoKey.VERSION.value]) + "','" + k + "','" + str(v) + "','" + str(tmp) + "')")
+            files = self._replace_rows(cursor, obj)
             self._conn.commit()
-          
+        for file_sub_dir, filename, obj in files:
+            self._save_function(self._main_dir + '/' +
+                                file_sub_dir + '/' + filename, obj)
+
+    def _replace_rows(self, cursor, obj):
+        """ Update the rows of an existing object without committing the transaction
+
+        Args:
+            cursor (sqlite3.Cursor): the cursor used to update the rows
+            obj (RepoObject): repo object to be overwritten
+
+        Returns:
+            list of tuple -- the directories, filenames and objects of the files to be written
+        """
+
+        name = obj["repo_info"][RepoInfoKey.NAME.value]
+        version = str(obj["repo_info"][RepoInfoKey.VERSION.value])
+        logger.info('Replacing ' + name + ', version ' + version)
+        files = [(str(row[0]), str(row[1]), obj) for row in cursor.execute(
+            'select path, file from versions where name = ? and version = ?', (name, version)).fetchall()]
+        cursor.execute('update versions set ' + ', '.join([k + ' = ?' for k in RepoObjectDiskStorage._REPO_INFO_COLUMNS]) +
+                       ', state = ? where name = ? and version = ?', RepoObjectDiskStorage._repo_info_columns(obj['repo_info']) +
+                       (RepoObjectDiskStorage._state_column(obj), name, version))
+        # delete all modification infos
+        cursor.execute('delete from modification_info where name = ? and version = ?', (name, version))
+        if repo_objects.RepoInfoKey.MODIFICATION_INFO.value in obj['repo_info']:
+            cursor.executemany('insert into modification_info (name, version, modifier, modifier_version, modifier_uuid_time, modifier_version_key) VALUES (?, ?, ?, ?, ?, ?)',
+                               RepoObjectDiskStorage._modification_info_rows(name, version,
+                                                                             obj['repo_info'][repo_objects.RepoInfoKey.MODIFICATION_INFO.value]))
+        return files
+
     def close_connection(self):
         """ Closes the database connection
         """
@@ -1,5 +1,4 @@
 import os
-import sqlite3
 import pickle
 from datetime import datetime, timedelta
 import json
@@ -66,6 +65,22 @@ class RepoObjectGitStorage(RepoObjectDiskStorage):
             message = obj['repo_info']['commit_message']
         self.commit(message)
 
+    def _add_many(self, objs, replace_objs=None):
+        """ Adds a list of objects to the git repository using one git commit
+
+        Args:
+            objs (list of RepoObject): the repo objects to add to git
+            replace_objs (list of RepoObject): existing repo objects which are overwritten within the same commit. Defaults to None.
+        """
+
+        super(RepoObjectGitStorage, self)._add_many(objs, replace_objs)
+        message = 'adding ' + ', '.join([obj['repo_info']['name'] for obj in objs])
+        for obj in objs:
+            if (obj['repo_info']['commit_message'] is not None) and (obj['repo_info']['commit_message'] != ""):
+                message = obj['repo_info']['commit_message']
+                break
+        self.commit(message)
+
     def _delete(self, name, version):
         """ Delete an object from the repo
 
@@ -135,12 +150,12 @@ class RepoObjectGitStorage(RepoObjectDiskStorage):
         """
 
         c = self._conn.cursor()
-        c.execute('ATTACH DATABASE "' + sqlite_db_2 + '" AS db_2')
-        statement = 'INSERT OR IGNORE INTO versions(name, version, file, uuid_time) SELECT name, version, file, uuid_time FROM db_2.versions;'
+        c.execute('ATTACH DATABASE ? AS db_2', (sqlite_db_2,))
+        statement = 'INSERT OR IGNORE INTO versions(name, version, file, uuid_time, version_key) SELECT name, version, file, uuid_time, version_key FROM db_2.versions;'
         c.execute(statement)
         statement = 'INSERT OR IGNORE INTO mapping(name, category) SELECT name, category FROM db_2.mapping;'
         c.execute(statement)
-        statement = 'INSERT OR IGNORE INTO modification_info(name, version, modifier, modifier_version) SELECT name, version, modifier, modifier_version FROM db_2.modification_info;'
+        statement = 'INSERT OR IGNORE INTO modification_info(name, version, modifier, modifier_version, modifier_version_key) SELECT name, version, modifier, modifier_version, modifier_version_key FROM db_2.modification_info;'
         c.execute(statement)
         self._conn.commit()
         c.execute("DETACH DATABASE 'db_2';")
@@ -172,6 +187,8 @@ class RepoObjectGitStorage(RepoObjectDiskStorage):
         except:
             os.rename(self._sqlite_db_name() + '_old', self._sqlite_db_name())
             raise Exception('An error occured during pull: ' + (str(e)))
-        self._conn = sqlite3.connect(self._sqlite_db_name())
+        self._conn = self._connect()
+        self._migrate_schema()
         self._merge_from_db(self._sqlite_db_name() + '_old')
         os.remove(self._sqlite_db_name() + '_old')
+        self._reset_version_index()
@@ -1,25 +1,90 @@
-import datetime
+import bisect
+import pickle
 from copy import deepcopy
 from numpy import concatenate
 import pailab.ml_repo.repo_objects as repo_objects
 import pailab.ml_repo.repo as repo
-from pailab.ml_repo.repo_store import RepoStore, NumpyStore, _time_from_version
+from pailab.ml_repo.repo_store import RepoStore, NumpyStore, _version_key, _project
+from pailab.ml_repo.object_cache import _dumps
 import logging
 logger = logging.getLogger(__name__)
 
 
+class _Snapshot:
+    """ Frozen copy of an object dictionary stored by the RepoObjectMemoryStorage
+
+    The object dictionary is stored as pickled bytes which are decoded on each read, so that the stored object cannot be changed 
+    by the caller and no deepcopy is needed on reads. Objects which cannot be pickled (or restored from their pickled bytes, e.g. objects 
+    with methods bound to the instance, see :py:func:`pailab.ml_repo.object_cache._dumps`) are deep copied instead. The repo_info is kept decoded so that queries on versions, 
+    modifiers and repo_info fields do not need to decode the object.
+    """
+
+    __slots__ = ['version', 'repo_info', 'modification_info', '_data', '_pickled']
+
+    def __init__(self, obj):
+        """ Constructor
+
+        Args:
+            obj (dict): the object dictionary
+        """
+
+        self.repo_info = deepcopy(obj['repo_info'])
+        self.version = self.repo_info[repo_objects.RepoInfoKey.VERSION.value]
+        self.modification_info = self.repo_info.get(
+            repo_objects.RepoInfoKey.MODIFICATION_INFO.value) or {}
+        try:
+            self._data = _dumps(obj)
+            self._pickled = True
+        except Exception:
+            self._data = deepcopy(obj)
+            self._pickled = False
+
+    def get(self):
+        """ Return a new copy of the object dictionary
+
+        Returns:
+            dict -- the object dictionary
+        """
+
+        if self._pickled:
+            return pickle.loads(self._data)
+        return deepcopy(self._data)
+
+
 class RepoObjectMemoryStorage(RepoStore):
     """ The repo object memory storage. 
     This class is used to store repo object (excluding large objects) in the memory.
     The importance of the handler is mostly for testing purposes.
+
+    The versions of each object are kept ordered by their integer version key (see :py:func:`pailab.ml_repo.repo_store._version_key`) 
+    so that version intervals and offsets are resolved by a binary search on the keys. Versions which are not uuids are ordered by 
+    their insertion, i.e. they get the key following the key of the latest version of the object when they are added. The objects are stored as frozen snapshots 
+    (see :py:class:`_Snapshot`) and an inverted index maps the modifier versions to the versions of the objects they modified.
     """
 
     # region private
 
-    def _is_in_versions(self, version, versions):
+    def _get_key(self, name, version):
+        """ Return the integer key of a version of an object
+
+        Args:
+            name (str): the identifier of the object
+            version (str): the version
+
+        Returns:
+            int or None -- the key or None if the version is neither a uuid nor a version of the object added before
+        """
+
+        try:
+            return _version_key(version)
+        except (ValueError, TypeError, AttributeError):
+            return self._custom_keys.get((name, version))
+
+    def _is_in_versions(self, name, version, versions):
         """ Check whether the version exists between the dates of the two versions
 
         Args:
+            name (str): the identifier of the object the version belongs to
             version (str): the version to check whether it is here
             versions (list of str): a list of possible two versions, 
                                 takes the date of the first version as a start date and the second as the end date
@@ -36,23 +101,118 @@ class RepoObjectMemoryStorage(RepoStore):
         if isinstance(v, list):
             return version in v
         if isinstance(v, tuple):
-            if v[0] is None:
-                start_time = datetime.datetime(1980, 1, 1, 0, 0)
-            else:
-                start_time = _time_from_version(v[0])
-            if v[1] is None:
-                end_time = datetime.datetime(2300, 1, 1, 0, 0)
-            else:
-                end_time = _time_from_version(v[1])
-            time = _time_from_version(version)
-            return (time >= start_time) and (time <= end_time)
+            key = self._get_key(name, version)
+            start = None if v[0] is None else self._get_key(name, v[0])
+            end = None if v[1] is None else self._get_key(name, v[1])
+            if key is None or (v[0] is not None and start is None) or (v[1] is not None and end is None):
+                return False
+            return (start is None or start <= key) and (end is None or key <= end)
         return version == v
 
+    def _find_version(self, name, version):
+        """ Return the position of a version in the list of versions of an object
+
+        Args:
+            name (str): the identifier of the object
+            version (str): the version
+
+        Returns:
+            int -- the position or -1 if the version does not exist
+        """
+
+        key = self._get_key(name, version)
+        if key is None:
+            return -1
+        keys = self._version_keys.get(name, [])
+        objs = self._get_object_list(name, False)
+        for i in range(bisect.bisect_left(keys, key), len(keys)):
+            if keys[i] != key:
+                break
+            if objs[i].version == version:
+                return i
+        return -1
+
+    def _index_modifications(self, name, obj, add=True):
+        """ Add or remove the modifier versions of an object to or from the inverted modifier index
+
+        Args:
+            name (str): the identifier of the object
+            obj (_Snapshot): the stored object
+            add (bool): if True the versions are added, otherwise removed. Defaults to True.
+        """
+
+        for modifier, modifier_version in obj.modification_info.items():
+            if not isinstance(modifier_version, str):
+                continue
+            key = (name, modifier, modifier_version)
+            if add:
+                self._modifier_index.setdefault(key, set()).add(obj.version)
+            elif key in self._modifier_index:
+                self._modifier_index[key].discard(obj.version)
+                if len(self._modifier_index[key]) == 0:
+                    del self._modifier_index[key]
+
+    def _get_modifier_positions(self, name, modifier_versions):
+        """ Return the positions of the versions of an object modified by the given modifier versions using the inverted modifier index
+
+        Args:
+            name (str): the identifier of the object
+            modifier_versions (dict): modifier ids together with version specs, only single versions are used
+
+        Returns:
+            set of int or None -- the positions or None if no single modifier version is given
+        """
+
+        if modifier_versions is None:
+            return None
+        versions = None
+        for modifier, modifier_version in modifier_versions.items():
+            if not isinstance(modifier_version, str):
+                continue
+            tmp = self._modifier_index.get(
+                (name, modifier, modifier_version), set())
+            versions = tmp if versions is None else versions & tmp
+        if versions is None:
+            return None
+        return set([i for i in [self._find_version(name, v) for v in versions] if i > -1])
+
+    def _get_positions(self, name, versions):
+        """ Return the positions of the versions of an object matching the version specification
+
+        Args:
+            name (str): the identifier of the object
+            versions (list, version_number, tuple): the version specification as described in :py:meth:`_get`
+
+        Returns:
+            iterable of int -- the positions in ascending order
+        """
+
+        keys = self._version_keys.get(name, [])
+        if versions is None:
+            return range(len(keys))
+        if isinstance(versions, tuple):
+            start, end = 0, len(keys)
+            if versions[0] is not None:
+                key = self._get_key(name, versions[0])
+                if key is None:
+                    return []
+                start = bisect.bisect_left(keys, key)
+            if versions[1] is not None:
+                key = self._get_key(name, versions[1])
+                if key is None:
+                    return []
+                end = bisect.bisect_right(keys, key)
+            return range(start, end)
+        if isinstance(versions, list):
+            return sorted(set([i for i in [self._find_version(name, v) for v in versions] if i > -1]))
+        i = self._find_version(name, versions)
+        return [i] if i > -1 else []
+
     def _is_in_modifications(self, obj, modifications):
         """ Check if dictionary contains all modifications as given and if their version is in the respective version spec
 
         Args:
-            obj (dict): object dictionary
+            obj (_Snapshot): the stored object
             modifications (dict): [description]
 
         Returns:
@@ -60,12 +220,13 @@ class RepoObjectMemoryStorage(RepoStore):
         """
         if modifications is None:
             return True
-        modification_info = obj['repo_info'][repo_objects.RepoInfoKey.MODIFICATION_INFO.value]
+        modification_info = obj.modification_info
         result = True
         for k, v in modifications.items():
             if not k in modification_info.keys():
                 return False
-            result = result and self._is_in_versions(modification_info[k], v)
+            result = result and self._is_in_versions(
+                k, modification_info[k], v)
             if result == False:
                 return result
         return result
@@ -119,6 +280,12 @@ class RepoObjectMemoryStorage(RepoStore):
         self._store = {}
         self._name_to_category = {}
         self._categories = {}
+        # maps each object name to the sorted list of the integer keys of its versions (parallel to the list of versions in _store)
+        self._version_keys = {}
+        # maps (name, version) to the key of versions which are not uuids
+        self._custom_keys = {}
+        # maps (name, modifier, modifier version) to the set of versions of the object modified by the modifier version
+        self._modifier_index = {}
 
     def _delete(self, name, version):
         """ Delete an object from the repo
@@ -130,16 +297,16 @@ class RepoObjectMemoryStorage(RepoStore):
 
         category = self._name_to_category[name]
         objs = self._store[category][name]
-        counter = -1
-        for i in range(len(objs)):
-            if objs[i]['repo_info'][repo_objects.RepoInfoKey.VERSION.value] == version:
-                counter = i
-                break
+        counter = self._find_version(name, version)
         if counter > -1:
+            self._index_modifications(name, objs[counter], add=False)
             del objs[counter]
+            del self._version_keys[name][counter]
+            self._custom_keys.pop((name, version), None)
             if len(objs) == 0:
                 del self._store[category][name]
                 del self._name_to_category[name]
+                del self._version_keys[name]
 
     def _add(self, obj):
         """ Adds an object to the storage
@@ -158,16 +325,29 @@ class RepoObjectMemoryStorage(RepoStore):
         if not category in self._store.keys():
             self._store[category] = {}
         tmp = self._store[category]
+        version = obj['repo_info'][repo_objects.RepoInfoKey.VERSION.value]
+        key = self._get_key(name, version)
+        if key is None:
+            # versions which are not uuids are ordered by insertion
+            keys = self._version_keys.get(name, [])
+            key = keys[-1] + 1 if len(keys) > 0 else 0
+            self._custom_keys[(name, version)] = key
+        obj = _Snapshot(obj)
+        self._index_modifications(name, obj)
         if not name in tmp.keys():
             tmp[name] = [obj]
+            self._version_keys[name] = [key]
         else:
-            tmp[name].append(obj)
+            keys = self._version_keys[name]
+            i = bisect.bisect_right(keys, key)
+            keys.insert(i, key)
+            tmp[name].insert(i, obj)
         self._name_to_category[name] = category
         if not category in self._categories.keys():
             self._categories[category] = set()
         self._categories[category].add(name)
-        logger.debug(obj['repo_info'][repo_objects.RepoInfoKey.NAME.value] +
-                     ' added with version ' + str(obj['repo_info'][repo_objects.RepoInfoKey.VERSION.value]) + ', category: ' + category)
+        logger.debug(name + ' added with version ' +
+                     str(obj.version) + ', category: ' + category)
 
     def _get(self, name, versions=None, modifier_versions=None, obj_fields=None,  repo_info_fields=None,
              throw_error_not_exist=True, throw_error_not_unique=True):
@@ -183,10 +363,10 @@ class RepoObjectMemoryStorage(RepoStore):
                     all versions between the first and last entry (both including) are returned. In addition FIRST_VERSION and LAST_VERSION can be used for versions to access
                     the last/first version.
             modifier_versions (dictionary): modifier ids together with version specs which are matched by the returned object.. Defaults to None.
-            obj_fields (list of str or str): list of strings identifying the fields which will be returned in the dictionary,
-                                                        if None, no fields are returned, if set to 'all', all fields will be returned . Defaults to None.
-            repo_info_fields (list of str or str): list of strings identifying the fields of the repo_info dict which will be returned in the dictionary,
-                                                        if None, no fields are returned, if set to 'all', all fields will be returned. Defaults to None.
+            obj_fields (list of str): list of strings identifying the fields which will be returned in the dictionary,
+                                                        if None, all fields will be returned . Defaults to None.
+            repo_info_fields (list of str): list of strings identifying the fields of the repo_info dict which will be returned in the dictionary,
+                                                        if None, all fields will be returned. Defaults to None.
             throw_error_not_exist (bool): true - throw error if not exists, else return []. Defaults to True.
             throw_error_not_unique (bool): true - throw error if item is not unique, else return []. Defaults to True.
 
@@ -196,11 +376,42 @@ class RepoObjectMemoryStorage(RepoStore):
 
         tmp = self._get_object_list(
             name, throw_error_not_exist, throw_error_not_unique)
+        if len(tmp) == 0:
+            return []
+        positions = self._get_positions(name, versions)
+        modifier_positions = self._get_modifier_positions(
+            name, modifier_versions)
+        if modifier_positions is not None:
+            positions = sorted(modifier_positions.intersection(positions))
         result = []
-        for x in tmp:
-            if self._is_in_versions(x['repo_info'][repo_objects.RepoInfoKey.VERSION.value], versions):
-                if self._is_in_modifications(x, modifier_versions):
-                    result.append(deepcopy(x))
+        for i in positions:
+            x = tmp[i]
+            if self._is_in_modifications(x, modifier_versions):
+                if obj_fields is None and repo_info_fields is None:
+                    result.append(x.get())
+                elif obj_fields is not None and len(obj_fields) == 0:
+                    # only repo_info fields are requested which are served without decoding the object
+                    result.append(
+                        deepcopy(_project({'repo_info': x.repo_info}, obj_fields, repo_info_fields)))
+                else:
+                    result.append(
+                        _project(x.get(), obj_fields, repo_info_fields))
+        return result
+
+    def _get_modification_infos(self, names):
+        """ Return the versions and modification infos of all objects with the given names.
+
+        Args:
+            names (set of str): names of the objects
+
+        Returns:
+            dict -- dictionary of object names and lists of tuples of version and modification info (ordered by version)
+        """
+
+        result = {}
+        for name in names:
+            result[name] = [(x.version, dict(x.modification_info))
+                            for x in self._get_object_list(name, False)]
         return result
 
     def get_version(self, name, offset, throw_error_not_exist=True):
@@ -231,7 +442,7 @@ class RepoObjectMemoryStorage(RepoStore):
                                 name + ' exists in storage')
             else:
                 return []
-        return self._get_object_list(name)[offset]['repo_info'][repo_objects.RepoInfoKey.VERSION.value]
+        return self._get_object_list(name)[offset].version
 
     def get_latest_version(self, name, throw_error_not_exist=True):
         """ Determine the latest version of the object
@@ -254,7 +465,7 @@ class RepoObjectMemoryStorage(RepoStore):
                                 name + ' exists in storage')
             else:
                 return []
-        return tmp[-1]['repo_info'][repo_objects.RepoInfoKey.VERSION.value]
+        return tmp[-1].version
 
     def get_first_version(self, name, throw_error_not_exist=True):
         """ Determine the first version of the object
@@ -277,7 +488,7 @@ class RepoObjectMemoryStorage(RepoStore):
                                 name + ' exists in storage')
             else:
                 return []
-        return tmp[0]['repo_info'][repo_objects.RepoInfoKey.VERSION.value]
+        return tmp[0].version
 
     def get_names(self, category):
         """ Return the names of all objects belonging to the given category.
@@ -315,10 +526,12 @@ class RepoObjectMemoryStorage(RepoStore):
                             name + ' and category ' + category + ' exists.')
         all_obj = tmp[name]
         version = obj['repo_info'][repo_objects.RepoInfoKey.VERSION.value]
-        for i, x in enumerate(all_obj):
-            if version == x['repo_info'][repo_objects.RepoInfoKey.VERSION.value]:
-                all_obj[i] = obj
-                return
+        i = self._find_version(name, version)
+        if i > -1:
+            self._index_modifications(name, all_obj[i], add=False)
+            all_obj[i] = _Snapshot(obj)
+            self._index_modifications(name, all_obj[i])
+            return
 
         logger.error('Cannot replace object: The version ' + str(obj['repo_info'][repo_objects.RepoInfoKey.VERSION.value])
                      + ' does not exist in storage.')
@@ -344,13 +557,14 @@ class NumpyMemoryStorage(NumpyStore):
                 if len(self._store[name]) == 0:
                     del self._store[name]
 
-    def add(self, name, version, numpy_dict):
+    def add(self, name, version, numpy_dict, category=None):
         """ Add numpy data from an object to the storage.
 
         Args:
             name (str): identifier (as string) of object
             version (str): object version
             numpy_dict (numpy dict): numpy dictionary
+            category (str): category of the object (not used). Defaults to None.
         """
 
         logger.debug('Adding data for ' + name +
@@ -381,7 +595,30 @@ class NumpyMemoryStorage(NumpyStore):
         self._store[name][version_new] = {
             'previous': version_old,  'numpy_dict': numpy_dict}
 
-    def get(self, name, version, from_index=0, to_index=None):
+    def _extend(self, name, version, numpy_dict):
+        """ Append a numpy dictionary to an existing version of an object without creating a new version
+
+        Args:
+            name (str): identifier of the object
+            version (str): the version of the object
+            numpy_dict (numpy dict): the numpy dictionary to append
+
+        Raises:
+            Exception: raises an exception if the object does not exist
+        """
+
+        if name not in self._store.keys() or version not in self._store[name].keys():
+            logger.error("Cannot append data because " +
+                         name + " does not exist.")
+            raise Exception("Cannot append data because " +
+                            name + " does not exist.")
+        data = self._store[name][version]
+        if 'previous' in data.keys():
+            data = data['numpy_dict']
+        for k, v in numpy_dict.items():
+            data[k] = concatenate((data[k], v), axis=0)
+
+    def get(self, name, version, from_index=0, to_index=None, keys=None):
         """ get the numpy object for a name and a version, rows can be used
 
         Args:
@@ -389,6 +626,7 @@ class NumpyMemoryStorage(NumpyStore):
             version (str): version of the object
             from_index (int): the index from which the data should be taken. Defaults to 0.
             to_index (int or None): the index to which the data is returned (None means till the end). Defaults to None.
+            keys (list of str or None): the keys of the numpy dictionary to be returned (None means all keys). Defaults to None.
 
         Raises:
             Exception: raises an exception if no object with the name exists
@@ -406,28 +644,19 @@ class NumpyMemoryStorage(NumpyStore):
             raise Exception('No numpy data for object ' +
                             name + ' with version ' + str(version))
         result = self._store[name][version]
-        new_result = result
         if 'previous' in result.keys():
             new_result = {}
-            prev = self.get(name, result['previous'])
+            prev = self.get(name, result['previous'], keys=keys)
             for k, v in result['numpy_dict'].items():
-                new_result[k] = concatenate((prev[k], v), axis=0)
+                if keys is None or k in keys:
+                    new_result[k] = concatenate((prev[k], v), axis=0)
+        else:
+            new_result = {k: v for k, v in result.items()
+                          if keys is None or k in keys}
 
         # adjust for given start and end indices
         if from_index != 0 or (to_index is not None):
-            tmp = {}
             logger.debug('Slice data from_index: ' +
                          str(from_index) + ', to_index: ' + str(to_index))
-            if from_index != 0 and (to_index is not None):
-                for k, v in new_result.items():
-                    tmp[k] = v[from_index:to_index, :]
-                    logger.debug(k + ' added with new shape ' + str(v.shape))
-            else:
-                if from_index != 0:
-                    for k, v in new_result.items():
-                        tmp[k] = v[from_index:-1, :]
-                if to_index is not None:
-                    for k, v in new_result.items():
-                        tmp[k] = v[0:to_index, :]
-            return tmp
+            return {k: v[from_index:to_index] for k, v in new_result.items()}
         return new_result
@@ -4,8 +4,10 @@
 This module provides implementations of the :py:class:`pailab.ml_repo.repo_store.NumpyStore` using hdf5 file format.
 """
 import time
+import hashlib
 from contextlib import contextmanager
 import h5py
+import numpy as np
 import os
 import pathlib
 import logging
@@ -42,12 +44,38 @@ class NumpyHDFStorage(NumpyStore):
         version_files (bool): If True, each version is contained in a separate file, otherwise all versions are in one file.
             If you like to work in a distributed environmnt (e.g. multiple users working in parallel) you should set this parameter to True so that no file merge is necessary.
             . Defaults to False.
+        memory_map (bool): If True, data is stored in contiguous (non-resizable) datasets and :py:meth:`get` returns read-only memory mapped arrays
+            instead of reading the data into memory. Appending to such data in the same file copies the existing rows into a new dataset. 
+            The returned arrays are only valid as long as the respective version is not deleted. Defaults to False.
+        storage_options (dict): Dictionary defining the layout of the hdf5 datasets. The options under the key 'default' are used for all objects,
+            the options under the key of an object category (e.g. 'RAW_DATA') overwrite the defaults for objects of this category. Supported options are
+            'chunk_rows' (number of rows per chunk), 'compression' ('gzip', 'lzf' or 'blosc' which needs the hdf5plugin package and falls back to gzip otherwise), 
+            'compression_opts' (the compression level for gzip or a dictionary of arguments of hdf5plugin.Blosc), 'shuffle' (bool, use the shuffle filter) and 
+            'dtype' (dtype floating point data is cast to, e.g. 'float32'). The options are ignored if memory_map is True. Defaults to None.
+        deduplicate (bool): If True, arrays are identified by a hash of their content and an array which is identical to an array already stored in the same file
+            is not written again but linked to the existing dataset. Since links cannot be shared between files, this has only an effect if version_files is False. Defaults to False.
+
+    Example:
+        Store raw data compressed with gzip in chunks of 10000 rows::
+
+            >>> store = NumpyHDFStorage('C:\\temp\\data', storage_options={'RAW_DATA': {'compression': 'gzip', 'shuffle': True, 'chunk_rows': 10000}})
 
     """
 
-    def __init__(self, folder, version_files=False):
+    def __init__(self, folder, version_files=False, memory_map=False, storage_options=None, deduplicate=False):
         self.main_dir = folder
         self._version_files = version_files
+        self._memory_map = memory_map
+        self._deduplicate = deduplicate
+        if self._deduplicate and self._version_files:
+            logger.warning(
+                'Deduplication is ignored since each version is stored in a separate file.')
+        self._storage_options = storage_options
+        if self._storage_options is None:
+            self._storage_options = {}
+        if self._memory_map and len(self._storage_options) > 0:
+            logger.warning(
+                'Storage options are ignored since memory mapping needs contiguous uncompressed datasets.')
         if not os.path.exists(self.main_dir):
             os.makedirs(self.main_dir)
 
@@ -96,54 +124,173 @@ class NumpyHDFStorage(NumpyStore):
 
     @staticmethod
     @trace
-    def _save(data_grp, ref_grp, numpy_dict):
+    def _save(data_grp, ref_grp, numpy_dict, resizable=True, options=None, content_grp=None):
         """ saving the data 
 
         Args:
             data_grp ([type]): the data group
             ref_grp ([type]): the reference group 
             numpy_dict (numpy dict): the numpy dictionary to save
+            resizable (bool): If True, the datasets can be extended along the first axis, otherwise they are stored contiguously. Defaults to True.
+            options (dict): dictionary containing the storage options (see :py:class:`NumpyHDFStorage`) for the keys of the numpy dictionary, 
+                only used for resizable datasets. Defaults to None.
+            content_grp ([type]): the group containing the links from the content hashes to the datasets, if not None, arrays already stored in the file are
+                linked instead of written again. Defaults to None.
 
         Raises:
-            NotImplementedException: [description]
+            NotImplementedError: raises an error for arrays with more than four dimensions
         """
 
+        if options is None:
+            options = {}
         for k, v in numpy_dict.items():
             if v is not None:
-                if len(v.shape) == 1:
-                    tmp = data_grp.create_dataset(
-                        k, data=v, maxshape=(None, ))
-                    ref_grp.create_dataset(k, data=tmp.regionref[0:v.shape[0]])
+                if len(v.shape) > 4:
+                    raise NotImplementedError('Not implemented for dim>4.')
+                kwargs = {}
+                if resizable:
+                    v, kwargs = NumpyHDFStorage._get_dataset_args(
+                        v, options.get(k))
+                content_hash = None
+                if content_grp is not None:
+                    content_hash = NumpyHDFStorage._get_content_hash(v)
+                tmp = None
+                if content_hash is not None:
+                    tmp = content_grp.get(content_hash)
+                if tmp is not None:
+                    # hard link so that the data remains if the version which stored it first is deleted
+                    data_grp[k] = tmp
                 else:
-                    if len(v.shape) == 2:
+                    if resizable:
                         tmp = data_grp.create_dataset(
-                            k, data=v, maxshape=(None, v.shape[1]))
-                        ref_grp.create_dataset(
-                            k, data=tmp.regionref[0:v.shape[0], 0:v.shape[1]])
+                            k, data=v, maxshape=(None, ) + v.shape[1:], **kwargs)
                     else:
-                        if len(v.shape) == 3:
-                            tmp = data_grp.create_dataset(
-                                k, data=v, maxshape=(None, v.shape[1], v.shape[2]))
-                            ref_grp.create_dataset(
-                                k, data=tmp.regionref[0:v.shape[0], 0:v.shape[1], 0:v.shape[2]])
-                        else:
-                            if len(v.shape) == 4:
-                                tmp = data_grp.create_dataset(
-                                    k, data=v, maxshape=(None, v.shape[1], v.shape[2], v.shape[3]))
-                                ref_grp.create_dataset(
-                                    k, data=tmp.regionref[0:v.shape[0], 0:v.shape[1], 0:v.shape[2], 0:v.shape[3]])
-                            else:
-                                raise NotImplementedException(
-                                    'Not implemenet for dim>3.')
+                        tmp = data_grp.create_dataset(k, data=v)
+                    if content_hash is not None:
+                        if content_hash in content_grp:
+                            # link to a dataset of a deleted version
+                            del content_grp[content_hash]
+                        content_grp[content_hash] = h5py.SoftLink(tmp.name)
+                        # reverse lookup of the content link (see _is_shared)
+                        tmp.attrs['content_hash'] = content_hash
+                ref_grp.create_dataset(
+                    k, data=tmp.regionref[tuple(slice(0, n) for n in v.shape)])
+
+    @staticmethod
+    def _get_content_hash(v):
+        """ Returns a hash of the content of an array
+
+        Args:
+            v (numpy array): the data
+
+        Returns:
+            str or None -- the hash or None if the content of the array cannot be hashed (arrays of python objects)
+        """
+
+        if v.dtype.hasobject:
+            return None
+        h = hashlib.sha256()
+        h.update((v.dtype.str + str(v.shape)).encode('utf-8'))
+        h.update(np.ascontiguousarray(v).data)
+        return h.hexdigest()
+
+    @staticmethod
+    def _get_dataset_args(v, options):
+        """ Returns the data and the keyword arguments of create_dataset for the given storage options
+
+        Args:
+            v (numpy array): the data
+            options (dict or None): the storage options
+
+        Returns:
+            tuple -- the (possibly cast) data and the dictionary of keyword arguments
+        """
+
+        kwargs = {}
+        if options is None:
+            return v, kwargs
+        if options.get('dtype') is not None and np.issubdtype(v.dtype, np.floating):
+            v = v.astype(options['dtype'], copy=False)
+        compression = options.get('compression')
+        if compression == 'blosc':
+            try:
+                import hdf5plugin
+                blosc_args = options.get('compression_opts')
+                if blosc_args is None:
+                    blosc_args = {}
+                kwargs.update(hdf5plugin.Blosc(**blosc_args))
+                compression = None
+            except ImportError:
+                logger.warning(
+                    'Package hdf5plugin is not installed, using gzip instead of blosc.')
+                compression = 'gzip'
+                options = {k: v for k, v in options.items() if k !=
+                           'compression_opts'}
+        if compression is not None:
+            kwargs['compression'] = compression
+            if options.get('compression_opts') is not None:
+                kwargs['compression_opts'] = options['compression_opts']
+        if options.get('shuffle', False):
+            kwargs['shuffle'] = True
+        if options.get('chunk_rows') is not None and min(v.shape[1:], default=1) > 0:
+            kwargs['chunks'] = (int(options['chunk_rows']), ) + v.shape[1:]
+        return v, kwargs
+
+    @staticmethod
+    def _get_dataset_options(data):
+        """ Returns the storage options of an existing dataset
+
+        Args:
+            data (h5py.Dataset): the dataset
+
+        Returns:
+            dict -- the storage options (see :py:class:`NumpyHDFStorage`)
+        """
+
+        options = {'compression': data.compression,
+                   'compression_opts': data.compression_opts, 'shuffle': data.shuffle}
+        if data.chunks is not None:
+            options['chunk_rows'] = data.chunks[0]
+        return options
+
+    def _get_storage_options(self, category):
+        """ Returns the storage options for an object category
+
+        Args:
+            category (str or None): the category of the object
+
+        Returns:
+            dict -- the storage options (see :py:class:`NumpyHDFStorage`)
+        """
+
+        options = dict(self._storage_options.get('default', {}))
+        if category is not None:
+            options.update(self._storage_options.get(category, {}))
+        return options
 
     @trace
-    def add(self, name, version, numpy_dict):
+    def add(self, name, version, numpy_dict, category=None):
         """ Add numpy data from an object to the storage.
 
         Args:
             name (str): the identifier of the object to add
             version (str): the object version 
             numpy_dict (numpy dict): the numpy dictionary to add
+            category (str): the category of the object used to determine the storage options. Defaults to None.
+        """
+
+        options = self._get_storage_options(category)
+        self._add(name, version, numpy_dict, {
+                  k: options for k in numpy_dict.keys()})
+
+    def _add(self, name, version, numpy_dict, options):
+        """ Add numpy data from an object to the storage using the given storage options.
+
+        Args:
+            name (str): the identifier of the object to add
+            version (str): the object version 
+            numpy_dict (numpy dict): the numpy dictionary to add
+            options (dict): dictionary of the storage options for the keys of the numpy dictionary
         """
 
         tmp = pathlib.Path(self.main_dir + '/' + name + 'hdf')
@@ -156,7 +303,11 @@ class NumpyHDFStorage(NumpyStore):
                          ' in hdf5 to group ' + grp_name)
             grp = f.create_group(grp_name)
             ref_grp = f.create_group('/ref/' + str(version) + '/')
-            NumpyHDFStorage._save(grp, ref_grp, numpy_dict)
+            content_grp = None
+            if self._deduplicate and not self._version_files:
+                content_grp = f.require_group('/content/')
+            NumpyHDFStorage._save(
+                grp, ref_grp, numpy_dict, resizable=not self._memory_map, options=options, content_grp=content_grp)
 
     @trace
     def _append_same_file(self, name, version_old, version_new, numpy_dict):
@@ -181,33 +332,93 @@ class NumpyHDFStorage(NumpyStore):
                 grp = f.create_group('/data/' + str(version_new) + '/')
 
             grp_previous = f['/data/' + str(version_old) + '/']
+            ref_grp_previous = f['/ref/' + str(version_old) + '/']
             for k, v in numpy_dict.items():
-                data = grp_previous[k]
-                old_size = len(data)
-                new_shape = [x for x in v.shape]
-                new_shape[0] += old_size
-                new_shape = tuple(new_shape)
-                data.resize(new_shape)
+                NumpyHDFStorage._append_rows(
+                    f, grp_previous[k], ref_grp_previous[k], grp, ref_grp, k, v)
+
+    @trace
+    def _extend(self, name, version, numpy_dict):
+        """ Append data to an existing version without creating a new version
+
+        Args:
+            name (str): the object identifier
+            version (str): the object version
+            numpy_dict (numpy dict): the data to add as a numpy dictionary
+        """
+
+        with h5py.File(self.main_dir + '/' + self._create_file_name(name, version), 'a') as f:
+            logger.debug('Extending data ' + name +
+                         ' in hdf5 with version ' + str(version))
+            grp = f['/data/' + str(version) + '/']
+            ref_grp = f['/ref/' + str(version) + '/']
+            for k, v in numpy_dict.items():
+                NumpyHDFStorage._append_rows(
+                    f, grp[k], ref_grp[k], grp, ref_grp, k, v)
+
+    @staticmethod
+    def _append_rows(f, data, ref, grp, ref_grp, k, v):
+        """ Append rows to the data of a version and store the result and its reference under the given key
+
+        Args:
+            f (h5py.File): the hdf5 file
+            data (h5py.Dataset): the dataset containing the rows of the previous version
+            ref (h5py.Dataset): the reference of the previous version defining its rows
+            grp (h5py.Group): the data group the result is stored in, may be the group of the previous version
+            ref_grp (h5py.Group): the reference group the reference of the result is stored in
+            k (str): the key of the data
+            v (numpy array): the rows to append
+        """
+
+        # the rows of the previous version are defined by its reference, the dataset may contain rows of other versions
+        old_size = data.regionref.selection(ref[()])[0]
+        new_shape = (old_size + v.shape[0], ) + data.shape[1:]
+        if data.maxshape[0] is not None:
+            # contiguous dataset (memory mapped storage) cannot be resized, copy into new dataset
+            tmp = np.concatenate([data[:old_size], v])
+            if k in grp:
+                del grp[k]
+            data = grp.create_dataset(k, data=tmp)
+        else:
+            if NumpyHDFStorage._is_shared(data, f.get('/content/')) or data.shape[0] != old_size:
+                # the dataset is used by other versions (or linked by its content hash), resize a copy instead
+                f.copy(data, grp, name=k + '_copy')
+                if k in grp:
+                    del grp[k]
+                grp.move(k + '_copy', k)
+                data = grp[k]
+                if 'content_hash' in data.attrs:
+                    # the copy is not linked by the content hash
+                    del data.attrs['content_hash']
+            elif k not in grp:
                 grp[k] = h5py.SoftLink(data.name)
-                if len(data.shape) == 1:
-                    data[old_size:new_shape[0]] = v
-                    ref_grp.create_dataset(
-                        k, data=data.regionref[0:new_shape[0]])
-                else:
-                    if len(data.shape) == 2:
-                        data[old_size:new_shape[0], :] = v
-                        ref_grp.create_dataset(
-                            k, data=data.regionref[0:new_shape[0], :])
-                    else:
-                        if len(data.shape) == 3:
-                            data[old_size:new_shape[0], :, :] = v
-                            ref_grp.create_dataset(
-                                k, data=data.regionref[0:new_shape[0], :, :])
-                        else:
-                            if len(data.shape) == 4:
-                                data[old_size:new_shape[0], :, :, :] = v
-                                ref_grp.create_dataset(
-                                    k, data=data.regionref[0:new_shape[0], :, :, :])
+            data.resize(new_shape)
+            data[old_size:new_shape[0]] = v
+        if k in ref_grp:
+            del ref_grp[k]
+        ref_grp.create_dataset(
+            k, data=data.regionref[tuple(slice(0, n) for n in new_shape)])
+
+    @staticmethod
+    def _is_shared(data, content_grp):
+        """ Returns True if a dataset is hard linked by more than one version or linked by a content hash
+
+        The content hash of a dataset linked by its hash is stored as attribute of the dataset, so that only this hash has to be looked up.
+
+        Args:
+            data (h5py.Dataset): the dataset
+            content_grp (h5py.Group or None): the group containing the links from the content hashes to the datasets
+
+        Returns:
+            bool -- True if the dataset must not be changed
+        """
+
+        if h5py.h5o.get_info(data.id).rc > 1:
+            return True
+        content_hash = data.attrs.get('content_hash')
+        if content_grp is not None and content_hash is not None:
+            return content_grp.get(content_hash) == data
+        return False
 
     def _append_different_file(self, name, version_old, version_new, numpy_dict):
         """ Append data to a different file
@@ -219,12 +430,14 @@ class NumpyHDFStorage(NumpyStore):
             numpy_dict (numpy dict): the data to add as a numpy dictionary
         """
 
-        # save data to append in separate file
-        self.add(name + '_append', version_new, numpy_dict)
-        # get shape
         grp_name_old = '/data/' + str(version_old) + '/'
         grp_name_new = '/data/' + str(version_new) + '/'
         old_filename = self._create_file_name(name, version_old)
+        # save data to append in separate file using the layout of the existing data
+        with h5py.File(self.main_dir + '/' + old_filename, 'r') as f_old:
+            options = {k: NumpyHDFStorage._get_dataset_options(f_old[grp_name_old][k])
+                       for k in numpy_dict.keys()}
+        self._add(name + '_append', version_new, numpy_dict, options)
         new_filename = self._create_file_name(name, version_new)
         tmp_filename = self._create_file_name(name + '_append', version_new)
         with h5py.File(self.main_dir + '/' + old_filename, 'r') as f_old:
@@ -239,7 +452,8 @@ class NumpyHDFStorage(NumpyStore):
                         grp_new_k = f_tmp[grp_name_new][k]
                         shape = (
                             grp_old_k.shape[0]+grp_new_k.shape[0], ) + grp_old_k.shape[1:]
-                        layout = h5py.VirtualLayout(shape=shape)
+                        layout = h5py.VirtualLayout(
+                            shape=shape, dtype=grp_old_k.dtype)
                         layout[0:grp_old_k.shape[0]
                                ] = h5py.VirtualSource(grp_old_k)
                         layout[grp_old_k.shape[0]:] = h5py.VirtualSource(grp_new_k)
@@ -265,7 +479,7 @@ class NumpyHDFStorage(NumpyStore):
                 name, version_old, version_new, numpy_dict)
 
     @trace
-    def get(self, name, version, from_index=0, to_index=None):
+    def get(self, name, version, from_index=0, to_index=None, keys=None):
         """ get the numpy object for a name and a version, rows can be used
 
         Args:
@@ -273,17 +487,19 @@ class NumpyHDFStorage(NumpyStore):
             version (str): version of the object
             from_index (int): the index from which the data should be taken. Defaults to 0.
             to_index (int or None): the index to which the data is returned (None means till the end). Defaults to None.
+            keys (list of str or None): the keys of the numpy dictionary to be returned (None means all keys). Defaults to None.
 
         Raises:
             Exception: raises an exception if no object with the name exists
             Exception: raises an exception if no object and with the version exists 
 
         Returns:
-            numpy array -- the numpy object to return
+            numpy array -- the numpy object to return (read-only memory mapped arrays if the storage uses memory mapping)
         """
 
-        # \todo auch hier muss die referenz einschl. Namen verwendet werden
-        with h5py.File(self.main_dir + '/' + self._create_file_name(name, version, change_if_not_exist=True), 'r') as f:
+        filename = self.main_dir + '/' + \
+            self._create_file_name(name, version, change_if_not_exist=True)
+        with h5py.File(filename, 'r') as f:
             grp_name = '/data/' + str(version) + '/'
             ref_grp = '/ref/' + str(version) + '/'
             logger.debug('Reading object ' + name +
@@ -292,23 +508,45 @@ class NumpyHDFStorage(NumpyStore):
             ref_g = f[ref_grp]
             result = {}
             for k, v in ref_g.items():
-                result[k] = grp[k][v[()]]
-        # todo needs improvement, handle indices in reading
-        if from_index != 0 or (to_index is not None):
-            tmp = {}
-            if from_index != 0 and (to_index is not None):
-                for k, v in result.items():
-                    tmp[k] = v[from_index:to_index, :]
-            else:
-                if from_index != 0:
-                    for k, v in result.items():
-                        tmp[k] = v[from_index:-1, :]
-                if to_index is not None:
-                    for k, v in result.items():
-                        tmp[k] = v[0:to_index, :]
-            return tmp
+                if keys is not None and k not in keys:
+                    continue
+                data = grp[k]
+                # the reference defines the rows belonging to this version, only the requested rows are read
+                n_rows = data.regionref.selection(v[()])[0]
+                start, stop, _ = slice(from_index, to_index).indices(n_rows)
+                stop = max(start, stop)
+                tmp = None
+                if self._memory_map:
+                    tmp = NumpyHDFStorage._get_memory_map(
+                        filename, data, start, stop)
+                if tmp is None:
+                    tmp = data[start:stop]
+                result[k] = tmp
         return result
 
+    @staticmethod
+    def _get_memory_map(filename, data, start, stop):
+        """ Returns a read-only memory map of rows of a dataset
+
+        Args:
+            filename (str): the hdf5 file containing the dataset
+            data (h5py.Dataset): the dataset
+            start (int): the first row
+            stop (int): the row after the last row
+
+        Returns:
+            numpy.memmap or None -- the memory map or None if the dataset is not stored contiguously and uncompressed
+        """
+
+        if data.chunks is not None or data.compression is not None or data.is_virtual or stop <= start:
+            return None
+        offset = data.id.get_offset()
+        if offset is None:
+            return None
+        row_size = data.dtype.itemsize * int(np.prod(data.shape[1:]))
+        return np.memmap(filename, dtype=data.dtype, mode='r', offset=offset + start * row_size,
+                         shape=(stop - start, ) + data.shape[1:])
+
     def object_exists(self, name, version):
         """ checks whether the object exists
 
@@ -398,10 +636,13 @@ class NumpyHDFRemoteStorage(NumpyHDFStorage):
        remote_store (obj or dict): object representing a remote storage (e.g. :py:class:`pailab.ml_repo.remote_gcs.RemoteGCS` for the google cloud storage) or dictionary defining the remote params so that it can be created 
        sync_get (bool): If True, tries to download data automatically if it does not exist locally, otherwise it checks only locally
        sync_add (bool): If True, added data will be directly uploaded to the remote
+       memory_map (bool): If True, the data is returned as read-only memory mapped arrays, see :py:class:`NumpyHDFStorage`. Defaults to False.
+       storage_options (dict): the layout of the hdf5 datasets, see :py:class:`NumpyHDFStorage`. Defaults to None.
     """
 
-    def __init__(self, folder, remote_store=None,  sync_get=False, sync_add=False):
-        super(NumpyHDFRemoteStorage, self).__init__(folder, version_files=True)
+    def __init__(self, folder, remote_store=None,  sync_get=False, sync_add=False, memory_map=False, storage_options=None):
+        super(NumpyHDFRemoteStorage, self).__init__(
+            folder, version_files=True, memory_map=memory_map, storage_options=storage_options)
         if isinstance(remote_store, dict):
             self._remote_store = _create_remote(
                 remote_store['type'], **remote_store['config'])
@@ -417,14 +658,14 @@ class NumpyHDFRemoteStorage(NumpyHDFStorage):
     def set_remote(self, remote_store):
         self._remote_store = remote_store
 
-    def get(self, name, version, from_index=0, to_index=None):
+    def get(self, name, version, from_index=0, to_index=None, keys=None):
         if not self._sync_get:
-            return super(NumpyHDFRemoteStorage, self).get(name, version, from_index, to_index)
+            return super(NumpyHDFRemoteStorage, self).get(name, version, from_index, to_index, keys)
 
         result = None
         try:
             result = super(NumpyHDFRemoteStorage, self).get(
-                name, version, from_index, to_index)
+                name, version, from_index, to_index, keys)
         except:
             with _lock_dir(self.main_dir, self._wait_time, self._timeout):
                 filename = self._create_file_name(
@@ -432,11 +673,12 @@ class NumpyHDFRemoteStorage(NumpyHDFStorage):
                 self._remote_store._download_file(
                     self.main_dir + '/' + filename, filename)
                 result = super(NumpyHDFRemoteStorage, self).get(
-                    name, version, from_index, to_index)
+                    name, version, from_index, to_index, keys)
         return result
 
-    def add(self, name, version, numpy_dict):
-        super(NumpyHDFRemoteStorage, self).add(name, version, numpy_dict)
+    def add(self, name, version, numpy_dict, category=None):
+        super(NumpyHDFRemoteStorage, self).add(
+            name, version, numpy_dict, category)
         if self._sync_add:
             filename = self._create_file_name(name, version)
             self._remote_store._upload_file(
@@ -462,6 +704,14 @@ class NumpyHDFRemoteStorage(NumpyHDFStorage):
             for f in files_to_push:
                 self._remote_store._upload_file(self.main_dir + '/' + f, f)
 
+    def _extend(self, name, version, numpy_dict):
+        super(NumpyHDFRemoteStorage, self)._extend(name, version, numpy_dict)
+        if self._sync_add:
+            # the file has already been uploaded when the version was added
+            filename = self._create_file_name(name, version)
+            self._remote_store._upload_file(
+                self.main_dir + '/' + filename, filename)
+
     def pull(self):
         """ Pull changes from an external repo
         """
@@ -0,0 +1,449 @@
+"""Object cache
+
+This module contains a size bounded LRU cache for the dictionaries of immutable repo objects, a registry
+of the numpy data loaded for DataSets and a cache of preprocessed data stored in the repo.
+"""
+import io
+import types
+import copyreg
+import pickle
+import json
+import hashlib
+import datetime
+import threading
+import weakref
+from collections import OrderedDict, ChainMap
+import logging
+import numpy as np
+from pailab.ml_repo.repo_objects import RepoObject, RepoInfoKey, DataSet
+import pailab.ml_repo.repo_store as repo_store
+logger = logging.getLogger(__name__)
+
+
+def _reduce_method(method):
+    """ Reduce a bound method like pickle does, but fail for methods which are bound to the instance itself
+
+    Methods set as attributes of an instance (e.g. by :py:class:`pailab.ml_repo.repo_objects.repo_object_init`) are pickled but cannot be
+    restored since the instance does not have them when the method is looked up during unpickling.
+    """
+
+    if not isinstance(method.__self__, type) and not hasattr(type(method.__self__), method.__name__):
+        raise pickle.PicklingError(
+            'Method ' + method.__name__ + ' is bound to the instance and cannot be restored.')
+    return getattr, (method.__self__, method.__name__)
+
+
+_DISPATCH_TABLE = ChainMap({types.MethodType: _reduce_method}, copyreg.dispatch_table)
+
+
+def _dumps(obj):
+    """ Pickle an object so that the result can be restored by pickle.loads
+
+    Args:
+        obj (object): the object
+
+    Raises:
+        pickle.PicklingError: raises an error if the object cannot be pickled or restored
+
+    Returns:
+        bytes -- the pickled object
+    """
+
+    f = io.BytesIO()
+    pickler = pickle.Pickler(f, protocol=pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = _DISPATCH_TABLE
+    pickler.dump(obj)
+    return f.getvalue()
+
+
+class RepoObjectCache:
+    """ Bounded LRU cache for repo object dictionaries keyed by name and version.
+
+    The dictionaries are stored in pickled form so that the size of the cache can be measured in bytes and each
+    lookup returns a new copy which may be modified by the caller without changing the cached object. The cache may be used by several
+    threads (e.g. jobs run by the AsyncJobRunner on a shared repo), all accesses to the entries are guarded by a lock.
+    """
+
+    def __init__(self, max_size=64*1024*1024, max_object_size=None):
+        """ Constructor
+
+        Args:
+            max_size (int): maximal size of the cache in bytes, if zero or less the cache is disabled. Defaults to 64*1024*1024.
+            max_object_size (int or None): objects larger than this size (in bytes) are not cached, if None max_size/10 is used. Defaults to None.
+        """
+
+        self.max_size = max_size
+        self.max_object_size = max_object_size
+        if self.max_object_size is None:
+            self.max_object_size = max_size // 10
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def is_enabled(self):
+        """ Returns True if the cache is enabled
+
+        Returns:
+            bool -- True if the cache is enabled, False otherwise
+        """
+
+        return self.max_size > 0
+
+    def get(self, name, version):
+        """ Return the cached object dictionary
+
+        Args:
+            name (str): name of the object
+            version (str): version of the object
+
+        Returns:
+            dict or None -- copy of the cached object dictionary or None if the object is not cached
+        """
+
+        key = (name, version)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._entries.move_to_end(key)
+        return pickle.loads(data)
+
+    def add(self, name, version, obj):
+        """ Add an object dictionary to the cache
+
+        The least recently used objects are removed if the cache exceeds its maximal size.
+
+        Args:
+            name (str): name of the object
+            version (str): version of the object
+            obj (dict): the object dictionary
+        """
+
+        if not self.is_enabled():
+            return
+        try:
+            data = _dumps(obj)
+        except Exception as e:
+            logger.debug('Object ' + name + ' cannot be cached: ' + str(e))
+            return
+        if len(data) > self.max_object_size:
+            return
+        with self._lock:
+            self._remove(name, version)
+            self._entries[(name, version)] = data
+            self._size += len(data)
+            while self._size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self._evictions += 1
+
+    def _remove(self, name, version):
+        """ Remove an object from the cache, the lock must be held by the caller
+
+        Args:
+            name (str): name of the object
+            version (str or None): version of the object, if None all versions of the object are removed
+        """
+
+        if version is None:
+            keys = [k for k in self._entries.keys() if k[0] == name]
+        else:
+            keys = [(name, version)]
+        for k in keys:
+            data = self._entries.pop(k, None)
+            if data is not None:
+                self._size -= len(data)
+
+    def invalidate(self, name, version=None):
+        """ Remove an object from the cache
+
+        Args:
+            name (str): name of the object
+            version (str or None): version of the object, if None all versions of the object are removed. Defaults to None.
+        """
+
+        with self._lock:
+            self._remove(name, version)
+
+    def clear(self):
+        """ Remove all objects from the cache
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def get_statistics(self):
+        """ Return the statistics of the cache
+
+        Returns:
+            dict -- dictionary containing number of hits, misses, evictions, cached objects and size of the cache in bytes
+        """
+
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses, 'evictions': self._evictions,
+                    'objects': len(self._entries), 'size': self._size, 'max_size': self.max_size}
+
+
+class DataSetBuffers:
+    """ Registry of the numpy data loaded for DataSets.
+
+    The registry holds weak references to the loaded arrays so that RawData and DataSets referring to the same rows of the same RawData version 
+    share their buffers as long as one of them is alive. If the complete RawData is alive, the rows of a DataSet are returned as a view
+    of it. Only the rows which are not available in this way are read from the numpy store. Since the buffers are shared, all returned 
+    arrays are read-only, a caller who wants to modify the data has to copy it. The registry may be used by several threads, the 
+    registry itself is guarded by a lock (the data is read from the numpy store outside of the lock).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buffers = weakref.WeakValueDictionary()
+        self._bytes_read = 0
+        self._shared = 0
+
+    def get(self, numpy_store, name, version, from_index=0, to_index=None, keys=None):
+        """ Return the numpy data of a range of rows of an object
+
+        Args:
+            numpy_store (NumpyStore): the numpy store the data is read from
+            name (str): identifier of the object
+            version (str): version of the object
+            from_index (int): the index from which the data should be taken. Defaults to 0.
+            to_index (int or None): the index to which the data is returned (None means till the end). Defaults to None.
+            keys (list of str or None): the keys of the numpy dictionary to be returned (None means all keys). Defaults to None.
+
+        Returns:
+            dict -- the numpy dictionary containing read-only arrays
+        """
+
+        result = {}
+        missing = []
+        if keys is not None:
+            with self._lock:
+                for k in keys:
+                    data = self._buffers.get((name, version, k, from_index, to_index))
+                    if data is None:
+                        full_data = self._buffers.get((name, version, k, 0, None))
+                        if full_data is not None:
+                            data = full_data[from_index:to_index]
+                    if data is None:
+                        missing.append(k)
+                    else:
+                        result[k] = data
+                        self._shared += 1
+            if len(missing) == 0:
+                return result
+        tmp = numpy_store.get(name, version, from_index,
+                              to_index, keys=missing if keys is not None else None)
+        with self._lock:
+            for k, v in tmp.items():
+                if v is None:
+                    continue
+                self._bytes_read += v.nbytes
+                # a read-only view so that the array of the numpy store itself is not changed
+                v = v.view()
+                v.setflags(write=False)
+                self._buffers[(name, version, k, from_index, to_index)] = v
+                result[k] = v
+        return result
+
+    def get_statistics(self):
+        """ Return the statistics of the registry
+
+        Returns:
+            dict -- dictionary containing the number of bytes read from the numpy store, the number of shared arrays and the number of arrays alive
+        """
+
+        with self._lock:
+            return {'bytes_read': self._bytes_read, 'shared': self._shared, 'buffers': len(self._buffers)}
+
+
+class _PreprocessedData(RepoObject):
+    """ Object storing the result of applying a chain of preprocessors to data
+    """
+
+    def __init__(self, repo_info, x_data, x_coord_names, fitted_preprocessors=None):
+        """ Constructor
+
+        Args:
+            repo_info (dict or RepoInfo): repo info
+            x_data (numpy array): the preprocessed x_data
+            x_coord_names (list of str): the coordinate names of the preprocessed data
+            fitted_preprocessors (list or None): the preprocessors fitted on the data. Defaults to None.
+        """
+
+        super(_PreprocessedData, self).__init__(repo_info)
+        self.x_data = x_data
+        self.x_coord_names = x_coord_names
+        self.fitted_preprocessors = fitted_preprocessors
+        self.nbytes = int(x_data.nbytes)
+        self.repo_info[RepoInfoKey.BIG_OBJECTS] = ['x_data']
+
+
+class PreprocessingCache:
+    """ Cache of preprocessed data shared by the training and evaluation jobs.
+
+    The results of applying a chain of preprocessors to a DataSet or RawData are stored in the repo (the preprocessed data in the numpy store)
+    under the name ``preprocessing_cache`` (without commit infos, so that they do not show up in the commits), so that jobs running in 
+    other processes can use them, too. An entry is found by a key 
+    which is a hash of the data name and version and of the names and versions of all objects defining the preprocessing. The key of a training 
+    entry contains the fitting functions (and the entry the fitted preprocessors), the key of an evaluation entry contains the fitted 
+    preprocessors themselves so that models sharing the same preprocessing share the entries.
+
+    If the cache exceeds the maximal size or number of entries, the least recently used entries are deleted (entries not used by this 
+    process are ordered by their creation time).
+    """
+
+    NAME = 'preprocessing_cache'
+
+    def __init__(self, ml_repo, max_size=0, max_entries=None):
+        """ Constructor
+
+        Args:
+            ml_repo (MLRepo): the repo storing the cache entries
+            max_size (int): maximal size of the cached data in bytes, if zero or less the cache is disabled. Defaults to 0.
+            max_entries (int or None): maximal number of entries, if None the number is not bounded. Defaults to None.
+        """
+
+        self._ml_repo = ml_repo
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self._last_used = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def is_enabled(self):
+        """ Returns True if the cache is enabled
+
+        Returns:
+            bool -- True if the cache is enabled, False otherwise
+        """
+
+        return self.max_size > 0
+
+    @staticmethod
+    def get_object_hash(obj):
+        """ Returns a hash of an object (e.g. a fitted preprocessor) identifying its content
+
+        Args:
+            obj (object): the object
+
+        Returns:
+            str or None -- the hash or None if the object cannot be pickled
+        """
+
+        try:
+            return hashlib.sha256(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+        except Exception as e:
+            logger.debug('Object cannot be hashed: ' + str(e))
+            return None
+
+    def get_key(self, data, preprocessing):
+        """ Returns the key of the preprocessed data
+
+        Args:
+            data (RawData or DataSet): the data which is preprocessed
+            preprocessing (list): json serializable description (names, versions, hashes) of the preprocessing steps
+
+        Returns:
+            str -- the key
+        """
+
+        items = [data.repo_info[RepoInfoKey.NAME],
+                 data.repo_info[RepoInfoKey.VERSION]]
+        if isinstance(data, DataSet):
+            # the DataSet may refer to the latest version of the RawData
+            raw_data = self._ml_repo.get(data.raw_data, data.raw_data_version)
+            items.extend([raw_data.repo_info[RepoInfoKey.NAME],
+                          raw_data.repo_info[RepoInfoKey.VERSION]])
+        items.append(preprocessing)
+        return hashlib.md5(json.dumps(items, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key_name, key):
+        """ Return the cached preprocessed data
+
+        Args:
+            key_name (str): the kind of key, i.e. 'fit_key' for training or 'transform_key' for evaluation entries
+            key (str): the key
+
+        Returns:
+            _PreprocessedData or None -- the preprocessed data or None if it is not cached
+        """
+
+        if not self.is_enabled():
+            return None
+        result = self._ml_repo.get(PreprocessingCache.NAME, version=None, modifier_versions={key_name: key}, full_object=True,
+                                   throw_error_not_exist=False, throw_error_not_unique=False)
+        if isinstance(result, list):
+            # an entry may have been added concurrently by another process
+            result = result[0] if len(result) > 0 else None
+        if result is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        self._last_used[result.repo_info[RepoInfoKey.VERSION]
+                        ] = PreprocessingCache._now()
+        return result
+
+    def add(self, key_name, key, x_data, x_coord_names, fitted_preprocessors=None):
+        """ Add preprocessed data to the cache
+
+        Entries are deleted afterwards if the cache exceeds its maximal size or number of entries.
+
+        Args:
+            key_name (str): the kind of key, i.e. 'fit_key' for training or 'transform_key' for evaluation entries
+            key (str): the key
+            x_data (numpy array): the preprocessed x_data
+            x_coord_names (list of str): the coordinate names of the preprocessed data
+            fitted_preprocessors (list or None): the preprocessors fitted on the data. Defaults to None.
+        """
+
+        if not self.is_enabled() or not isinstance(x_data, np.ndarray) or x_data.nbytes > self.max_size:
+            return
+        entry = _PreprocessedData({RepoInfoKey.NAME: PreprocessingCache.NAME, RepoInfoKey.MODIFICATION_INFO: {key_name: key},
+                                   RepoInfoKey.CATEGORY: 'CACHED_VALUE'}, x_data, x_coord_names, fitted_preprocessors)
+        # cache entries are not committed so that they do not show up in the commits of the repo
+        version = self._ml_repo._add_without_commit(entry)
+        self._last_used[version] = PreprocessingCache._now()
+        self._evict()
+
+    @staticmethod
+    def _now():
+        """ Returns the current time in UTC, comparable to the time included in the versions
+        """
+
+        return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+    def _evict(self):
+        """ Delete the least recently used entries until the cache does not exceed its maximal size and number of entries
+        """
+
+        entries = self._ml_repo.get(PreprocessingCache.NAME, version=None, obj_fields=['nbytes'],
+                                    throw_error_not_exist=False, throw_error_not_unique=False)
+        if not isinstance(entries, list):
+            entries = [entries]
+        entries = sorted([(self._last_used.get(x.repo_info[RepoInfoKey.VERSION], repo_store._time_from_version(x.repo_info[RepoInfoKey.VERSION])),
+                           x.repo_info[RepoInfoKey.VERSION], x.nbytes) for x in entries])
+        size = sum(x[2] for x in entries)
+        while len(entries) > 1 and (size > self.max_size or (self.max_entries is not None and len(entries) > self.max_entries)):
+            _, version, nbytes = entries.pop(0)
+            self._ml_repo.delete(PreprocessingCache.NAME, version)
+            self._last_used.pop(version, None)
+            size -= nbytes
+            self._evictions += 1
+
+    def get_statistics(self):
+        """ Return the statistics of the cache
+
+        Returns:
+            dict -- dictionary containing number of hits, misses and evictions
+        """
+
+        return {'hits': self._hits, 'misses': self._misses, 'evictions': self._evictions,
+                'max_size': self.max_size, 'max_entries': self.max_entries}
@@ -5,12 +5,14 @@ This module contains pailab's machine learning repository.
 import abc
 import json
 import os
+import time
 from datetime import datetime
 from numpy import linalg
 from numpy import inf, load
 import numpy as np
 from enum import Enum
-from copy import deepcopy
+from copy import copy, deepcopy
+from contextlib import contextmanager
 from types import SimpleNamespace
 import logging
 import pailab.ml_repo.repo_objects as repo_objects
@@ -18,6 +20,7 @@ from pailab.ml_repo.repo_objects import RepoInfoKey, RawData, DataSet, MeasureCo
 from pailab.ml_repo.repo_objects import repo_object_init, RepoInfo, RepoObject  # pylint: disable=E0401
 import pailab.ml_repo.repo_store as repo_store
 from pailab.ml_repo.repo_store_factory import RepoStoreFactory, NumpyStoreFactory
+from pailab.ml_repo.object_cache import RepoObjectCache, DataSetBuffers, PreprocessingCache
 from pailab.job_runner.job_runner_factory import JobRunnerFactory
 
 logger = logging.getLogger(__name__)
@@ -315,6 +318,43 @@ class Job(RepoObject, abc.ABC):
                 self.modification_info[obj.repo_info[RepoInfoKey.NAME]
                                        ] = obj.repo_info[RepoInfoKey.VERSION]
 
+        def add_chunked(self, obj, numpy_chunks, message):
+            """ Add an object whose big objects are written block by block, see :py:meth:`MLRepo._add_chunked`
+
+            Args:
+                obj (RawData): The object to add containing the first block of rows
+                numpy_chunks (iterable of numpy dict): the blocks of rows appended to the big objects of the object
+                message (str): A commit message
+            """
+
+            self.ml_repo._add_chunked(obj, numpy_chunks, message)
+            self.modification_info[obj.repo_info[RepoInfoKey.NAME]
+                                   ] = obj.repo_info[RepoInfoKey.VERSION]
+
+        def get_data_chunks(self, name, version=None, chunk_size=10000):
+            """ Get the data of a RawData or DataSet in blocks of rows, see :py:meth:`MLRepo._get_data_chunks`
+
+            Args:
+                name (str): The name of the data
+                version (str): An explicit version of the data can be returned. Defaults to None.
+                chunk_size (int): the number of rows of a block. Defaults to 10000.
+
+            Returns:
+                generator of RawData or DataSet -- the blocks of rows
+            """
+
+            obj = self.get(name, version)
+            return self.ml_repo._get_data_chunks(name, obj.repo_info[RepoInfoKey.VERSION], chunk_size)
+
+        def get_preprocessing_cache(self):
+            """ Return the cache of preprocessed data
+
+            Returns:
+                PreprocessingCache -- the preprocessing cache
+            """
+
+            return self.ml_repo.get_preprocessing_cache()
+
         def get_training_data(self, obj_version, full_object, model=None, model_version=repo_store.RepoStore.LAST_VERSION):
             """ Get the training data
 
@@ -448,7 +488,7 @@ class EvalJob(Job):
 
     def __init__(self, model, data, user, eval_function_version=repo_store.RepoStore.LAST_VERSION,
                  model_version=repo_store.RepoStore.LAST_VERSION, data_version=repo_store.RepoStore.LAST_VERSION,
-                 repo_info=RepoInfo()):
+                 repo_info=RepoInfo(), chunk_size=None):
         """ Init function for the EvalJob
 
         Args:
@@ -459,6 +499,8 @@ class EvalJob(Job):
             model_version (str): version of the model. Defaults to repo_store.RepoStore.LAST_VERSION.
             data_version (str): version of the data. Defaults to repo_store.RepoStore.LAST_VERSION.
             repo_info ([type]): [description]}). Defaults to RepoInfo().
+            chunk_size (int): if not None, the data is read, preprocessed and evaluated in blocks of chunk_size rows and the results are appended 
+                block by block so that the data does not need to fit into memory, otherwise the data is evaluated at once. Defaults to None.
         """
 
         super(EvalJob, self).__init__(repo_info)
@@ -468,48 +510,107 @@ class EvalJob(Job):
         self.eval_function_version = eval_function_version
         self.model_version = model_version
         self.data_version = data_version
+        self.chunk_size = chunk_size
         # list of jobids which must have been run before this job should be excuted
         self.predecessors = []
 
-    def _run(self, repo, jobid):
-        """ Run the job with data from the given repo
+    @staticmethod
+    def _get_preprocessing(repo, model):
+        """ Returns the preprocessing steps of a model
 
         Args:
-            repo (MLrepository): repository used to get and store the data
-            jobid (str): the job id to be executed
+            repo (MLrepository): repository used to get the data
+            model (Model): the calibrated model
+
+        Returns:
+            list of tuples -- list of the transforming function, the preprocessing parameter, a flag if the preprocessor is fitted, the fitted preprocessor
+                and the description of the step used as key of the preprocessing cache (None if the fitted preprocessor cannot be hashed)
         """
 
-        logging.info('Start evaluation job ' + str(jobid) + ' on model ' +
-                     self.model + ' ' + str(self.model_version) + ' ')
-        model = repo.get(self.model, self.model_version, full_object=True)
-        model_definition_name = self.model.split('/')[0]
-        model_def_version = model.repo_info[RepoInfoKey.MODIFICATION_INFO][model_definition_name]
-        model_definition = repo.get(model_definition_name, model_def_version)
+        preprocessing = []
+        if model.preprocessors is None:
+            return preprocessing
+        for k in range(len(model.preprocessors)):
+            prepro = model.preprocessors[k]
+            transforming_func = repo.get(
+                prepro.transforming_function, model.repo_info.modification_info[prepro.transforming_function])
+            prepro_param = None
+            if not prepro.preprocessing_param == None:
+                prepro_param = repo.get(
+                    prepro.preprocessing_param, model.repo_info.modification_info[prepro.preprocessing_param])
+            step = [transforming_func.repo_info.name, transforming_func.repo_info.version, None, None, None]
+            if prepro_param is not None:
+                step[2:4] = [prepro_param.repo_info.name,
+                             prepro_param.repo_info.version]
+            fitted_preprocessor = None
+            if prepro.fitting_function is not None:
+                fitted_preprocessor = model.fitted_preprocessors[k]
+                step[4] = PreprocessingCache.get_object_hash(
+                    fitted_preprocessor)
+                if step[4] is None:
+                    step = None
+            preprocessing.append((transforming_func.create(), prepro_param,
+                                  prepro.fitting_function is not None, fitted_preprocessor, step))
+        return preprocessing
 
-        data = repo.get(self.data, self.data_version, full_object=True)
-        eval_func = repo.get(model_definition.eval_function,
-                             self.eval_function_version)
+    @staticmethod
+    def _preprocess(data, preprocessing, cache=None):
+        """ Apply the preprocessing steps to the data
+
+        Args:
+            data (RawData or DataSet): the data
+            preprocessing (list of tuples): the preprocessing steps as returned by _get_preprocessing
+            cache (PreprocessingCache): if not None, the preprocessed data is taken from or stored in the cache. Defaults to None.
+
+        Returns:
+            tuple of numpy array and list of str -- the preprocessed x_data and its coordinate names
+        """
+
+        key = None
+        if cache is not None and cache.is_enabled() and all(x[4] is not None for x in preprocessing):
+            key = cache.get_key(data, [x[4] for x in preprocessing])
+            entry = cache.get('transform_key', key)
+            if entry is not None:
+                return entry.x_data, entry.x_coord_names
+        x_data = data.x_data
+        x_coord_names = data.x_coord_names
+        for transforming_func, prepro_param, fitted, fitted_preprocessor, _ in preprocessing:
+            if fitted:
+                x_data, x_coord_names = transforming_func(
+                    prepro_param, x_data, x_coord_names, fitted_preprocessor)
+            else:
+                x_data, x_coord_names = transforming_func(
+                    prepro_param, x_data, x_coord_names)
+        if key is not None:
+            cache.add('transform_key', key, x_data, x_coord_names)
+        return x_data, x_coord_names
+
+    @staticmethod
+    def _evaluate(model, data, eval_function, preprocessing, cache=None):
+        """ Apply the preprocessing and the evaluation function to the data
+
+        Args:
+            model (Model): the calibrated model
+            data (RawData or DataSet): the data to evaluate, the x_data is replaced by the preprocessed data
+            eval_function (function): the evaluation function
+            preprocessing (list of tuples): the preprocessing steps as returned by _get_preprocessing
+            cache (PreprocessingCache): the cache of the preprocessed data, if None the cache is not used. Defaults to None.
+
+        Raises:
+            Exception: raises an exception if no y_coord_names are defined and they cannot be derived from the x_coord_names
+
+        Returns:
+            tuple of numpy array and list of str -- the evaluation result and its coordinate names
+        """
 
         x_data = data.x_data
         x_coord_names = data.x_coord_names
         if model.preprocessors is not None:
-            for k in range(len(model.preprocessors)):
-                prepro = model.preprocessors[k]
-                transforming_func = repo.get(
-                    prepro.transforming_function, model.repo_info.modification_info[prepro.transforming_function])
-                prepro_param = None
-                if not prepro.preprocessing_param == None:
-                    prepro_param = repo.get(
-                        prepro.preprocessing_param, model.repo_info.modification_info[prepro.preprocessing_param])
-                if prepro.fitting_function is not None:
-                    x_data, x_coord_names = transforming_func.create()(
-                        prepro_param, x_data, x_coord_names, model.fitted_preprocessors[k])
-                else:
-                    x_data, x_coord_names = transforming_func.create()(
-                        prepro_param, x_data, x_coord_names)
+            x_data, x_coord_names = EvalJob._preprocess(
+                data, preprocessing, cache)
             data.x_data = x_data
             data.x_coord_names = x_coord_names
-        y = eval_func.create()(model, data)
+        y = eval_function(model, data)
         y_name = data.y_coord_names
         if y_name is None:
             # if y_name is None, we just use the x-coord names (maybe we have an autoencoder?)
@@ -517,6 +618,39 @@ class EvalJob(Job):
                 y_name = x_coord_names
             else:
                 raise Exception('No y_coord_names defined.')
+        return y, y_name
+
+    def _run(self, repo, jobid):
+        """ Run the job with data from the given repo
+
+        Args:
+            repo (MLrepository): repository used to get and store the data
+            jobid (str): the job id to be executed
+        """
+
+        logging.info('Start evaluation job ' + str(jobid) + ' on model ' +
+                     self.model + ' ' + str(self.model_version) + ' ')
+        model = repo.get(self.model, self.model_version, full_object=True)
+        model_definition_name = self.model.split('/')[0]
+        model_def_version = model.repo_info[RepoInfoKey.MODIFICATION_INFO][model_definition_name]
+        model_definition = repo.get(model_definition_name, model_def_version)
+
+        if self.chunk_size is None:
+            data = repo.get(self.data, self.data_version, full_object=True)
+        else:
+            data_chunks = repo.get_data_chunks(
+                self.data, self.data_version, self.chunk_size)
+            data = next(data_chunks)
+        eval_func = repo.get(model_definition.eval_function,
+                             self.eval_function_version)
+        eval_function = eval_func.create()
+        preprocessing = EvalJob._get_preprocessing(repo, model)
+
+        cache = None
+        if self.chunk_size is None:
+            cache = repo.get_preprocessing_cache()
+        y, y_name = EvalJob._evaluate(
+            model, data, eval_function, preprocessing, cache)
         result = repo_objects.RawData(y, y_name, repo_info={
             RepoInfoKey.NAME: MLRepo.get_eval_name(model_definition, data),
             RepoInfoKey.CATEGORY: MLObjectType.EVAL_DATA.value
@@ -535,8 +669,13 @@ class EvalJob(Job):
             NamingConventions.TrainingParam(model=model_definition_name))
         if training_param_name in model.repo_info.modification_info.keys():
             result.repo_info.modification_info[training_param_name] = model.repo_info.modification_info[training_param_name]
-        repo.add(result, 'evaluate data ' +
-                 self.data + ' with model ' + self.model)
+        message = 'evaluate data ' + self.data + ' with model ' + self.model
+        if self.chunk_size is None:
+            repo.add(result, message)
+        else:
+            y_chunks = ({'x_data': RawData._cast_data_to_numpy(EvalJob._evaluate(model, chunk, eval_function, preprocessing)[0])}
+                        for chunk in data_chunks)
+            repo.add_chunked(result, y_chunks, message)
         logging.info('Finished evaluation job ' + str(jobid))
 
     def get_modifier_versions(self, repo):
@@ -664,8 +803,8 @@ class TrainingJob(Job):
                 raise Exception(
                     'Number of preprocessors and their parameter versions does not match.')
 
+            steps = []
             for k in range(num_preprocessors):
-                logger.info('Apply preprocessor ' + model.preprocessors[k])
                 preprocessor = repo.get(
                     model.preprocessors[k], preprocessor_versions[k])
                 preprocessors_modification_info[preprocessor.repo_info.name] = preprocessor.repo_info.version
@@ -679,27 +818,48 @@ class TrainingJob(Job):
                     preprocessors_modification_info[prepro_param.repo_info.name] = prepro_param.repo_info.version
                 else:
                     prepro_param = None
-
+                fitting_func = None
                 if preprocessor.fitting_function is not None:
                     fitting_func = repo.get(
                         preprocessor.fitting_function, preprocessor_fitting_function_versions[k])
                     preprocessors_modification_info[fitting_func.repo_info.name] = fitting_func.repo_info.version
-                    fitted_preprocessor = fitting_func.create()(prepro_param, x_data, x_coord_names)
-                    x_data, x_coord_names_new = transforming_func.create()(
-                        prepro_param, x_data, x_coord_names, fitted_preprocessor)
-                    fitted_preprocessors.append(fitted_preprocessor)
-                else:
-                    fitting_func = None
-                    x_data, x_coord_names_new = transforming_func.create()(
-                        prepro_param, x_data, x_coord_names)
-                    fitted_preprocessors.append(None)
-                if set(x_coord_names_new) == set(x_coord_names):
-                    preprocessor_output_columns.append(None)
-                else:
-                    preprocessor_output_columns.append(x_coord_names_new)
-                    x_coord_names = x_coord_names_new
+                steps.append((preprocessor, transforming_func,
+                              prepro_param, fitting_func))
                 #_add_modification_info(preprocessor, transforming_func, prepro_param, fitting_func)
                 list_preprocessors.append(preprocessor)
+
+            # the preprocessed training data and the fitted preprocessors are shared with other models using the same preprocessing
+            cache = repo.get_preprocessing_cache()
+            cache_key = None
+            cached = None
+            if cache.is_enabled():
+                cache_key = cache.get_key(train_data, [[[x.repo_info.name, x.repo_info.version] if x is not None else None for x in step]
+                                                       for step in steps])
+                cached = cache.get('fit_key', cache_key)
+            if cached is not None:
+                x_data = cached.x_data
+                x_coord_names = cached.x_coord_names
+                fitted_preprocessors = cached.fitted_preprocessors
+            else:
+                for preprocessor, transforming_func, prepro_param, fitting_func in steps:
+                    logger.info('Apply preprocessor ' + preprocessor.repo_info.name)
+                    if fitting_func is not None:
+                        fitted_preprocessor = fitting_func.create()(prepro_param, x_data, x_coord_names)
+                        x_data, x_coord_names_new = transforming_func.create()(
+                            prepro_param, x_data, x_coord_names, fitted_preprocessor)
+                        fitted_preprocessors.append(fitted_preprocessor)
+                    else:
+                        x_data, x_coord_names_new = transforming_func.create()(
+                            prepro_param, x_data, x_coord_names)
+                        fitted_preprocessors.append(None)
+                    if set(x_coord_names_new) == set(x_coord_names):
+                        preprocessor_output_columns.append(None)
+                    else:
+                        preprocessor_output_columns.append(x_coord_names_new)
+                        x_coord_names = x_coord_names_new
+                if cache_key is not None:
+                    cache.add('fit_key', cache_key, x_data,
+                              x_coord_names, fitted_preprocessors)
             train_data.x_data = x_data
             train_data.x_coord_names = x_coord_names
         # calibration
@@ -1050,6 +1210,159 @@ class NamingConventions:
     Test = Name('model/*/test_name/data', 'tests')
 
 
+class _MemoizedRepo:
+    """ Wrapper of an MLRepo memoizing the results of get
+
+    It is used to determine the modifier versions of many jobs at once where the same objects (e.g. the model or the model definition)
+    are retrieved for each job. The returned objects are shared and must not be modified.
+    """
+
+    def __init__(self, ml_repo):
+        self._ml_repo = ml_repo
+        self._results = {}
+
+    def get(self, name, *args, **kwargs):
+        key = (name, args, tuple(sorted(kwargs.items())))
+        try:
+            if key in self._results:
+                return self._results[key]
+        except TypeError:  # unhashable arguments
+            return self._ml_repo.get(name, *args, **kwargs)
+        self._results[key] = self._ml_repo.get(name, *args, **kwargs)
+        return self._results[key]
+
+    def __getattr__(self, attr):
+        return getattr(self._ml_repo, attr)
+
+
+class RawDataAppender:
+    """ Buffered appending of rows to a RawData object
+
+    Rows appended by :py:meth:`append` are buffered in memory and written in batches, so that data arriving in small pieces at high
+    frequency (e.g. production data) can be fed into the repo continuously. Each flush appends all buffered rows to the numpy store at once 
+    and commits the new version of the RawData together with the new versions of all DataSets following the RawData (DataSets 
+    referring to the latest or the previous version of the RawData without an end index) in one transaction.
+
+    The appender must be the only writer appending to the RawData. It can be used as context manager flushing the remaining rows on exit.
+
+    Example:
+        Append rows of a stream in batches of 10000 rows::
+
+            >> with ml_repo.raw_data_appender('raw_data/production', batch_size=10000) as appender:
+            >>     for x, y in stream:
+            >>         appender.append(x, y)
+    """
+
+    def __init__(self, ml_repo, name, batch_size=10000, max_delay=None):
+        """ Constructor
+
+        Args:
+            ml_repo (MLRepo): the repo containing the RawData
+            name (str): name of the RawData
+            batch_size (int or None): the buffered rows are written if their number reaches batch_size, if None they are only written by 
+                :py:meth:`flush`. Defaults to 10000.
+            max_delay (float or None): if not None, the buffered rows are also written by :py:meth:`append` if the oldest buffered row is older 
+                than max_delay seconds. Defaults to None.
+        """
+
+        self._ml_repo = ml_repo
+        self._name = name
+        self._batch_size = batch_size
+        self._max_delay = max_delay
+        self._raw_data = ml_repo.get(name, full_object=False)
+        # the DataSets which may follow the RawData, they are determined only once
+        self._data_sets = []
+        for category in [MLObjectType.TRAINING_DATA, MLObjectType.TEST_DATA]:
+            for data_set_name in ml_repo.get_names(category):
+                data_set = ml_repo.get(data_set_name)
+                if isinstance(data_set, DataSet) and data_set.raw_data == name:
+                    self._data_sets.append(data_set_name)
+        self._x_data = []
+        self._y_data = []
+        self._n_buffered = 0
+        self._first_buffered = None
+
+    def append(self, x_data, y_data=None):
+        """ Append rows to the RawData
+
+        Args:
+            x_data (numpy array): the x_data to append
+            y_data (numpy array): the y_data to append. Defaults to None.
+
+        Raises:
+            Exception: If the data is not consistent to the RawData (e.g. different number of x-coordinates) it throws an exception.
+
+        Returns:
+            str or None -- the new version of the RawData if the buffered rows have been written, None otherwise
+        """
+
+        x_data = RawData._cast_data_to_numpy(x_data)
+        y_data = RawData._cast_data_to_numpy(y_data)
+        if len(self._raw_data.x_coord_names) != x_data.shape[1]:
+            raise Exception(
+                'Number of columns of x_data of RawData object is not equal to number of columns of additional x_data.')
+        if self._raw_data.y_coord_names is None and y_data is not None:
+            raise Exception(
+                'RawData object does not contain y_data but y_data is given')
+        if self._raw_data.y_coord_names is not None:
+            if y_data is None:
+                raise Exception(
+                    'RawData object has y_data but no y_data is given')
+            if y_data.shape[1] != len(self._raw_data.y_coord_names):
+                raise Exception(
+                    'Number of columns of y_data of RawData object is not equal to number of columns of additional y_data.')
+            if y_data.shape[0] != x_data.shape[0]:
+                raise Exception(
+                    'Number of rows of x_data and y_data are not equal.')
+            self._y_data.append(y_data)
+        self._x_data.append(x_data)
+        self._n_buffered += x_data.shape[0]
+        if self._first_buffered is None:
+            self._first_buffered = time.time()
+        if (self._batch_size is not None and self._n_buffered >= self._batch_size) or \
+                (self._max_delay is not None and time.time() - self._first_buffered >= self._max_delay):
+            return self.flush()
+        return None
+
+    def flush(self, message=None):
+        """ Write the buffered rows
+
+        Args:
+            message (str): commit message, if None an automated message is created. Defaults to None.
+
+        Returns:
+            str or None -- the new version of the RawData or None if no rows were buffered
+        """
+
+        if self._n_buffered == 0:
+            return None
+        numpy_dict = {'x_data': np.concatenate(self._x_data)}
+        if len(self._y_data) > 0:
+            numpy_dict['y_data'] = np.concatenate(self._y_data)
+        if message is None:
+            message = 'append ' + \
+                str(self._n_buffered) + ' rows to RawData ' + self._name
+        version = self._ml_repo._append_rows(
+            self._raw_data, numpy_dict, self._data_sets, message)
+        self._x_data = []
+        self._y_data = []
+        self._n_buffered = 0
+        self._first_buffered = None
+        return version
+
+    def close(self):
+        """ Write the buffered rows
+        """
+
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 class MLRepo:
 
     """ Repository for doing machine learning
@@ -1067,6 +1380,42 @@ class MLRepo:
 
     """
 
+    # categories of objects which are updated without incrementing the version and must therefore not be cached
+    _UNCACHED_CATEGORIES = {MLObjectType.JOB.value,
+                            MLObjectType.MAPPING.value, MLObjectType.TEST.value}
+
+    @staticmethod
+    def _is_cacheable(repo_dict):
+        """ Returns True if the object of the given dictionary may be cached
+
+        Objects which are updated without incrementing the version, i.e. the mapping and all jobs (whatever category they have been added with)
+        are not cacheable.
+
+        Args:
+            repo_dict (dict): the object dictionary
+
+        Returns:
+            bool -- True if the object may be cached, False otherwise
+        """
+
+        repo_info = repo_dict['repo_info']
+        category = repo_info[RepoInfoKey.CATEGORY.value]
+        if isinstance(category, MLObjectType):
+            category = category.value
+        if category in MLRepo._UNCACHED_CATEGORIES:
+            return False
+        classname = repo_info.get(RepoInfoKey.CLASSNAME.value)
+        if classname is None:
+            return True
+        parts = classname.split('.')
+        try:
+            m = __import__('.'.join(parts[:-1]))
+            for comp in parts[1:]:
+                m = getattr(m, comp)
+        except (ImportError, AttributeError):
+            return False
+        return not (isinstance(m, type) and issubclass(m, Job))
+
     @staticmethod
     def __create_default_config(user, workspace):
         if user is None:
@@ -1086,6 +1435,12 @@ class MLRepo:
                     'config': {
                         'throw_job_error': True
                     }
+                },
+                'object_cache': {
+                    'max_size': 64*1024*1024
+                },
+                'preprocessing_cache': {
+                    'max_size': 0
                 }
                 }
 
@@ -1143,12 +1498,19 @@ class MLRepo:
                 self._config['name'] = name
                 self._save_config()  # we save the config
 
+        # lock shared between processes writing to the same repo, set by job runners executing jobs in other processes
+        self._write_lock = None
         self._numpy_repo = NumpyStoreFactory.get(
             self._config['numpy_store']['type'], **self._config['numpy_store']['config'])
         self._ml_repo = RepoStoreFactory.get(
             self._config['repo_store']['type'], **self._config['repo_store']['config'])
         self._job_runner = JobRunnerFactory.get(
             self._config['job_runner']['type'], self, **self._config['job_runner']['config'])
+        self._object_cache = RepoObjectCache(
+            **self._config.get('object_cache', {}))
+        self._data_set_buffers = DataSetBuffers()
+        self._preprocessing_cache = PreprocessingCache(
+            self, **self._config.get('preprocessing_cache', {}))
         self._user = self._config['user']
 
         # check if the ml mapping is already contained in the repo, otherwise add it
@@ -1176,16 +1538,46 @@ class MLRepo:
         if save_config:
             self._save_config()
 
-    def _add(self, repo_object, message='', category=None):
-        """ Add a repo_object to the repository.
+    def _set_write_lock(self, lock):
+        """ Set a lock which is acquired for all writes to the repo
+
+        The lock is used if several processes write to the same repo (e.g. a job runner executing jobs in other processes or several
+        SQLiteJobRunner workers on the same job queue).
 
         Args:
-            repo_object (RepoObject): repo_object to be added, will be modified so that it contains the version number
+            lock (multiprocessing.RLock or other reentrant lock or None): the lock, if None, writes are not locked
+        """
+
+        self._write_lock = lock
+
+    @contextmanager
+    def _write_access(self):
+        """ Context manager for writes to the repo
+
+        If a write lock is set, it is acquired and the mapping is reloaded since it may have been changed by another process.
+        """
+
+        if self._write_lock is None:
+            yield
+            return
+        with self._write_lock:
+            repo_dict = self._ml_repo.get(
+                'repo_mapping', versions=repo_store.RepoStore.LAST_VERSION)
+            self._mapping = repo_objects.create_repo_obj(repo_dict[0])
+            yield
+
+    def _prepare_add(self, repo_object, message='', category=None):
+        """ Prepare a repo_object to be added to the repository.
+
+        Sets category, commit message, commit date and author of the object and updates the mapping.
+
+        Args:
+            repo_object (RepoObject): repo_object to be added
             message (str): commit message. Defaults to ''.
             category (MLObjectType): Category of repo_object which overwrites the objects category.. Defaults to None.
 
         Returns:
-            tuple of string and bool -- version number of object added and boolean if mapping has changed
+            tuple of dict and bool -- dictionary of the object to be stored and boolean if mapping has changed
         """
 
         if category is not None:
@@ -1197,13 +1589,40 @@ class MLRepo:
         repo_object.repo_info[RepoInfoKey.COMMIT_MESSAGE] = message
         repo_object.repo_info[RepoInfoKey.COMMIT_DATE] = str(datetime.now())
         repo_object.repo_info[RepoInfoKey.AUTHOR] = self._user
-        obj_dict = repo_objects.create_repo_obj_dict(repo_object)
-        version = self._ml_repo.add(obj_dict)
+        return repo_objects.create_repo_obj_dict(repo_object), mapping_changed
+
+    def _add_numpy_data(self, repo_object):
+        """ Add the big objects of a repo_object to the numpy store.
+
+        Args:
+            repo_object (RepoObject): repo_object which has already been added to the repository
+        """
+
         if len(repo_object.repo_info[RepoInfoKey.BIG_OBJECTS]) > 0:
             np_dict = repo_object.numpy_to_dict()
+            category = repo_object.repo_info[RepoInfoKey.CATEGORY]
+            if isinstance(category, MLObjectType):
+                category = category.value
             self._numpy_repo.add(repo_object.repo_info[RepoInfoKey.NAME],
                                  repo_object.repo_info[RepoInfoKey.VERSION],
-                                 np_dict)
+                                 np_dict, category)
+
+    def _add(self, repo_object, message='', category=None):
+        """ Add a repo_object to the repository.
+
+        Args:
+            repo_object (RepoObject): repo_object to be added, will be modified so that it contains the version number
+            message (str): commit message. Defaults to ''.
+            category (MLObjectType): Category of repo_object which overwrites the objects category.. Defaults to None.
+
+        Returns:
+            tuple of string and bool -- version number of object added and boolean if mapping has changed
+        """
+
+        obj_dict, mapping_changed = self._prepare_add(
+            repo_object, message, category)
+        version = self._ml_repo.add(obj_dict)
+        self._add_numpy_data(repo_object)
         for trigger in self._add_triggers:
             trigger()
         return version, mapping_changed
@@ -1222,10 +1641,99 @@ class MLRepo:
         """
 
         obj_dict = repo_objects.create_repo_obj_dict(job_object)
-        self._ml_repo.replace(obj_dict)
+        with self._write_access():
+            self._ml_repo.replace(obj_dict)
+        self._object_cache.invalidate(
+            job_object.repo_info[RepoInfoKey.NAME], job_object.repo_info[RepoInfoKey.VERSION])
         if len(job_object.repo_info[RepoInfoKey.BIG_OBJECTS]) > 0:
             raise Exception('Jobs with big objects cannot be updated.')
 
+    def _add_objects(self, repo_list, version, message='', category=None, commit=True):
+        """ Add the repo_objects together with a commit info to the repo store (without their numpy data).
+
+        Args:
+            repo_list (list of RepoObject): the repo_objects to be added, will be modified so that they contain the version number
+            version (str): the version of the objects
+            message (str): commit message. Defaults to ''.
+            category (MLObjectType): Category of the repo_objects which overwrites the objects category. Defaults to None.
+            commit (bool): If False, no commit info is added (used for internal objects such as cache entries). Defaults to True.
+
+        Returns:
+            tuple of dict and bool -- dictionary of names and versions of objects added and boolean if mapping has changed
+        """
+
+        result = {}
+        mapping_changed = False
+        obj_dicts = []
+        for obj in repo_list:
+            obj.repo_info.version = version
+            obj_dict, mapping_changed_tmp = self._prepare_add(
+                obj, message, category)
+            obj_dicts.append(obj_dict)
+            result[obj.repo_info[RepoInfoKey.NAME]] = version
+            mapping_changed = mapping_changed or mapping_changed_tmp
+
+        if commit:
+            commit_message = repo_objects.CommitInfo(message, self._user, result, repo_info={RepoInfoKey.CATEGORY: MLObjectType.COMMIT_INFO.value,
+                                                                                             RepoInfoKey.NAME: 'CommitInfo', RepoInfoKey.VERSION: version})
+            obj_dict, _ = self._prepare_add(commit_message)
+            obj_dicts.append(obj_dict)
+        replace_dicts = []
+        if mapping_changed:
+            replace_dicts.append(
+                repo_objects.create_repo_obj_dict(self._mapping))
+        # all objects including the commit info and the changed mapping are written at once
+        self._ml_repo.add_many(obj_dicts, replace_dicts)
+        if mapping_changed:
+            self._object_cache.invalidate(
+                self._mapping.repo_info[RepoInfoKey.NAME], self._mapping.repo_info[RepoInfoKey.VERSION])
+        return result, mapping_changed
+
+    def _add_chunked(self, repo_object, numpy_chunks, message='', category=None):
+        """ Add a repo_object whose big objects are written block by block.
+
+        The version of the repo_object is reserved up front. The big objects of the repo_object form the first block of rows, the following 
+        blocks are appended to the same version using :py:meth:`pailab.ml_repo.repo_store.NumpyStore._extend` so that only one block has to be 
+        kept in memory. The repo_object is added to the repo after all blocks have been written, if a block cannot be written, the numpy data 
+        written so far is deleted.
+
+        Args:
+            repo_object (RawData): repo_object to be added, will be modified so that it contains the version number and the total number of rows
+            numpy_chunks (iterable of numpy dict): the blocks of rows appended to the big objects of the repo_object
+            message (str): commit message. Defaults to ''.
+            category (MLObjectType): Category of repo_object which overwrites the objects category. Defaults to None.
+
+        Returns:
+            str -- version number of the object added
+        """
+
+        if category is not None:
+            repo_object.repo_info[RepoInfoKey.CATEGORY] = category
+        name = repo_object.repo_info[RepoInfoKey.NAME]
+        numpy_category = repo_object.repo_info[RepoInfoKey.CATEGORY]
+        if isinstance(numpy_category, MLObjectType):
+            numpy_category = numpy_category.value
+        numpy_dict = {k: v for k, v in repo_object.numpy_to_dict().items()
+                      if v is not None}
+        version = repo_store._version_str()
+        with self._write_access():
+            self._numpy_repo.add(name, version, numpy_dict, numpy_category)
+        try:
+            for next_numpy_dict in numpy_chunks:
+                with self._write_access():
+                    self._numpy_repo._extend(name, version, next_numpy_dict)
+                repo_object.n_data += next(iter(next_numpy_dict.values())).shape[0]
+            with self._write_access():
+                self._add_objects([repo_object], version, message, category)
+        except Exception:
+            logger.error('Adding ' + name + ' failed, deleting the numpy data written so far.')
+            with self._write_access():
+                self._numpy_repo._delete(name, version)
+            raise
+        for trigger in self._add_triggers:
+            trigger()
+        return version
+
     def add(self, repo_object, message='', category=None):
         """ Add a repo_object or list of repo objects to the repository.
 
@@ -1241,30 +1749,42 @@ class MLRepo:
             str or dictionary -- version number of object added or dictionary of names and versions of objects added
         """
 
-        version = repo_store._version_str()
-        result = {}
         repo_list = repo_object
-        mapping_changed = False
         if not isinstance(repo_list, list):
             repo_list = [repo_object]
-        if isinstance(repo_list, list):
+        with self._write_access():
+            version = repo_store._version_str()
+            result, mapping_changed = self._add_objects(
+                repo_list, version, message, category)
             for obj in repo_list:
-                obj.repo_info.version = version
-                result[obj.repo_info[RepoInfoKey.NAME]], mapping_changed_tmp = self._add(
-                    obj, message, category)
-                mapping_changed = mapping_changed or mapping_changed_tmp
-        if mapping_changed:
-            obj_dict = repo_objects.create_repo_obj_dict(self._mapping)
-            self._ml_repo.replace(obj_dict)
-
-        commit_message = repo_objects.CommitInfo(message, self._user, result, repo_info={RepoInfoKey.CATEGORY: MLObjectType.COMMIT_INFO.value,
-                                                                                         RepoInfoKey.NAME: 'CommitInfo', RepoInfoKey.VERSION: version})
-        self._add(commit_message)
+                self._add_numpy_data(obj)
+        for trigger in self._add_triggers:
+            trigger()
         if not isinstance(repo_object, list):
             if len(result) == 1 or (mapping_changed and len(result) == 2):
                 return result[repo_object.repo_info[RepoInfoKey.NAME]]
         return result
 
+    def _add_without_commit(self, repo_object):
+        """ Add a repo_object (including its numpy data) without a commit info so that it does not show up in the commits.
+
+        This is used for internal objects such as the entries of the :py:class:`pailab.ml_repo.object_cache.PreprocessingCache`.
+
+        Args:
+            repo_object (RepoObject): repo_object to be added, will be modified so that it contains the version number
+
+        Returns:
+            str -- version number of the object added
+        """
+
+        with self._write_access():
+            version = repo_store._version_str()
+            self._add_objects([repo_object], version, commit=False)
+            self._add_numpy_data(repo_object)
+        for trigger in self._add_triggers:
+            trigger()
+        return version
+
     def get_training_data(self, version=repo_store.RepoStore.LAST_VERSION, full_object=True, model=None, model_version=repo_store.RepoStore.LAST_VERSION):
         """ Returns training data for a model.
 
@@ -1379,6 +1899,77 @@ class MLRepo:
                            target_names, repo_info={RepoInfoKey.NAME: path})
         return self.add(raw_data)
 
+    def raw_data_appender(self, name, batch_size=10000, max_delay=None):
+        """ Returns an appender writing rows to a RawData in batches, see :py:class:`RawDataAppender`
+
+        Args:
+            name (str): name of the RawData
+            batch_size (int): the buffered rows are written if their number reaches batch_size. Defaults to 10000.
+            max_delay (float or None): if not None, the buffered rows are also written if the oldest buffered row is older than max_delay seconds. Defaults to None.
+
+        Returns:
+            RawDataAppender -- the appender
+        """
+
+        return RawDataAppender(self, name, batch_size, max_delay)
+
+    def append_raw_data(self, name, x_data, y_data=None, message=None):
+        """ Append rows to a RawData and update the DataSets following the RawData
+
+        Args:
+            name (str): name of the RawData
+            x_data (numpy array): the x_data to append
+            y_data (numpy array): the y_data to append. Defaults to None.
+            message (str): commit message, if None an automated message is created. Defaults to None.
+
+        Raises:
+            Exception: If the data is not consistent to the RawData (e.g. different number of x-coordinates) it throws an exception.
+
+        Returns:
+            str -- the new version of the RawData
+        """
+
+        appender = RawDataAppender(self, name, batch_size=None)
+        appender.append(x_data, y_data)
+        return appender.flush(message)
+
+    def _append_rows(self, raw_data, numpy_dict, data_sets, message=''):
+        """ Append rows to a RawData and commit the new version of the RawData and the DataSets following it at once
+
+        Args:
+            raw_data (RawData): the latest version of the RawData, will be modified so that it contains the new version and number of rows
+            numpy_dict (numpy dict): the rows to append
+            data_sets (list of str): names of DataSets which may refer to the RawData
+            message (str): commit message. Defaults to ''.
+
+        Raises:
+            Exception: raises an exception if the RawData has been changed by another writer
+
+        Returns:
+            str -- the new version of the RawData
+        """
+
+        name = raw_data.repo_info[RepoInfoKey.NAME]
+        with self._write_access():
+            old_version = raw_data.repo_info[RepoInfoKey.VERSION]
+            if self._ml_repo._replace_version_placeholder(name, repo_store.RepoStore.LAST_VERSION) != old_version:
+                raise Exception('Cannot append data because RawData ' +
+                                name + ' has been changed since version ' + old_version + '.')
+            version = repo_store._version_str()
+            self._numpy_repo.append(name, old_version, version, numpy_dict)
+            raw_data.n_data += numpy_dict['x_data'].shape[0]
+            changed = [raw_data]
+            for data_set_name in data_sets:
+                data_set = self.get(data_set_name)
+                if data_set.raw_data == name and data_set.raw_data_version in [repo_store.RepoStore.LAST_VERSION, old_version] \
+                        and (data_set.end_index is None or data_set.end_index < 0):
+                    data_set.raw_data_version = version
+                    changed.append(data_set)
+            self._add_objects(changed, version, message)
+        for trigger in self._add_triggers:
+            trigger()
+        return version
+
     def add_training_data(self, name, raw_data_name, start_index=0, end_index=None, raw_data_version='last'):
         """Add training data as a DataSet to the repository.
 
@@ -1612,6 +2203,70 @@ class MLRepo:
 
         return self._numpy_repo
 
+    def get_object_cache(self):
+        """ Return the cache of repo objects used by the ml repo
+
+        Returns:
+            RepoObjectCache -- the object cache
+        """
+
+        return self._object_cache
+
+    def get_preprocessing_cache(self):
+        """ Return the cache of preprocessed data used by the training and evaluation jobs
+
+        Returns:
+            PreprocessingCache -- the preprocessing cache
+        """
+
+        return self._preprocessing_cache
+
+    def get_data_set_statistics(self):
+        """ Return statistics about the numpy data loaded for DataSets
+
+        Returns:
+            dict -- dictionary containing the number of bytes read from the numpy store and the number of arrays shared between DataSets
+        """
+
+        return self._data_set_buffers.get_statistics()
+
+    def _get_repo_dicts(self, name, version, modifier_versions, obj_fields, repo_info_fields,
+                        throw_error_not_exist, throw_error_not_unique):
+        """ Get the dictionaries of the repo objects from the repo store.
+
+        If a single version of an object is requested (without conditions on modifiers), the object cache is used. Jobs, tests and the mapping
+        are not cached since they are updated without incrementing the version.
+
+        Args:
+            name (str): the object name
+            version (str): object version
+            modifier_versions (dict): modifier ids together with version specs which are matched by the returned object
+            obj_fields (list of str or str): fields of the object which will be returned
+            repo_info_fields (list of str or str): fields of the repo_info which will be returned
+            throw_error_not_exist (bool): true - throw error if not exists, else return []
+            throw_error_not_unique (bool): true - throw error if item is not unique, else return []
+
+        Returns:
+            list of dict -- list of the object dictionaries
+        """
+
+        if (not self._object_cache.is_enabled()) or modifier_versions is not None or obj_fields is not None \
+                or repo_info_fields is not None or version is None or isinstance(version, (tuple, list)):
+            return self._ml_repo.get(name, version, modifier_versions, obj_fields, repo_info_fields,
+                                     throw_error_not_exist, throw_error_not_unique)
+        version = self._ml_repo._replace_version_placeholder(
+            name, version, throw_error_not_exist)
+        if not isinstance(version, str):
+            return []
+        obj = self._object_cache.get(name, version)
+        if obj is not None:
+            return [obj]
+        repo_dict = self._ml_repo.get(name, version, None, None, None,
+                                      throw_error_not_exist, throw_error_not_unique)
+        if len(repo_dict) == 1 and MLRepo._is_cacheable(repo_dict[0]):
+            self._object_cache.add(name, version, repo_dict[0])
+        return repo_dict
+
     def get(self, name, version=repo_store.RepoStore.LAST_VERSION, full_object=False,
             modifier_versions=None, obj_fields=None,  repo_info_fields=None,
             throw_error_not_exist=True, throw_error_not_unique=True):
@@ -1638,8 +2293,8 @@ class MLRepo:
             logging.debug('Getting ' + name + ', version ' + str(version))
         else:
             logging.debug('Getting ' + name + ', version is None.')
-        repo_dict = self._ml_repo.get(name, version, modifier_versions, obj_fields, repo_info_fields,
-                                      throw_error_not_exist, throw_error_not_unique)
+        repo_dict = self._get_repo_dicts(name, version, modifier_versions, obj_fields, repo_info_fields,
+                                         throw_error_not_exist, throw_error_not_unique)
         if len(repo_dict) == 0:
             if throw_error_not_exist:
                 logger.error('No object found with name ' + name + ' and version ' +
@@ -1656,14 +2311,19 @@ class MLRepo:
                 raw_data = self.get(
                     result.raw_data, result.raw_data_version, False)
                 if full_object:
-                    numpy_data = self._numpy_repo.get(result.raw_data, raw_data.repo_info[RepoInfoKey.VERSION],
-                                                      result.start_index, result.end_index)
+                    # only the rows of the DataSet are read, buffers are shared with other DataSets of the same RawData version
+                    numpy_data = self._data_set_buffers.get(self._numpy_repo, result.raw_data, raw_data.repo_info[RepoInfoKey.VERSION],
+                                                            result.start_index, result.end_index, raw_data.repo_info[RepoInfoKey.BIG_OBJECTS])
                     repo_objects.repo_object_init.numpy_from_dict(
                         raw_data, numpy_data)
                 result.set_data(raw_data)
 
             numpy_dict = {}
-            if len(result.repo_info[RepoInfoKey.BIG_OBJECTS]) > 0 and full_object:
+            if len(result.repo_info[RepoInfoKey.BIG_OBJECTS]) > 0 and full_object and isinstance(result, RawData):
+                # the complete RawData is registered so that DataSets of it return views instead of reading their rows again
+                numpy_dict = self._data_set_buffers.get(self._numpy_repo, result.repo_info[RepoInfoKey.NAME], result.repo_info[RepoInfoKey.VERSION],
+                                                        keys=result.repo_info[RepoInfoKey.BIG_OBJECTS])
+            elif len(result.repo_info[RepoInfoKey.BIG_OBJECTS]) > 0 and full_object:
                 numpy_dict = self._numpy_repo.get(
                     result.repo_info[RepoInfoKey.NAME], result.repo_info[RepoInfoKey.VERSION])
             # for x in result.repo_info[RepoInfoKey.BIG_OBJECTS]:
@@ -1675,6 +2335,42 @@ class MLRepo:
             return tmp[0]
         return tmp
 
+    def _get_data_chunks(self, name, version=repo_store.RepoStore.LAST_VERSION, chunk_size=10000):
+        """ Generator returning the data of a RawData or DataSet object in blocks of rows
+
+        Only the rows of the current block are read from the numpy store so that data which does not fit into memory can be processed.
+        At least one (possibly empty) block is returned.
+
+        Args:
+            name (str): the name of the RawData or DataSet
+            version (str): the version of the object. Defaults to repo_store.RepoStore.LAST_VERSION.
+            chunk_size (int): the number of rows of a block. Defaults to 10000.
+
+        Returns:
+            generator of RawData or DataSet -- copies of the object containing the data of the respective block of rows
+        """
+
+        data = self.get(name, version, full_object=False)
+        if isinstance(data, DataSet):
+            raw_data = self.get(data.raw_data, data.raw_data_version, False)
+            start, stop, _ = slice(data.start_index, data.end_index).indices(
+                raw_data.n_data)
+        else:
+            raw_data = data
+            start, stop = 0, data.n_data
+        stop = max(start, stop)
+        raw_data_name = raw_data.repo_info[RepoInfoKey.NAME]
+        raw_data_version = raw_data.repo_info[RepoInfoKey.VERSION]
+        for block_start in range(start, max(stop, start + 1), chunk_size):
+            block_stop = min(block_start + chunk_size, stop)
+            numpy_data = self._numpy_repo.get(
+                raw_data_name, raw_data_version, block_start, block_stop)
+            chunk = copy(data)
+            for k in ['x_data', 'y_data']:
+                setattr(chunk, k, numpy_data.get(k))
+            chunk.n_data = block_stop - block_start
+            yield chunk
+
     def delete(self, name, version):
         """ Delete a specific object. 
 
@@ -1697,8 +2393,10 @@ class MLRepo:
                            k.repo_info.version for k in dependent_objects])
             raise Exception(
                 "Objects dependending on the object to be deleted, please delete these objects first, objects: " + obj_list)
-        self._ml_repo._delete(name, version)
-        self._numpy_repo._delete(name, version)
+        with self._write_access():
+            self._ml_repo._delete(name, version)
+            self._object_cache.invalidate(name, version)
+            self._numpy_repo._delete(name, version)
 
     @staticmethod
     def get_calibrated_model_name(model_name):
@@ -1818,6 +2516,46 @@ class MLRepo:
             return None
         return tmp
 
+    def check_rerun(self, jobs):
+        """ Check for a list of jobs whether they must be executed again
+
+        This is equivalent to calling check_rerun of each job but the modifier versions of all jobs are determined reusing the objects
+        retrieved from the repo and the existing jobs as well as their states are looked up at once. Note that the jobs are checked against the state of the repo
+        when this method is called, i.e. running one of the jobs does not change the result for the other jobs.
+
+        Args:
+            jobs (list of Job): the jobs to check
+
+        Returns:
+            list of bool -- for each job the info whether the job must be rerun
+        """
+
+        ml_repo = _MemoizedRepo(self)
+        result = [None]*len(jobs)
+        queries = []
+        query_jobs = []
+        for i, job in enumerate(jobs):
+            _, modifier_versions = job.get_modifier_versions(ml_repo)
+            if len(modifier_versions) == 0 or \
+                    not all([v is None or isinstance(v, (str, int)) for v in modifier_versions.values()]):
+                # version ranges are not supported by the bulk lookup
+                result[i] = job.check_rerun(self)
+                continue
+            queries.append((job.repo_info.name, modifier_versions))
+            query_jobs.append(i)
+        existing_jobs = []
+        existing_job_indices = []
+        for i, versions in zip(query_jobs, self._ml_repo.get_versions_by_modifiers(queries)):
+            if len(versions) == 0:
+                result[i] = True
+                continue
+            existing_jobs.append((jobs[i].repo_info.name, versions[-1]))
+            existing_job_indices.append(i)
+        # the states of the latest versions of all existing jobs are retrieved at once
+        for i, state in zip(existing_job_indices, self._ml_repo.get_states(existing_jobs)):
+            result[i] = state == 'error'
+        return result
+
     def run(self, job):
         """ Executes a job
 
@@ -1931,7 +2669,7 @@ class MLRepo:
             result[tmp.repo_info.name] = tmp.repo_info.version
         return result
 
-    def _create_evaluation_jobs(self, model=None, model_version=repo_store.RepoStore.LAST_VERSION, datasets={}, predecessors=[], labels=None):
+    def _create_evaluation_jobs(self, model=None, model_version=repo_store.RepoStore.LAST_VERSION, datasets={}, predecessors=[], labels=None, chunk_size=None):
         models = [(self._get_default_object_name(
             model, MLObjectType.CALIBRATED_MODEL), model_version)]
         if model is None and labels is None:
@@ -1943,20 +2681,38 @@ class MLRepo:
                 tmp = self.get(l)
                 models.append((tmp.name, tmp.version))
         datasets_ = deepcopy(datasets)
-        jobs = []
+        eval_jobs = []
         for m in models:
             if len(datasets) == 0:
                 datasets_ = self._get_datasets(m[0])
             for n, v in datasets_.items():
-                eval_job = EvalJob(m[0], n, self._user, model_version=m[1], data_version=v,
-                                   repo_info={RepoInfoKey.NAME: m[0] + '/jobs/eval_job/' + n,
-                                              RepoInfoKey.CATEGORY: MLObjectType.JOB.value})
-                if eval_job.check_rerun(self):
-                    eval_job.set_predecessor_jobs(predecessors)
-                    jobs.append(eval_job)
-                # else:
-                #    logger.info('Skip running ' + eval_job.repo_info.name + ' has already been run on the specified data, job version: ' + tmp.repo_info.version)
-        return jobs
+                eval_jobs.append(EvalJob(m[0], n, self._user, model_version=m[1], data_version=v,
+                                         repo_info={RepoInfoKey.NAME: m[0] + '/jobs/eval_job/' + n,
+                                                    RepoInfoKey.CATEGORY: MLObjectType.JOB.value}, chunk_size=chunk_size))
+        for eval_job in eval_jobs:
+            eval_job.set_predecessor_jobs(predecessors)
+        return eval_jobs
+
+    def _get_jobs_to_rerun(self, jobs):
+        """ Return the jobs which must be rerun, checking the jobs lazily so that jobs can be added/run in between
+
+        All jobs are checked at once by check_rerun. Jobs with the same name as a previous job (e.g. for the same model referenced by a label)
+        may be affected by running the previous job and are therefore checked again when they are reached.
+
+        Args:
+            jobs (list of Job): the jobs
+
+        Returns:
+            generator of Job -- the jobs which must be rerun
+        """
+
+        names = set()
+        for job, rerun in zip(jobs, self.check_rerun(jobs)):
+            if job.repo_info.name in names:
+                rerun = job.check_rerun(self)
+            names.add(job.repo_info.name)
+            if rerun:
+                yield job
 
     # def run_jobs(self, job, modifier_versions={}):
     #     """Runs jobs matching a regular expression.
@@ -1984,7 +2740,7 @@ class MLRepo:
     #             jobs_to_run.append(job)
 
     def run_evaluation(self, model=None, message=None, model_version=repo_store.RepoStore.LAST_VERSION,
-                       datasets={}, predecessors=[], run_descendants=False, labels=None):
+                       datasets={}, predecessors=[], run_descendants=False, labels=None, chunk_size=None):
         """ Evaluate the model on all datasets. 
 
         Args:
@@ -1995,26 +2751,26 @@ class MLRepo:
             predecessors (list): list of jobs which shall have been completed successfull before the evaluation is started. Default is all datasets from testdata on latest version.. Defaults to [].
             run_descendants (bool): if True also run all decendant jobs. Defaults to False.
             labels ([type]): [description]. Defaults to None.
+            chunk_size (int): if not None, the data is evaluated in blocks of chunk_size rows so that it does not need to fit into memory, see :py:class:`EvalJob`. Defaults to None.
 
         Returns:
             list of strings -- a list of the job ids
         """
 
         jobs = self._create_evaluation_jobs(
-            model, model_version, datasets, predecessors, labels=labels)
+            model, model_version, datasets, predecessors, labels=labels, chunk_size=chunk_size)
         job_ids = []
-        for job in jobs:
-            if job.check_rerun(self):
-                self.add(job)
-                self._job_runner.add(
-                    job.repo_info[RepoInfoKey.NAME], job.repo_info[RepoInfoKey.VERSION], self._user)
-                logging.info('Eval job ' + job.repo_info[RepoInfoKey.NAME] + ', version: '
-                             + str(job.repo_info[RepoInfoKey.VERSION]) + ' added to jobrunner.')
-                job_ids.append((job.repo_info[RepoInfoKey.NAME], str(
-                    job.repo_info[RepoInfoKey.VERSION])))
-                if run_descendants:
-                    self.run_measures(job.model,  'run_measures started as predecessor of run_evaluation', model_version=job.model_version, datasets={job.data: repo_store.RepoStore.LAST_VERSION},
-                                      predecessors=[(job.repo_info[RepoInfoKey.NAME], job.repo_info[RepoInfoKey.VERSION])])
+        for job in self._get_jobs_to_rerun(jobs):
+            self.add(job)
+            self._job_runner.add(
+                job.repo_info[RepoInfoKey.NAME], job.repo_info[RepoInfoKey.VERSION], self._user)
+            logging.info('Eval job ' + job.repo_info[RepoInfoKey.NAME] + ', version: '
+                         + str(job.repo_info[RepoInfoKey.VERSION]) + ' added to jobrunner.')
+            job_ids.append((job.repo_info[RepoInfoKey.NAME], str(
+                job.repo_info[RepoInfoKey.VERSION])))
+            if run_descendants:
+                self.run_measures(job.model,  'run_measures started as predecessor of run_evaluation', model_version=job.model_version, datasets={job.data: repo_store.RepoStore.LAST_VERSION},
+                                  predecessors=[(job.repo_info[RepoInfoKey.NAME], job.repo_info[RepoInfoKey.VERSION])])
 
         return job_ids
 
@@ -2058,7 +2814,7 @@ class MLRepo:
         else:
             for k, v in measures.items():
                 measures_to_run[k] = v
-        job_ids = []
+        measure_jobs = []
         for mod in models:
             if len(datasets) == 0:
                 datasets_ = self._get_datasets(mod[0])
@@ -2066,18 +2822,19 @@ class MLRepo:
                     datasets_[k] = repo_store.RepoStore.LAST_VERSION
             for n, v in datasets_.items():
                 for m_name, m in measures_to_run.items():
-                    measure_job = MeasureJob(m_name, m[0], m[1], n, mod[0], v, mod[1],
-                                             repo_info={RepoInfoKey.NAME: mod[0] + '/jobs/measure/' + n + '/' + m[0],
-                                                        RepoInfoKey.CATEGORY: MLObjectType.JOB.value})
-                    if measure_job.check_rerun(self):
-                        measure_job.set_predecessor_jobs(predecessors)
-                        self.add(measure_job)
-                        self._job_runner.add(
-                            measure_job.repo_info[RepoInfoKey.NAME], measure_job.repo_info[RepoInfoKey.VERSION], self._user)
-                        job_ids.append(
-                            (measure_job.repo_info[RepoInfoKey.NAME], measure_job.repo_info[RepoInfoKey.VERSION]))
-                        logging.info('Measure job ' + measure_job.repo_info[RepoInfoKey.NAME] + ', version: '
-                                     + str(measure_job.repo_info[RepoInfoKey.VERSION]) + ' added to jobrunner.')
+                    measure_jobs.append(MeasureJob(m_name, m[0], m[1], n, mod[0], v, mod[1],
+                                                   repo_info={RepoInfoKey.NAME: mod[0] + '/jobs/measure/' + n + '/' + m[0],
+                                                              RepoInfoKey.CATEGORY: MLObjectType.JOB.value}))
+        job_ids = []
+        for measure_job in self._get_jobs_to_rerun(measure_jobs):
+            measure_job.set_predecessor_jobs(predecessors)
+            self.add(measure_job)
+            self._job_runner.add(
+                measure_job.repo_info[RepoInfoKey.NAME], measure_job.repo_info[RepoInfoKey.VERSION], self._user)
+            job_ids.append(
+                (measure_job.repo_info[RepoInfoKey.NAME], measure_job.repo_info[RepoInfoKey.VERSION]))
+            logging.info('Measure job ' + measure_job.repo_info[RepoInfoKey.NAME] + ', version: '
+                         + str(measure_job.repo_info[RepoInfoKey.VERSION]) + ' added to jobrunner.')
         return job_ids
 
     def run_tests(self, test_definitions=None, predecessors=[]):
@@ -2099,12 +2856,11 @@ class MLRepo:
         for t in test_defs:
             tmp = self.get(t)
             tests = tmp.create(self)
-            for tt in tests:
-                if tt.check_rerun(self):
-                    self.add(tt, category=MLObjectType.TEST)
-                    self._job_runner.add(
-                        tt.repo_info.name, tt.repo_info.version, self._user)
-                    job_ids.append((tt.repo_info.name, tt.repo_info.version))
+            for tt in self._get_jobs_to_rerun(tests):
+                self.add(tt, category=MLObjectType.TEST)
+                self._job_runner.add(
+                    tt.repo_info.name, tt.repo_info.version, self._user)
+                job_ids.append((tt.repo_info.name, tt.repo_info.version))
         return job_ids
 
     def set_label(self, label_name, model=None, model_version=repo_store.RepoStore.LAST_VERSION, message=''):
@@ -843,6 +843,9 @@ class DataSet(RepoObject):
 
     def set_data(self, raw_data):
         """Set the data from the given raw_data.
+
+        The raw_data may either contain all rows (which are then cut to the rows of the DataSet) or only the rows of the DataSet
+        as returned by the numpy store.
         
         Args:
             raw_data (RawData): the raw data used to set the data from
@@ -852,13 +855,17 @@ class DataSet(RepoObject):
         
         """
 
-        if raw_data.x_data is not None:
-            setattr(self, 'x_data',raw_data.x_data) # todo more efficient implementation over numpy_repo to avoid loading all and then cutting off
-        if raw_data.y_data is not None:
-            setattr(self, 'y_data', raw_data.y_data)
+        start, stop, _ = slice(self.start_index, self.end_index).indices(raw_data.n_data)
+        n_data = max(stop - start, 0)
+        for k in ['x_data', 'y_data']:
+            data = getattr(raw_data, k, None)
+            if data is not None:
+                if data.shape[0] == raw_data.n_data:
+                    data = data[start:stop]
+                setattr(self, k, data)
         setattr(self, 'x_coord_names', raw_data.x_coord_names)
         setattr(self, 'y_coord_names', raw_data.y_coord_names)
-        setattr(self, 'n_data', raw_data.n_data)
+        setattr(self, 'n_data', n_data)
 
     def __str__(self):
         return str(self.to_dict())
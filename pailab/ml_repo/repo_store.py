@@ -1,5 +1,6 @@
 import uuid
 import datetime
+import functools
 
 import abc
 from pailab.ml_repo.repo_objects import RepoInfoKey  # pylint: disable=E0401
@@ -15,6 +16,25 @@ def _version_str():
     return str(uuid.uuid1())
 
 
+@functools.lru_cache(maxsize=65536)
+def _version_key(v):
+    """ Return the integer key of a version
+
+    The key is the timestamp included in the uuid (number of 100ns intervals since 1582-10-15). It orders the versions 
+    the same way as the time returned by :py:func:`_time_from_version` but can be compared without constructing datetime objects.
+
+    Args:
+        v (str): string representing the uuid
+
+    Returns:
+        int -- the key of the version
+    """
+
+    if isinstance(v, str):
+        return uuid.UUID(v).time
+    return v.time
+
+
 def _time_from_version(v):
     """ Return the time included in uuid
 
@@ -25,16 +45,62 @@ def _time_from_version(v):
         datetime -- the datetime
     """
 
-    if isinstance(v, str):
-        tmp = uuid.UUID(v)
-        return datetime.datetime(1582, 10, 15) + datetime.timedelta(microseconds=tmp.time / 10)
-    return datetime.datetime(1582, 10, 15) + datetime.timedelta(microseconds=v.time / 10)
+    return datetime.datetime(1582, 10, 15) + datetime.timedelta(microseconds=_version_key(v) / 10)
 
 
 FIRST_VERSION = 'first'
 LAST_VERSION = 'last'
 
 
+def _normalize_fields(fields):
+    """ Return the list of field names for a field specification used in projections
+
+    Args:
+        fields (None, str, RepoInfoKey or list thereof): the fields, None or 'all' (also as element of a list) means all fields
+
+    Returns:
+        list of str or None -- list of the field names or None if all fields are requested
+    """
+
+    if fields is None:
+        return None
+    if not isinstance(fields, (list, tuple, set)):
+        fields = [fields]
+    result = []
+    for f in fields:
+        if isinstance(f, RepoInfoKey):
+            f = f.value
+        if f == 'all' or f == 'ALL':
+            return None
+        result.append(f)
+    return result
+
+
+def _project(obj, obj_fields, repo_info_fields):
+    """ Return the projection of an object dictionary onto the given fields
+
+    Args:
+        obj (dict): the object dictionary
+        obj_fields (list of str or None): the member fields to be returned, None means all fields
+        repo_info_fields (list of str or None): the fields of the repo_info to be returned, None means all fields
+
+    Returns:
+        dict -- the dictionary containing the repo_info and the member fields (the values are not copied)
+    """
+
+    repo_info = obj['repo_info']
+    if repo_info_fields is not None:
+        repo_info = {k: repo_info[k]
+                     for k in repo_info_fields if k in repo_info}
+    result = {'repo_info': repo_info}
+    if obj_fields is None:
+        obj_fields = [k for k in obj.keys() if k != 'repo_info']
+    for k in obj_fields:
+        if k in obj:
+            result[k] = obj[k]
+    return result
+
+
 class RepoScriptStore(abc.ABC):
     @abc.abstractmethod
     def add(self, script_file):
@@ -65,25 +131,53 @@ class RepoStore(abc.ABC):
 
     """
 
-    def _replace_version_placeholder(self, name, versions, throw_error_not_exist=True):
+    def _refresh_version_index(self):
+        """ Hook called before version placeholders are resolved.
+
+        Stores keeping the versions of the objects in memory may overwrite this method to check whether the index is still up to date.
+        """
+
+        pass
+
+    def _resolve_version(self, name, version, throw_error_not_exist=True):
+        """ Resolve a version placeholder (FIRST_VERSION, LAST_VERSION or an integer offset) of an object
+
+        This method may be overwritten by subclasses to enhance performance.
+
+        Args:
+            name (str): identifier of the object
+            version (str or int): the version placeholder
+            throw_error_not_exist (bool): throw an error if not exists. Defaults to True.
+
+        Returns:
+            str -- the version
+        """
+
+        if version == FIRST_VERSION:
+            return self.get_first_version(name, throw_error_not_exist)
+        if version == LAST_VERSION:
+            return self.get_latest_version(name, throw_error_not_exist)
+        return self.get_version(name, version, throw_error_not_exist)
+
+    def _replace_version_placeholder(self, name, versions, throw_error_not_exist=True, refresh=True):
         """ replaces the version placeholder
 
         Args:
             name (str): identifier of the object
             versions (str): the version identifier
             throw_error_not_exist (bool): throw an error if not exists. Defaults to True.
+            refresh (bool): if True, the version index of the store is refreshed before the placeholders are resolved. Defaults to True.
 
         Returns:
             [type] -- list of versions
         """
 
+        if refresh:
+            self._refresh_version_index()
+
         def replace_version(name, version, throw_error_not_exist):
-            if version == FIRST_VERSION:
-                return self.get_first_version(name, throw_error_not_exist)
-            if version == LAST_VERSION:
-                return self.get_latest_version(name, throw_error_not_exist)
-            if isinstance(version, int):
-                return self.get_version(name, version, throw_error_not_exist)
+            if version == FIRST_VERSION or version == LAST_VERSION or isinstance(version, int):
+                return self._resolve_version(name, version, throw_error_not_exist)
             return version
         if isinstance(versions, str):
             versions = replace_version(name, versions, throw_error_not_exist)
@@ -124,6 +218,41 @@ class RepoStore(abc.ABC):
         self._add(obj)
         return obj['repo_info'][RepoInfoKey.VERSION.value]
 
+    def _add_many(self, objs, replace_objs=None):
+        """ Add a list of objects to the storage.
+
+        This method is called internally by the method add_many. It may be overwritten by subclasses to add all objects at once (e.g. within one transaction),
+        the default implementation simply adds the objects one after another and replaces the existing objects afterwards.
+
+        Args:
+            objs (list of RepoObject): list of repository objects
+            replace_objs (list of RepoObject): list of existing repository objects which are overwritten without incrementing their version. Defaults to None.
+        """
+
+        for obj in objs:
+            self._add(obj)
+        if replace_objs is not None:
+            for obj in replace_objs:
+                self.replace(obj)
+
+    def add_many(self, objs, replace_objs=None):
+        """ Add a list of objects to the storage.
+
+        Args:
+            objs (list of RepoObject): list of repository objects
+            replace_objs (list of RepoObject): list of existing repository objects which are overwritten (see :py:meth:`replace`) together with
+                adding the objects. Defaults to None.
+
+        Returns:
+            list of str -- the versions of the added objects
+        """
+
+        for obj in objs:
+            if obj['repo_info'][RepoInfoKey.VERSION.value] is None:
+                obj['repo_info'][RepoInfoKey.VERSION.value] = _version_str()
+        self._add_many(objs, replace_objs)
+        return [obj['repo_info'][RepoInfoKey.VERSION.value] for obj in objs]
+
     @abc.abstractmethod
     def replace(self, obj):
         """ Overwrite existing object without incrementing version
@@ -161,6 +290,70 @@ class RepoStore(abc.ABC):
                     result.append(objs)
         return result
 
+    def _get_modification_infos(self, names):
+        """ Return the versions and modification infos of all objects with the given names.
+
+        This method may be overwritten by subclasses to enhance performance.
+
+        Args:
+            names (set of str): names of the objects
+
+        Returns:
+            dict -- dictionary of object names and lists of tuples of version and modification info (ordered by version)
+        """
+
+        result = {}
+        for name in names:
+            objs = self.get(name, obj_fields=[], repo_info_fields=[RepoInfoKey.VERSION, RepoInfoKey.MODIFICATION_INFO],
+                            throw_error_not_exist=False, throw_error_not_unique=False)
+            result[name] = [(obj['repo_info'][RepoInfoKey.VERSION.value], obj['repo_info'][RepoInfoKey.MODIFICATION_INFO.value])
+                            for obj in objs]
+        return result
+
+    def get_versions_by_modifiers(self, queries):
+        """ Return the versions of objects matching the given modifier versions for many objects at once.
+
+        The modification infos of all objects are retrieved at once and matched against the modifier versions, so that this
+        is much faster than calling get with modifier_versions for each object.
+
+        Args:
+            queries (list of tuple): list of tuples of object name and dictionary of modifier names and versions. A version may be
+                a version string, a version placeholder (FIRST_VERSION, LAST_VERSION, integer offset) or None (no condition on the modifier).
+
+        Returns:
+            list of list of str -- for each query the list of versions matching the modifier versions (ordered by version)
+        """
+
+        self._refresh_version_index()
+        modification_infos = self._get_modification_infos(set([q[0] for q in queries]))
+        result = []
+        for name, modifier_versions in queries:
+            conditions = {}
+            for k, v in modifier_versions.items():
+                if v is not None:
+                    conditions[k] = str(self._replace_version_placeholder(k, v, False, refresh=False))
+            result.append([version for version, modification_info in modification_infos.get(name, [])
+                           if all(str(modification_info.get(k)) == v for k, v in conditions.items())])
+        return result
+
+    def get_states(self, objects):
+        """ Return the state member (e.g. the state of a job) of many objects at once.
+
+        This method may be overwritten by subclasses to enhance performance.
+
+        Args:
+            objects (list of tuple): list of tuples of object name and version
+
+        Returns:
+            list -- for each object the value of its state member or None if the object has no state
+        """
+
+        result = []
+        for name, version in objects:
+            obj = self.get(name, versions=version, obj_fields=['state'], repo_info_fields=[])
+            result.append(obj[0].get('state'))
+        return result
+
     def get(self, name, versions=None, modifier_versions=None, obj_fields=None,  repo_info_fields=None,
             throw_error_not_exist=True, throw_error_not_unique=True):
         """ Get a dictionary/list of dictionaries fulffilling the conditions.
@@ -176,9 +369,9 @@ class RepoStore(abc.ABC):
                     the last/first version.
             modifier_versions (dictionary): modifier ids together with version specs which are matched by the returned object.. Defaults to None.
             obj_fields (list of str or str): list of strings identifying the fields which will be returned in the dictionary,
-                                                        if None, no fields are returned, if set to 'all', all fields will be returned . Defaults to None.
+                                                        if None or set to 'all', all fields will be returned . Defaults to None.
             repo_info_fields (list of str or str): list of strings identifying the fields of the repo_info dict which will be returned in the dictionary,
-                                                        if None, no fields are returned, if set to 'all', all fields will be returned. Defaults to None.
+                                                        if None or set to 'all', all fields will be returned. Defaults to None.
             throw_error_not_exist (bool): true - throw error if not exists, else return []. Defaults to True.
             throw_error_not_unique (bool): true - throw error if item is not unique, else return []. Defaults to True.
 
@@ -191,9 +384,10 @@ class RepoStore(abc.ABC):
         if modifier_versions is not None:
             for k, v in modifier_versions.items():
                 modifier_versions[k] = self._replace_version_placeholder(
-                    k, v, throw_error_not_exist)
+                    k, v, throw_error_not_exist, refresh=False)
         return self._get(name, versions, modifier_versions,
-                         obj_fields, repo_info_fields,
+                         _normalize_fields(obj_fields), _normalize_fields(
+                             repo_info_fields),
                          throw_error_not_exist, throw_error_not_unique)
 
     def push(self):
@@ -235,9 +429,9 @@ class RepoStore(abc.ABC):
                     the last/first version.
             modifier_versions (dictionary): modifier ids together with version specs which are matched by the returned object.. Defaults to None.
             obj_fields (list of str or str): list of strings identifying the fields which will be returned in the dictionary,
-                                                        if None, no fields are returned, if set to 'all', all fields will be returned . Defaults to None.
+                                                        if None or set to 'all', all fields will be returned . Defaults to None.
             repo_info_fields (list of str or str): list of strings identifying the fields of the repo_info dict which will be returned in the dictionary,
-                                                        if None, no fields are returned, if set to 'all', all fields will be returned. Defaults to None.
+                                                        if None or set to 'all', all fields will be returned. Defaults to None.
             throw_error_not_exist (bool): true - throw error if not exists, else return []. Defaults to True.
             throw_error_not_unique (bool): true - throw error if item is not unique, else return []. Defaults to True.
 
@@ -332,13 +526,14 @@ class NumpyStore(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def add(self, name, version, numpy_dict):
+    def add(self, name, version, numpy_dict, category=None):
         """ Add numpy data from an object to the storage.
 
         Args:
             name (str): Name (as string) of object
             version (str): object version
             numpy_dict (numpy dict): numpy dictionary
+            category (str): category of the object, may be used by the storage to choose the storage layout. Defaults to None.
         """
 
         pass
@@ -356,8 +551,24 @@ class NumpyStore(abc.ABC):
 
         pass
 
+    def _extend(self, name, version, numpy_dict):
+        """ Append data to an existing version of an object without creating a new version.
+
+        This method is only internally used by the MLRepo to write the big objects of a new object block by block before the object is added.
+
+        Args:
+            name (str): name of the object
+            version (str): version of the object the data is appended to
+            numpy_dict (dict): dictionary containing the values
+
+        Raises:
+            NotImplementedError: raises an error if the storage does not support appending to an existing version
+        """
+
+        raise NotImplementedError('Appending to an existing version is not supported by ' + self.__class__.__name__ + '.')
+
     @abc.abstractmethod
-    def get(self, name, version, from_index=0, to_index=None):
+    def get(self, name, version, from_index=0, to_index=None, keys=None):
         """ get the numpy object for a name and a version, rows can be used
 
         Args:
@@ -365,6 +576,7 @@ class NumpyStore(abc.ABC):
             version (str): version of the object
             from_index (int): the index from which the data should be taken. Defaults to 0.
             to_index (int or None): the index to which the data is returned (None means till the end). Defaults to None.
+            keys (list of str or None): the keys of the numpy dictionary to be returned (None means all keys). Defaults to None.
 
         Returns:
             numpy array -- the numpy object to return
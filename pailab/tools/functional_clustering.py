@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 """This module contains functions for functional clustering. 
 """
+import inspect
 import logging
 import numpy as np
 from collections import defaultdict
@@ -77,36 +78,49 @@ def _get_landmarks(f, landmark_type, rel_tol=0.001):
     return result
 
 
-def _compute_similarity_matrix(f):
-    result = np.ones((f.shape[0], f.shape[0],))
-    dx_f = f[:, 1:]-f[:, :-1]
-    d = np.sqrt(np.sum(dx_f*dx_f, axis=1))
+def _compute_similarity_matrix(f, g=None, dtype=np.float64, max_block_size=10000000):
+    """Return the similarity between the functions of f and g measured by the cosine of the angle between their increments.
 
-    for i in range(f.shape[0]):
-        for j in range(i, f.shape[0]):
-            if d[i] < 0.00001 or d[j] < 0.00001:
-                if d[j] > 0.0001 or d[i] > 0.0001:
-                    # no similarity: Constant and non-constant
-                    result[i, j] = 0.0
-                else:
-                    # very similar since both seem to be constants
-                    result[i, j] = 0.98
-            else:
-                result[i, j] = np.minimum(
-                    np.dot(dx_f[i, :], dx_f[j, :])/(d[i]*d[j]), 1.0)
-                result[j, i] = result[i, j]
-    return result
+    The increments are normalized once and the similarities are computed by a matrix product over blocks of rows. Two (nearly) constant
+    functions have similarity 0.98, a constant and a non-constant function have similarity 0.
+
+    Args:
+        f (numpy matrix): Each row contains the function values of a function.
+        g (numpy matrix, optional): Each row contains the function values of a function, if None, g is set to f. Defaults to None.
+        dtype (numpy dtype, optional): Floating point type of the computation and the result, e.g. np.float32 to halve the memory. Defaults to np.float64.
+        max_block_size (int, optional): Maximal number of entries of the result computed at once. Defaults to 10000000.
 
+    Returns:
+        numpy matrix: Matrix whose entry (i,j) contains the similarity between the i-th function of f and the j-th function of g.
+    """
+    def normalized_increments(f):
+        dx_f = np.diff(f, axis=1).astype(dtype, copy=False)
+        d = np.sqrt(np.einsum('ij,ij->i', dx_f, dx_f))
+        constant = d < 0.00001
+        dx_f = dx_f / np.where(constant, 1.0, d).astype(dtype)[:, np.newaxis]
+        dx_f[constant] = 0.0
+        return dx_f, constant, d > 0.0001
 
-def _compute_similarity(dx_f1, dx_f2, d1, d2):
-    if d1 < 0.00001 or d2 < 0.00001:
-        if d1 > 0.0001 or d2 > 0.0001:
-            # no similarity: Constant and non-constant
-            return 0.0
-        else:
-            # very similar since both seem to be constants
-            return 0.98
-    return np.minimum(np.dot(dx_f1, dx_f2)/(d1*d2), 1.0)
+    dx_f, constant_f, non_constant_f = normalized_increments(f)
+    if g is None:
+        dx_g, constant_g, non_constant_g = dx_f, constant_f, non_constant_f
+    else:
+        dx_g, constant_g, non_constant_g = normalized_increments(g)
+    result = np.empty((dx_f.shape[0], dx_g.shape[0],), dtype=dtype)
+    block_rows = max(1, max_block_size // max(1, dx_g.shape[0]))
+    for start in range(0, dx_f.shape[0], block_rows):
+        end = min(start + block_rows, dx_f.shape[0])
+        block = result[start:end]
+        np.dot(dx_f[start:end], dx_g.T, out=block)
+        np.minimum(block, 1.0, out=block)
+        constant = constant_f[start:end, np.newaxis] | constant_g[np.newaxis, :]
+        non_constant = non_constant_f[start:end,
+                                      np.newaxis] | non_constant_g[np.newaxis, :]
+        # no similarity: Constant and non-constant
+        block[constant & non_constant] = 0.0
+        # very similar since both seem to be constants
+        block[constant & ~non_constant] = 0.98
+    return result
 
 
 def agglomerative(f,
@@ -115,7 +129,23 @@ def agglomerative(f,
                   random_state=42,
                   gridwidth=0.01,
                   rel_tol=0.001,
+                  dtype=np.float64,
+                  max_block_size=10000000,
                   **sklearnArg):
+    """Cluster the functions by agglomerative clustering of the functions with the same number of local minima, using the angle between the increments of the functions as distance.
+
+    Args:
+        f (numpy matrix): Matrix containing in each row the function values of a function.
+        n_clusters (int, optional): Number of clusters for the functions with the same number of local minima. Defaults to 10.
+        rel_tol (float, optional): Relative tolerance used to determine the local minima. Defaults to 0.001.
+        dtype (numpy dtype, optional): Floating point type of the similarity matrices, np.float32 halves the memory needed. Defaults to np.float64.
+        max_block_size (int, optional): Maximal number of entries of a similarity matrix computed at once. Defaults to 10000000.
+
+    Returns:
+        numpy vector: Vector where each value defines the corresponding cluster of the respective function.
+        numpy matrix: Contains in each row the similarity to each cluster center for the respective function.
+        numpy matrix: Contains in each row a cluster center.
+    """
     result = np.empty((f.shape[0],))
 
     local_minimum = defaultdict(list)
@@ -130,13 +160,18 @@ def agglomerative(f,
         logger.debug('Start clustering for ' + str(len(v)) + ' functions with ' +
                      str(k) + ' local minima.')
         f_sub = f[v, :]
-        similarity_matrix = _compute_similarity_matrix(f_sub)
-        distance_matrix = np.sqrt(1.0-similarity_matrix)
+        # the similarity matrix is transformed inplace into the distance matrix
+        distance_matrix = _compute_similarity_matrix(
+            f_sub, dtype=dtype, max_block_size=max_block_size)
+        np.subtract(1.0, distance_matrix, out=distance_matrix)
+        np.sqrt(distance_matrix, out=distance_matrix)
 
         if len(v) > n_clusters:
+            # the affinity argument has been renamed to metric in sklearn 1.2
+            distance_arg = 'metric' if 'metric' in inspect.signature(
+                AgglomerativeClustering).parameters else 'affinity'
             clustering = AgglomerativeClustering(
-                affinity='precomputed', linkage='average',
-                n_clusters=n_clusters, **sklearnArg)
+                linkage='average', n_clusters=n_clusters, **{distance_arg: 'precomputed'}, **sklearnArg)
             clusters = clustering.fit_predict(distance_matrix)
         else:
             clusters = np.zeros(shape=(len(v),))
@@ -156,13 +191,8 @@ def agglomerative(f,
         c_centers.append(cluster_centers)
     cluster_centers = np.concatenate(c_centers)
 
-    cluster_distance = np.empty((f.shape[0], cluster_centers.shape[0],))
-    dx_f = f[:, 1:]-f[:, :-1]
-    d = np.sqrt(np.sum(dx_f*dx_f, axis=1))
-    for i in range(f.shape[0]):
-        for j in range(cluster_centers.shape[0]):
-            cluster_distance[i, j] = _compute_similarity(
-                dx_f[i, :], dx_f[j, :], d[i], d[j])
+    cluster_distance = _compute_similarity_matrix(
+        f, f[cluster_centers, :], dtype=dtype, max_block_size=max_block_size)
     return result, cluster_distance, f[cluster_centers, :]
 
 
@@ -2,6 +2,7 @@
 """This module contains functions for model agnostic interpretation methods. 
 """
 
+import concurrent.futures
 import numpy as np
 from pailab.ml_repo.repo_objects import RepoObject, RawData, RepoInfoKey
 from pailab.tools.tools import ml_cache
@@ -25,9 +26,11 @@ except ImportError:
 @ml_cache
 def _compute_ice(data, model_eval_function, model,
                  y_coordinate, x_coordinate,
-                 x_values, start_index=0, end_index=-1, scale=''):
+                 x_values, start_index=0, end_index=-1, scale='', max_block_size=1000000, n_jobs=1):
     """Independent conditional expectation plot
 
+    The input for all rows and x-values is constructed in blocks of rows and the evaluation function is called once per block.
+
     Args:
         data ([type]): [description]
         model_eval_function ([type]): [description]
@@ -40,28 +43,30 @@ def _compute_ice(data, model_eval_function, model,
                                 dividing the vector of the y-values of the ICE by the respective vector norm defined by scaling.
                                 The scaling must be one of numpy's valid strings for linalg.norm's ord parameter. If string is empty, no scaling will be applied.
                                 Defaults to ''. 
+        max_block_size (int, optional): Maximal number of entries of the input matrix of one call of the evaluation function, determines the number of rows
+                                evaluated at once (but at least one row is evaluated at once). Defaults to 1000000.
+        n_jobs (int, optional): Number of threads evaluating the blocks in parallel. Defaults to 1.
     Returns:
         [type]: [description]
     """
     x_data = data.x_data[start_index:end_index, :]
-
-    # compute input for evaluation
-    shape = (x_data.shape[0], len(x_values),)  # x_data.shape[1:]
-    _x_data = np.empty(shape=(len(x_values), ) + x_data.shape[1:])
-    eval_data = RawData(_x_data, [str(i) for i in range(x_data.shape[1])])
-    result = np.empty(shape)
+    n_rows = x_data.shape[0]
+    n_values = len(x_values)
+    x_values = np.asarray(x_values, dtype=float)
+    x_coord_names = [str(i) for i in range(x_data.shape[1])]
+    result = np.empty((n_rows, n_values,))
     eval_f = model_eval_function.create()
-    nom = 1.0
-    if isinstance(scale, str):
-        use_scaling = False
-    else:
-        use_scaling = True
-
-    for i in range(x_data.shape[0]):
-        for j in range(len(x_values)):
-            eval_data.x_data[j] = x_data[i]
-            eval_data.x_data[j, x_coordinate] = x_values[j]
-        tmp = eval_f(model, eval_data)
+    block_rows = max(1, max_block_size //
+                     max(1, n_values * int(np.prod(x_data.shape[1:]))))
+
+    def _compute_block(start):
+        end = min(start + block_rows, n_rows)
+        # the row i*n_values + j of the input contains the i-th row of the data with the x_coordinate set to the j-th x-value
+        eval_x_data = np.repeat(np.asarray(
+            x_data[start:end], dtype=float), n_values, axis=0)
+        eval_x_data[:, x_coordinate] = np.tile(x_values, end - start).reshape(
+            (-1,) + (1,) * (eval_x_data.ndim - 2))
+        tmp = eval_f(model, RawData(eval_x_data, x_coord_names))
         if len(tmp.shape) > 1:
             y = tmp[:, y_coordinate]
         elif y_coordinate == 0:
@@ -69,9 +74,19 @@ def _compute_ice(data, model_eval_function, model,
         else:
             raise Exception(
                 'Evaluation data is just an array but y_coordinate > 0.')
-        if use_scaling:
-            nom = 1.0 / max(np.linalg.norm(y, ord=scale), 1e-10)
-        result[i] = nom * y
+        result[start:end] = y.reshape((end - start, n_values))
+
+    starts = range(0, n_rows, block_rows)
+    if n_jobs > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            # list is used to raise the exceptions of the blocks
+            list(executor.map(_compute_block, starts))
+    else:
+        for start in starts:
+            _compute_block(start)
+    if not isinstance(scale, str):
+        nom = 1.0 / np.maximum(np.linalg.norm(result, ord=scale, axis=1), 1e-10)
+        result *= nom[:, np.newaxis]
     return result
 
 
@@ -175,7 +190,7 @@ class ICE_Results:
 def _compute_and_cluster_ice(data, model_eval_function, model,
                              y_coordinate, x_coordinate,
                              x_values, start_index=0, end_index=-1, scale='',
-                             n_clusters=20, random_state=42, clustering_param=None):
+                             n_clusters=20, random_state=42, clustering_param=None, max_block_size=1000000, n_jobs=1):
     """[summary]
 
     Args:
@@ -188,6 +203,8 @@ def _compute_and_cluster_ice(data, model_eval_function, model,
         start_index (int, optional): [description]. Defaults to 0.
         end_index (int, optional): [description]. Defaults to -1.
         clustering_param (dict or None, optional): Default to None
+        max_block_size (int, optional): Maximal number of entries of the input matrix of one call of the evaluation function. Defaults to 1000000.
+        n_jobs (int, optional): Number of threads evaluating the blocks in parallel. Defaults to 1.
 
     Returns:
         list of doubles: the x-values used to compute ICE
@@ -201,7 +218,7 @@ def _compute_and_cluster_ice(data, model_eval_function, model,
     if isinstance(y_coordinate, str):
         y_coordinate = data.y_coord_names.index(y_coordinate)
     ice = _compute_ice(data, model_eval_function, model, y_coordinate, x_coordinate, x_values,
-                       start_index=start_index, end_index=end_index, scale=scale)
+                       start_index=start_index, end_index=end_index, scale=scale, max_block_size=max_block_size, n_jobs=n_jobs)
     labels = None
     cluster_centers = None
     distance_to_clusters = None
@@ -214,7 +231,7 @@ def _compute_and_cluster_ice(data, model_eval_function, model,
 def compute_ice(ml_repo, x_values, data, model=None, model_label=None, model_version=RepoStore.LAST_VERSION,
                 data_version=RepoStore.LAST_VERSION, y_coordinate=0, x_coordinate=0,
                 start_index=0, end_index=-1, cache=False,
-                clustering_param=None, scale=''):
+                clustering_param=None, scale='', max_block_size=1000000, n_jobs=1):
     """Compute individual conditional expectation (ice) for a given dataset and model
 
     Args:
@@ -236,6 +253,9 @@ def compute_ice(ml_repo, x_values, data, model=None, model_label=None, model_ver
                                 dividing the vector of the y-values of the ICE by the respective vector norm defined by scaling.
                                 The scaling must be one of numpy's valid strings for linalg.norm's ord parameter. If string is empty, no scaling will be applied.
                                 Defaults to ''. 
+        max_block_size (int, optional): Maximal number of entries of the input matrix of one call of the model's evaluation function. The ICE is computed 
+                                in blocks of rows so that the input of one block does not exceed this size. Defaults to 1000000.
+        n_jobs (int, optional): Number of threads evaluating the blocks in parallel. Defaults to 1.
 
     Returns:
         ICE_Results: result object containing all relevant data (including functional clustering)
@@ -258,7 +278,8 @@ def compute_ice(ml_repo, x_values, data, model=None, model_label=None, model_ver
     result.x_values, result.ice, result.labels, result.cluster_centers, result.distance_to_clusters = _compute_and_cluster_ice(data_, model_eval_f, model_,  y_coordinate,
                                                                                                                                x_coordinate=x_coordinate, x_values=x_values,
                                                                                                                                start_index=start_index, end_index=end_index, cache=cache_,
-                                                                                                                               clustering_param=clustering_param, scale=scale)
+                                                                                                                               clustering_param=clustering_param, scale=scale,
+                                                                                                                               max_block_size=max_block_size, n_jobs=n_jobs)
     result.x_coord_name = data_.x_coord_names[x_coordinate]
     result.y_coord_name = data_.y_coord_names[y_coordinate]
     result.data_name = data_.repo_info.name
@@ -269,9 +290,100 @@ def compute_ice(ml_repo, x_values, data, model=None, model_label=None, model_ver
     return result
 
 
-def _compute_MMD_square(X, Y=None, metric='rbf', k_XX=None, k_YY=None, **kwds):
+def _kernel_sum(X, Y=None, metric='rbf', max_block_size=10000000, **kwds):
+    """Return the sum of all entries of the kernel matrix between X and Y without storing the full kernel matrix.
+
+    Args:
+        X (numpy nd-array): X points (each row representing one point).
+        Y (numpy nd-array, optional): Y points, if None the kernel matrix of X is used. Defaults to None.
+        metric (str or callable, optional): The metric to use when calculating kernel between instances in a feature array. Defaults to 'rbf'.
+        max_block_size (int, optional): Maximal number of entries of the kernel matrix computed at once. Defaults to 10000000.
+        **kwds: optional keyword parameters that are passed directly to the kernel function.
+
+    Returns:
+        float: The sum of the kernel matrix.
+    """
+    if metric == 'precomputed' and Y is None:
+        return X.sum()
+    if Y is None:
+        Y = X
+    block_rows = max(1, max_block_size // max(1, Y.shape[0]))
+    result = 0.0
+    for start in range(0, X.shape[0], block_rows):
+        result += pairwise_kernels(X[start:start+block_rows],
+                                   Y, metric=metric, **kwds).sum()
+    return result
+
+
+def _paired_kernels(X, Y, metric='rbf', block_size=256, **kwds):
+    """Return the kernel values k(X[i], Y[i]) of all pairs of rows of X and Y.
+
+    Args:
+        X (numpy nd-array): X points (each row representing one point).
+        Y (numpy nd-array): Y points with the same number of rows as X.
+        metric (str or callable, optional): The metric to use when calculating kernel between instances in a feature array. Defaults to 'rbf'.
+        block_size (int, optional): Number of pairs evaluated at once. Defaults to 256.
+        **kwds: optional keyword parameters that are passed directly to the kernel function.
+
+    Returns:
+        numpy vector: The kernel values.
+    """
+    result = np.empty(X.shape[0])
+    for start in range(0, X.shape[0], block_size):
+        result[start:start+block_size] = np.diag(pairwise_kernels(X[start:start+block_size], Y[start:start+block_size],
+                                                                  metric=metric, **kwds))
+    return result
+
+
+def _mean_random_fourier_features(X, metric='rbf', n_features=100, max_block_size=10000000, random_state=42, gamma=None):
+    """Return the mean of the random Fourier features of the given points.
+
+    The inner product of the random Fourier features approximates the rbf kernel :math:`\exp(-\gamma\|x-y\|_2^2)` or the laplacian kernel 
+    :math:`\exp(-\gamma\|x-y\|_1)` (see A. Rahimi, B. Recht, Random Features for Large-Scale Kernel Machines), so that the MMD can be approximated 
+    by the distance of the mean features. The features depend only on random_state, the dimension of X, gamma and n_features.
+
+    Args:
+        X (numpy nd-array): X points (each row representing one point).
+        metric (str, optional): Either 'rbf' or 'laplacian'. Defaults to 'rbf'.
+        n_features (int, optional): Number of random features. Defaults to 100.
+        max_block_size (int, optional): Maximal number of entries of the feature matrix computed at once. Defaults to 10000000.
+        random_state (int, optional): Seed of the random features. Defaults to 42.
+        gamma (float, optional): Parameter of the kernel, if None 1/number of columns of X is used (as in sklearn). Defaults to None.
+
+    Raises:
+        Exception: If the metric is not supported.
+
+    Returns:
+        numpy vector: The mean of the random features.
+    """
+    if gamma is None:
+        gamma = 1.0/X.shape[1]
+    random = np.random.RandomState(random_state)
+    if metric == 'rbf':
+        W = random.normal(scale=np.sqrt(2.0*gamma),
+                          size=(X.shape[1], n_features))
+    elif metric == 'laplacian':
+        W = gamma*random.standard_cauchy(size=(X.shape[1], n_features))
+    else:
+        raise Exception('Random Fourier features are only supported for the metrics rbf and laplacian, not for ' + str(metric) + '.')
+    b = random.uniform(0.0, 2.0*np.pi, size=n_features)
+    block_rows = max(1, max_block_size // n_features)
+    result = np.zeros(n_features)
+    for start in range(0, X.shape[0], block_rows):
+        result += np.cos(X[start:start+block_rows].dot(W) + b).sum(axis=0)
+    return np.sqrt(2.0/n_features)*result/X.shape[0]
+
+
+def _compute_MMD_square(X, Y=None, metric='rbf', k_XX=None, k_YY=None, estimator='quadratic', max_block_size=10000000, n_features=100,
+                        random_state=42, **kwds):
     """Compute the Maximum Mean Dicreapency (MMD) to measure how close two distributions are.
 
+    The kernel matrices are never stored, their sums are accumulated over blocks of rows. Three estimators are supported:
+
+    - 'quadratic': The (biased) estimator using all pairs of points, its costs grow quadratically with the number of points.
+    - 'linear': The unbiased linear time estimator of A. Gretton et al., A Kernel Two-Sample Test, using disjoint pairs of randomly ordered points.
+    - 'rff': The distance of the mean random Fourier features of X and Y (only for the metrics 'rbf' and 'laplacian'), its costs grow linearly with the number of points.
+
     Args:
         X (numpy nd-array): X points used to approximate first distribution. 
         Y (numpy nd-array): Y points used to approximate second distribution. 
@@ -282,35 +394,74 @@ def _compute_MMD_square(X, Y=None, metric='rbf', k_XX=None, k_YY=None, **kwds):
             The callable should take two arrays from X as input and return a value indicating the distance between them. 
             Currently, sklearn provides the following strings: ‘additive_chi2’, ‘chi2’, ‘linear’, ‘poly’, ‘polynomial’, ‘rbf’,
                                                 ‘laplacian’, ‘sigmoid’, ‘cosine’ 
+        k_XX (float or numpy vector, optional): The statistic of X returned by this method if Y is None, if None it is computed. Defaults to None.
+        k_YY (float or numpy vector, optional): The statistic of Y returned by this method if Y is None, if None it is computed. Defaults to None.
+        estimator (str, optional): The estimator, either 'quadratic', 'linear' or 'rff'. Defaults to 'quadratic'.
+        max_block_size (int, optional): Maximal number of entries of the kernel (or feature) matrices computed at once. Defaults to 10000000.
+        n_features (int, optional): Number of random Fourier features used by the estimator 'rff'. Defaults to 100.
+        random_state (int, optional): Seed used for the random order of the estimator 'linear' and the random features of the estimator 'rff'. Defaults to 42.
         **kwds: optional keyword parameters
             Any further parameters are passed directly to the kernel function.
 
     Returns:
-        float: The squared MDM computed by [description]
+        float: The squared MDM or, if Y is None, the statistic of X which can be reused as k_XX (the mean kernel value for the estimator 
+            'quadratic' and the mean random features for the estimator 'rff')
     """
     if not has_sklearn:
         raise Exception(
             'This method needs functionality form sklearn but sklearn is not installed.')
+    if estimator == 'linear':
+        if Y is None:
+            return None
+        n_pairs = min(X.shape[0], Y.shape[0]) // 2
+        if n_pairs == 0:
+            raise Exception(
+                'The linear MMD estimator needs at least two X and Y points.')
+        random = np.random.RandomState(random_state)
+        x = X[random.permutation(X.shape[0])[:2*n_pairs]]
+        y = Y[random.permutation(Y.shape[0])[:2*n_pairs]]
+        h = _paired_kernels(x[0::2], x[1::2], metric=metric, **kwds) + _paired_kernels(y[0::2], y[1::2], metric=metric, **kwds) \
+            - _paired_kernels(x[0::2], y[1::2], metric=metric, **kwds) - \
+            _paired_kernels(x[1::2], y[0::2], metric=metric, **kwds)
+        return h.mean()
+    if estimator == 'rff':
+        if k_XX is None:
+            k_XX = _mean_random_fourier_features(X, metric=metric, n_features=n_features, max_block_size=max_block_size,
+                                                 random_state=random_state, **kwds)
+        if Y is None:
+            return k_XX
+        if k_YY is None:
+            k_YY = _mean_random_fourier_features(Y, metric=metric, n_features=n_features, max_block_size=max_block_size,
+                                                 random_state=random_state, **kwds)
+        return ((k_XX - k_YY)**2).sum()
+    if estimator != 'quadratic':
+        raise Exception('Unknown MMD estimator ' + str(estimator) + '.')
     m = float(X.shape[0])
 
     if k_XX is None:
-        k_XX = pairwise_kernels(X, metric=metric, **kwds).sum()/(m**2)
+        k_XX = _kernel_sum(X, metric=metric,
+                           max_block_size=max_block_size, **kwds)/(m**2)
     if Y is None:
         return k_XX
     n = float(Y.shape[0])
     if k_YY is None:
-        k_YY = pairwise_kernels(Y, metric=metric, **kwds).sum()/(n**2)
-    k_XY = pairwise_kernels(X, Y=Y, metric=metric, **kwds).sum()/(m*n)
+        k_YY = _kernel_sum(Y, metric=metric,
+                           max_block_size=max_block_size, **kwds)/(n**2)
+    k_XY = _kernel_sum(X, Y, metric=metric,
+                       max_block_size=max_block_size, **kwds)/(m*n)
     return k_XX + k_YY - 2.0*k_XY
 
 
-def _get_MMD2_X_vs_X_percentile(X, Y,  percentile=0.1, scale=True, metric='rbf', **kwds):
+def _get_MMD2_X_vs_X_percentile(X, Y,  percentile=0.1, scale=True, metric='rbf', estimator='quadratic', n_jobs=1, **kwds):
     """This method compares the distribution of X and of values of X whose indices belong to the respective percentile of Y.
 
+    The statistic of each column of X (see _compute_MMD_square) and the sorted indices of each column of Y are computed only once and reused for 
+    all columns and percentiles.
+
     Args:
         X (ndarray): X values for which the squared Maximum Mean Discrepancy to the subset of X described by indices defined as percentile of Y is computed.
         Y (ndarray): Y values used to compute indices belonging to the percentile.
-        percentile (float, optional): The percentile used. Defaults to 0.1.
+        percentile (float or list of float, optional): The percentile or a list of percentiles used. Defaults to 0.1.
         scale (bool, optional): If True, the x-values are scaled to zero mean and unit variance. Defaults to True.
         metric (str or callable, optional): The metric to use when calculating kernel between instances in a feature array.
             If metric is a string, it must be one of the metrics in sklearn.metrics.pairwise.PAIRWISE_KERNEL_FUNCTIONS. 
@@ -319,39 +470,49 @@ def _get_MMD2_X_vs_X_percentile(X, Y,  percentile=0.1, scale=True, metric='rbf',
             The callable should take two arrays from X as input and return a value indicating the distance between them. 
             Currently, sklearn provides the following strings: ‘additive_chi2’, ‘chi2’, ‘linear’, ‘poly’, ‘polynomial’, ‘rbf’,
                                                 ‘laplacian’, ‘sigmoid’, ‘cosine’ 
-        **kwds: optional keyword parameters that are passed directly to the kernel function.
+        estimator (str, optional): The MMD estimator, either 'quadratic', 'linear' or 'rff' (see _compute_MMD_square). Defaults to 'quadratic'.
+        n_jobs (int, optional): Number of threads computing the columns of X in parallel. Defaults to 1.
+        **kwds: optional keyword parameters that are passed directly to _compute_MMD_square and the kernel function.
 
     Returns:
-        ndarray: Numpy nd array containing the respective squared MMD between the diffrent distributions.
+        ndarray: Numpy nd array containing the respective squared MMD between the diffrent distributions. If a list of percentiles is given, 
+            the first index of the array denotes the percentile.
     """
-    result = np.empty([X.shape[1], Y.shape[1]])
+    percentiles = percentile if isinstance(
+        percentile, (list, tuple)) else [percentile]
+    result = np.empty([len(percentiles), X.shape[1], Y.shape[1]])
     if scale:
         _X = preprocessing.StandardScaler().fit_transform(X)
     else:
         _X = X
-    k_xx = [0]*X.shape[1]
-    for i in range(X.shape[1]):
-        tmp = np.reshape(_X[:, i], (X.shape[0], 1, ))
-        #print('tmp: ' + str(tmp))
-        k_xx[i] = _compute_MMD_square(tmp, metric=metric, **kwds)
-
-    for i in range(Y.shape[1]):
-        sorted_indices = np.argsort(Y[:, i])
-        i_start = int((1.0-percentile)*len(sorted_indices))
-        indices = sorted_indices[i_start:]
-        #print('x_percentile: ' + str(x_percentile))
+    sorted_indices = [np.argsort(Y[:, i]) for i in range(Y.shape[1])]
+
+    def _compute_column(j):
+        x = np.reshape(_X[:, j], (X.shape[0], 1, ))
+        k_xx = _compute_MMD_square(
+            x, metric=metric, estimator=estimator, **kwds)
+        for i in range(Y.shape[1]):
+            for k, p in enumerate(percentiles):
+                i_start = int((1.0-p)*len(sorted_indices[i]))
+                x_percentile = x[sorted_indices[i][i_start:]]
+                result[k, j, i] = _compute_MMD_square(
+                    x, x_percentile, k_XX=k_xx, metric=metric, estimator=estimator, **kwds)
+
+    if n_jobs > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            # list is used to raise the exceptions of the columns
+            list(executor.map(_compute_column, range(X.shape[1])))
+    else:
         for j in range(X.shape[1]):
-            x_percentile = np.reshape(_X[indices, j], (len(indices), 1, ))
-            #k_yy = _compute_MMD_square(x_percentile, metric = metric, **kwds)
-            x = np.reshape(_X[:, j], (len(sorted_indices), 1, ))
-            #print('k_xx: ' + str(k_xx[i]) + '   k_yy: ' + str(k_yy))
-            result[j, i] = _compute_MMD_square(
-                x, x_percentile, k_XX=k_xx[j], metric=metric, **kwds)
-    return result
+            _compute_column(j)
+    if isinstance(percentile, (list, tuple)):
+        return result
+    return result[0]
 
 
 @ml_cache
-def _get_MMD2_X_vs_abs_ptw_error_percentile(X, Y_pred, x_coords=None, y_coords=None, percentile=0.1, scale=True, metric='rbf', **kwds):
+def _get_MMD2_X_vs_abs_ptw_error_percentile(X, Y_pred, x_coords=None, y_coords=None, percentile=0.1, scale=True, metric='rbf', estimator='quadratic',
+                                            n_jobs=1, **kwds):
     """This method compares the distribution of X and of values of the pointwise absolut errors between Y_target and Y_pred.
 
     Args:
@@ -366,7 +527,9 @@ def _get_MMD2_X_vs_abs_ptw_error_percentile(X, Y_pred, x_coords=None, y_coords=N
             The callable should take two arrays from X as input and return a value indicating the distance between them. 
             Currently, sklearn provides the following strings: ‘additive_chi2’, ‘chi2’, ‘linear’, ‘poly’, ‘polynomial’, ‘rbf’,
                                                 ‘laplacian’, ‘sigmoid’, ‘cosine’ 
-        **kwds: optional keyword parameters that are passed directly to the kernel function.
+        estimator (str, optional): The MMD estimator, either 'quadratic', 'linear' or 'rff' (see _compute_MMD_square). Defaults to 'quadratic'.
+        n_jobs (int, optional): Number of threads computing the x-coordinates in parallel. Defaults to 1.
+        **kwds: optional keyword parameters that are passed directly to _compute_MMD_square and the kernel function.
 
     Returns:
         ndarray: Numpy nd array containing the respective squared MMD between the diffrent distributions.
@@ -376,27 +539,85 @@ def _get_MMD2_X_vs_abs_ptw_error_percentile(X, Y_pred, x_coords=None, y_coords=N
     else:
         ptw_error = np.abs(X.y_data[:, y_coords] - Y_pred.x_data[:, y_coords])
     if x_coords is None:
-        return _get_MMD2_X_vs_X_percentile(X.x_data, ptw_error, percentile=percentile, scale=scale, metric=metric, **kwds)
+        return _get_MMD2_X_vs_X_percentile(X.x_data, ptw_error, percentile=percentile, scale=scale, metric=metric,
+                                           estimator=estimator, n_jobs=n_jobs, **kwds)
     else:
-        return _get_MMD2_X_vs_X_percentile(X.x_data[:, x_coords], ptw_error, percentile=percentile, scale=scale, metric=metric, **kwds)
+        return _get_MMD2_X_vs_X_percentile(X.x_data[:, x_coords], ptw_error, percentile=percentile, scale=scale, metric=metric,
+                                           estimator=estimator, n_jobs=n_jobs, **kwds)
 
 
-def _compute_MMD2(X, prototypes, metric='rbf', **kwds):
-    kernel_matrix = pairwise_kernels(X, metric=metric, **kwds)
+def _compute_MMD2(X, prototypes, metric='rbf', max_block_size=10000000, **kwds):
     m = float(len(prototypes))
-    n = float(kernel_matrix.shape[0])
-    #print('kernel_matrix.sum()/(n**2): ' + str(kernel_matrix.sum()/(n**2)))
-    #print('kernel_matrix[np.ix_(prototypes, prototypes)].sum()/(m**2): ' + str(kernel_matrix[np.ix_(prototypes, prototypes)].sum()/(m**2)))
-    #print('2.0*kernel_matrix[prototypes, :].sum()/(m*n): ' + str(2.0*kernel_matrix[prototypes, :].sum()/(m*n)))
-    return kernel_matrix.sum()/(n**2) + kernel_matrix[np.ix_(prototypes, prototypes)].sum()/(m**2) - 2.0*kernel_matrix[prototypes, :].sum()/(m*n)
+    n = float(X.shape[0])
+    if metric == 'precomputed':
+        return X.sum()/(n**2) + X[np.ix_(prototypes, prototypes)].sum()/(m**2) - 2.0*X[prototypes, :].sum()/(m*n)
+    return _kernel_sum(X, metric=metric, max_block_size=max_block_size, **kwds)/(n**2) \
+        + _kernel_sum(X[prototypes], metric=metric, max_block_size=max_block_size, **kwds)/(m**2) \
+        - 2.0*_kernel_sum(X[prototypes], X, metric=metric,
+                          max_block_size=max_block_size, **kwds)/(m*n)
+
+
+def _kernel_columns(X, indices, metric='rbf', **kwds):
+    """Return the columns of the kernel matrix of the given datapoints without computing the full kernel matrix.
+
+    Args:
+        X (numpy matrix): Set of datapoints (each row representing one datapoint) or the kernel matrix if metric is 'precomputed'.
+        indices (list of int): Indices of the columns.
+        metric (str or callable, optional): The metric to use when calculating kernel between instances in a feature array. Defaults to 'rbf'.
+        **kwds: optional keyword parameters
+            Any further parameters are passed directly to the kernel function.
+
+    Returns:
+        numpy matrix: The columns of the kernel matrix.
+    """
+    if metric == 'precomputed':
+        return X[:, indices]
+    return pairwise_kernels(X, X[indices], metric=metric, **kwds)
 
 
-def _compute_prototypes(X, n_prototypes, n_criticisms, metric='rbf', witness_penalty=1.0, **kwds):
+def _kernel_row_sums(X, metric='rbf', max_block_size=10000000, n_components=None, random_state=42, **kwds):
+    """Return the row sums of the kernel matrix of the given datapoints without storing the full kernel matrix.
+
+    The kernel matrix is computed in blocks of rows. If n_components is given, the row sums are approximated using the Nyström approximation
+    of the kernel matrix with n_components randomly chosen datapoints, so that only the kernel between all datapoints and these points is computed.
+
+    Args:
+        X (numpy matrix): Set of datapoints (each row representing one datapoint) or the kernel matrix if metric is 'precomputed'.
+        metric (str or callable, optional): The metric to use when calculating kernel between instances in a feature array. Defaults to 'rbf'.
+        max_block_size (int, optional): Maximal number of entries of the kernel matrix computed at once. Defaults to 10000000.
+        n_components (int or None, optional): Number of datapoints used for the Nyström approximation, if None the row sums are computed exactly. Defaults to None.
+        random_state (int, optional): Seed used to choose the datapoints of the Nyström approximation. Defaults to 42.
+        **kwds: optional keyword parameters
+            Any further parameters are passed directly to the kernel function.
+
+    Returns:
+        numpy vector: The row sums of the kernel matrix.
+    """
+    n = X.shape[0]
+    if metric == 'precomputed':
+        return X.sum(axis=1)
+    if n_components is not None and n_components < n:
+        landmarks = np.random.RandomState(random_state).choice(
+            n, n_components, replace=False)
+        C = _kernel_columns(X, landmarks, metric=metric, **kwds)
+        return C.dot(np.linalg.pinv(C[landmarks], hermitian=True).dot(C.sum(axis=0)))
+    block_rows = max(1, max_block_size // n)
+    result = np.empty(n)
+    for start in range(0, n, block_rows):
+        result[start:start+block_rows] = pairwise_kernels(
+            X[start:start+block_rows], X, metric=metric, **kwds).sum(axis=1)
+    return result
+
+
+def _compute_prototypes(X, n_prototypes, n_criticisms, metric='rbf', witness_penalty=1.0, max_block_size=10000000, n_components=None,
+                        random_state=42, **kwds):
     """This methods computes for given datapoints prototypes and criticisms.
 
     This methods computes for given datapoints prototypes and criticisms, i.e. datapoints from th given set that are typical representatives (prototypes) and datapoints
     that are not well representatives (criticisms). Here, a simple greedy algorithm using MDM2 is used to compute the prototypes and a witness function together
     with som simple penalty are used to compute the criticisms (see e.g. C. Molnar, Interpretable Machine Learning).
+    The full kernel matrix is never stored: Its row sums are computed blockwise (or approximated, see n_components) and only the kernel columns of the 
+    selected prototypes and criticisms are computed.
 
     Args:
         X (numpy matrix): Set of datapoints (each row representing one datapoint)
@@ -410,6 +631,10 @@ def _compute_prototypes(X, n_prototypes, n_criticisms, metric='rbf', witness_pen
             Currently, sklearn provides the following strings: ‘additive_chi2’, ‘chi2’, ‘linear’, ‘poly’, ‘polynomial’, ‘rbf’,
                                                 ‘laplacian’, ‘sigmoid’, ‘cosine’ 
         witness_penalty (float): Penalty parameter to include some penalty to avoid to close criticisms. 
+        max_block_size (int, optional): Maximal number of entries of the kernel matrix computed at once. Defaults to 10000000.
+        n_components (int or None, optional): If not None, the row sums of the kernel matrix are approximated by a Nyström approximation using n_components 
+            datapoints. This reduces the costs from quadratic to linear in the number of datapoints. Defaults to None.
+        random_state (int, optional): Seed used to choose the datapoints of the Nyström approximation. Defaults to 42.
         **kwds: optional keyword parameters
             Any further parameters are passed directly to the kernel function.
 
@@ -423,9 +648,8 @@ def _compute_prototypes(X, n_prototypes, n_criticisms, metric='rbf', witness_pen
     if not has_sklearn:
         raise Exception(
             'This method needs functionality form sklearn but sklearn is not installed.')
-    kernel_matrix = pairwise_kernels(X, metric=metric, **kwds)
     prototypes = []
-    n = float(kernel_matrix.shape[0])
+    n = float(X.shape[0])
     if n_prototypes >= n:
         raise Exception(
             'Number of prototypes must be less then number of datapoints.')
@@ -434,52 +658,51 @@ def _compute_prototypes(X, n_prototypes, n_criticisms, metric='rbf', witness_pen
     #     We are doing this using a greedy search, looking for the next prototype by simply computing which next datapoint reduces the current MDM most.
     #     For this we compute simply
     #     the impact on the MDM if a new point x is used as a prototype. The impact is computed by .. math::
-    #     \frac{2}{(m+1)^2}(k(x,x) + \sum{i=1}^mk(z_i,x)) -  \frac{2}{(m+1)n}\sum_{j=1}^n k(x,x_j)for i in range(n_prototypes):
-    #max_impact  = 1.0e8
+    #     \frac{2}{(m+1)^2}(k(x,x) + \sum{i=1}^mk(z_i,x)) -  \frac{2}{(m+1)n}\sum_{j=1}^n k(x,x_j)
+    #     The row sums \sum_{j=1}^n k(x,x_j) are computed once and the sums \sum{i=1}^mk(z_i,x) are updated with the kernel column of each new prototype.
+    row_sums = _kernel_row_sums(X, metric=metric, max_block_size=max_block_size,
+                                n_components=n_components, random_state=random_state, **kwds)
+    prototype_sums = np.zeros(X.shape[0])
+    is_prototype = np.zeros(X.shape[0], dtype=bool)
     for i in range(n_prototypes):
         m = float(len(prototypes))
-        max_impact = 1.0e8
-        new_prototype = None
-        for candidate in range(kernel_matrix.shape[0]):
-            if candidate not in prototypes:
-                impact = kernel_matrix[candidate][prototypes].sum(
-                )/((m+1)**2) - kernel_matrix[candidate, :].sum()/((m+1)*n)
-                if impact < max_impact:
-                    new_prototype = candidate
-                    max_impact = impact
-        if new_prototype is None:
+        impact = prototype_sums/((m+1)**2) - row_sums/((m+1)*n)
+        impact[is_prototype] = np.inf
+        new_prototype = int(np.argmin(impact))
+        if not impact[new_prototype] < 1.0e8:
             raise Exception('Cannot find a new prototype.')
         prototypes.append(new_prototype)
+        is_prototype[new_prototype] = True
+        prototype_sums += _kernel_columns(X, [new_prototype],
+                                          metric=metric, **kwds)[:, 0]
 
     m = float(len(prototypes))
-    n = float(kernel_matrix.shape[0])
+    witness = np.abs(row_sums/n - prototype_sums/m)
+    # maximal kernel value between each datapoint and the criticisms found so far
+    regularizer = np.zeros(X.shape[0])
+    is_criticism = np.zeros(X.shape[0], dtype=bool)
     criticisms = []
     for i in range(n_criticisms):
-        m_criticisms = float(len(criticisms))
-        max_witness = -1.0e8
-        new_criticism = None
-        for candidate in range(kernel_matrix.shape[0]):
-            if candidate not in criticisms:
-                witness = kernel_matrix[candidate].sum(
-                )/n - kernel_matrix[candidate][prototypes].sum()/m
-                if m_criticisms > 0:
-                    regularizer = kernel_matrix[candidate][criticisms].max()
-                else:
-                    regularizer = 0
-                cost = abs(witness) - witness_penalty*regularizer
-                if cost > max_witness:
-                    max_witness = cost
-                    new_criticism = candidate
-        if new_criticism is None:
+        cost = witness - witness_penalty*regularizer
+        cost[is_criticism] = -np.inf
+        new_criticism = int(np.argmax(cost))
+        if not cost[new_criticism] > -1.0e8:
             raise Exception('Cannot find a new criticism.')
         criticisms.append(new_criticism)
+        is_criticism[new_criticism] = True
+        column = _kernel_columns(
+            X, [new_criticism], metric=metric, **kwds)[:, 0]
+        if i == 0:
+            regularizer = column
+        else:
+            regularizer = np.maximum(regularizer, column)
 
     return prototypes, criticisms
 
 
 def generate_prototypes(ml_repo, data, n_prototypes, n_criticisms, data_version=RepoStore.LAST_VERSION,
                         use_x=True, data_start_index=0, data_end_index=-1, metric='rbf', witness_penalty=1.0,
-                        **kwds):
+                        max_block_size=10000000, n_components=None, **kwds):
     """This methods computes for a given test/training dataset prototypes and criticisms and adds them as separate test data sets to the repository. 
 
     This methods computes for given test/training dataset prototypes and criticisms, i.e. datapoints from th given set that are typical representatives (prototypes) 
@@ -503,6 +726,9 @@ def generate_prototypes(ml_repo, data, n_prototypes, n_criticisms, data_version=
             Currently, sklearn provides the following strings: ‘additive_chi2’, ‘chi2’, ‘linear’, ‘poly’, ‘polynomial’, ‘rbf’,
                                                 ‘laplacian’, ‘sigmoid’, ‘cosine’ 
         witness_penalty (float): Penalty parameter to include some penalty to avoid to close criticisms. 
+        max_block_size (int, optional): Maximal number of entries of the kernel matrix computed at once. Defaults to 10000000.
+        n_components (int or None, optional): If not None, the row sums of the kernel matrix are approximated by a Nyström approximation using n_components 
+            datapoints, so that the computational costs grow only linearly with the number of datapoints. Defaults to None.
         **kwds: optional keyword parameters
             Any further parameters are passed directly to the kernel function.
 
@@ -527,7 +753,8 @@ def generate_prototypes(ml_repo, data, n_prototypes, n_criticisms, data_version=
     std_scale = preprocessing.StandardScaler().fit(d)
     d = std_scale.transform(d)
     prototypes, criticisms = _compute_prototypes(
-        d, n_prototypes, n_criticisms, metric=metric, witness_penalty=witness_penalty, **kwds)
+        d, n_prototypes, n_criticisms, metric=metric, witness_penalty=witness_penalty, max_block_size=max_block_size,
+        n_components=n_components, **kwds)
 
     result_name = data.repo_info.name+'_'+'prototypes'
     if data.y_data is None:
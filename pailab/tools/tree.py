@@ -169,40 +169,7 @@ class _RawDataItem(_RepoObjectItem):
             Exception: If the data is not consistent to the RawData (e.g. different number of x-coordinates) it throws an exception.
         """
         logger.info('Start appending ' + str(x_data.shape[0]) + ' datapoints to RawData' + self._name)
-        raw_data = self._repo.get(self._name)
-        if len(raw_data.x_coord_names) != x_data.shape[1]:
-            raise Exception('Number of columns of x_data of RawData object is not equal to number of columns of additional x_data.')
-        if raw_data.y_coord_names is None and y_data is not None:
-            raise Exception('RawData object does not contain y_data but y_data is given')
-        if raw_data.y_coord_names is not None:
-            if y_data is None:
-                raise Exception('RawData object has y_data but no y_data is given')
-            if y_data.shape[1] != len(raw_data.y_coord_names ):
-                raise Exception('Number of columns of y_data of RawData object is not equal to number of columns of additional y_data.')
-        numpy_dict = {'x_data' : x_data}
-        if raw_data.y_coord_names is not None:
-            numpy_dict['y_data'] =  y_data
-        raw_data.n_data += x_data.shape[0]
-        old_version = raw_data.repo_info[RepoInfoKey.VERSION]
-        new_version = self._repo.add(raw_data)
-        self._repo._numpy_repo.append(self._name, old_version, new_version, numpy_dict)
-        # now find all datasets which are affected by the updated data
-        changed_data_sets = []
-        training_data = self._repo.get_training_data(full_object = False)
-        if isinstance(training_data, DataSet):
-            if training_data.raw_data == self._name and training_data.raw_data_version == repo_store.RepoStore.LAST_VERSION:
-                if training_data.end_index is None or training_data.end_index < 0:
-                    training_data.raw_data_version = new_version
-                    changed_data_sets.append(training_data)
-        test_data = self._repo.get_names(MLObjectType.TEST_DATA)
-        for d in test_data:
-            data = self._repo.get(d)
-            if isinstance(data, DataSet):
-                if data.raw_data == self._name and data.raw_data_version == repo_store.RepoStore.LAST_VERSION:
-                    if data.end_index is None or data.end_index < 0:
-                        data.raw_data_version = new_version
-                        changed_data_sets.append(data)
-        self._repo.add(changed_data_sets, 'RawData ' + self._name + ' updated, add DataSets depending om the updated RawData.')
+        new_version = self._repo.append_raw_data(self._name, x_data, y_data)
         if hasattr(self, 'obj'):#update current object
             self.obj = self._repo.get(self._name, version=new_version)
         logger.info('Finished appending data to RawData' + self._name)
@@ -14,6 +14,8 @@ from pailab.job_runner.job_runner import SQLiteJobRunner
 from pailab.job_runner.job_runner_factory import JobRunnerFactory
 
 import time
+import asyncio
+import multiprocessing
 
 import logging
 # logging.basicConfig(level=logging.DEBUG)
@@ -41,6 +43,18 @@ def eval_func_test(model, data):
     return np.zeros([10, 1])
 
 
+def eval_func_rows_test(model, data):
+    '''Dummy model eval function returning zeros with the number of rows of the data
+
+        The measure jobs compare the result with the y-values of the data, so that they only succeed if the number of rows matches
+        (test_data_2 consists of two rows only).
+    Args:
+        model ():dummy model, not used
+        data ():data used to determine the number of rows
+    '''
+    return np.zeros([data.x_data.shape[0], 1])
+
+
 def train_func_test(training_param, data):
     '''Dummy model training function for testing
 
@@ -53,6 +67,20 @@ def train_func_test(training_param, data):
     return TestClass(2, 3, repo_info={})  # pylint: disable=E1123
 
 
+def _add_objects_in_worker(config, prefix, n_objects, barrier):
+    '''Adds objects with new names to the repo using a SQLiteJobRunner worker, used as target of a worker process
+    '''
+    ml_repo = repo.MLRepo(user='unittestuser', config=config)
+    barrier.wait()
+    try:
+        for i in range(n_objects):
+            ml_repo.add(TestClass(i, i, repo_info={RepoInfoKey.NAME.value: prefix + str(i),  # pylint: disable=E1123
+                                                   RepoInfoKey.CATEGORY: MLObjectType.TRAINING_PARAM.value}))
+    finally:
+        ml_repo._job_runner.close_connection()
+        ml_repo._ml_repo.close_connection()
+
+
 class JobRunnerFactory_Test(unittest.TestCase):
     """Tests for JobRunnerFactory
 
@@ -94,6 +122,16 @@ class SQLiteJobRunner_Test(unittest.TestCase):
         self.repository.add(dummy_model, message='add dummy model',
                             category=MLObjectType.CALIBRATED_MODEL)
 
+    def _get_job_runner_config(self):
+        return {'type': 'sqlite',
+                'config': {
+                    'sqlite_db_name': 'tmp/job_runner.sqlite'
+                }
+                }
+
+    def _get_eval_function(self):
+        return eval_func_test
+
     def setUp(self):
         '''Setup a complete ML repo with two different test data objetcs, training data, model definition etc.
         '''
@@ -120,13 +158,7 @@ class SQLiteJobRunner_Test(unittest.TestCase):
                           'version_files': True
                       }
                   },
-                  'job_runner':
-                  {
-                      'type': 'sqlite',
-                      'config': {
-                          'sqlite_db_name': 'tmp/job_runner.sqlite'
-                      }
-                  }
+                  'job_runner': self._get_job_runner_config()
                   }
         self.repository = repo.MLRepo(user='unittestuser', config=config)
         self.handler = self.repository._ml_repo
@@ -149,7 +181,7 @@ class SQLiteJobRunner_Test(unittest.TestCase):
                               repo_info={repo_objects.RepoInfoKey.NAME.value: 'test_data_2',  repo_objects.RepoInfoKey.CATEGORY: repo.MLObjectType.TEST_DATA})
         self.repository.add([training_data, test_data_1, test_data_2])
 
-        self.repository.add_eval_function(eval_func_test)
+        self.repository.add_eval_function(self._get_eval_function())
         self.repository.add_training_function(train_func_test)
         self.repository.add(TestClass(1, 2, repo_info={repo_objects.RepoInfoKey.NAME.value: 'training_param',  # pylint: disable=E1123
                                                        repo_objects.RepoInfoKey.CATEGORY: repo.MLObjectType.TRAINING_PARAM}))
@@ -201,6 +233,170 @@ class SQLiteJobRunner_Test(unittest.TestCase):
 
         # now count the jobs waiting for predecessors
 
+    def test_multiple_workers(self):
+        """Test that a job is claimed by one worker only and that jobs with expired lease are reclaimed
+        """
+        job_runner = self.repository._job_runner
+        job_runner_2 = SQLiteJobRunner('tmp/job_runner.sqlite', self.repository, worker_id='worker_2')
+        try:
+            job = self.repository.run_training(run_descendants=True)
+            self.assertEqual(job_runner_2._claim_job(), (job[0], str(job[1])))
+            # the other jobs wait for the training job
+            self.assertIsNone(job_runner._claim_job())
+            self.assertEqual(job_runner.get_info(job[0], job[1])['worker_id'], 'worker_2')
+            # simulate crash of worker_2
+            job_runner._conn.execute('update jobs set lease_expiry = ?', (time.time() - 1.0,))
+            self.assertEqual(job_runner._claim_job(), (job[0], str(job[1])))
+            self.assertEqual(job_runner.get_info(job[0], job[1])['worker_id'], job_runner._id)
+            # result of worker_2 is discarded since it lost the lease
+            job_runner_2._set_finished(job[0], str(job[1]))
+            self.assertEqual(job_runner.get_info(job[0], job[1])['job_state'], JobState.RUNNING.value)
+            job_runner._set_finished(job[0], str(job[1]))
+            self.assertEqual(job_runner.get_info(job[0], job[1])['job_state'], JobState.SUCCESSFULLY_FINISHED.value)
+            self.assertIsNotNone(job_runner_2._claim_job())
+            journal_mode = job_runner._conn.execute('PRAGMA journal_mode').fetchone()[0]
+            self.assertEqual(journal_mode, 'wal')
+        finally:
+            job_runner_2.close_connection()
+
+    def test_workers_mapping(self):
+        """Test that workers in different processes adding objects to the same repo do not drop each others mapping entries
+        """
+        context = multiprocessing.get_context('spawn')
+        barrier = context.Barrier(2)
+        workers = [context.Process(target=_add_objects_in_worker, args=(self.repository._config, prefix, 20, barrier))
+                   for prefix in ['worker_1_', 'worker_2_']]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join(300)
+            self.assertEqual(w.exitcode, 0)
+        ml_repo = repo.MLRepo(user='unittestuser', config=self.repository._config)
+        names = ml_repo.get('repo_mapping')[MLObjectType.TRAINING_PARAM]
+        ml_repo._job_runner.close_connection()
+        ml_repo._ml_repo.close_connection()
+        for prefix in ['worker_1_', 'worker_2_']:
+            for i in range(20):
+                self.assertIn(prefix + str(i), names)
+
+    def test_several_predecessors(self):
+        """Test that a job waits until all of its predecessors have been finished
+        """
+        job_runner = self.repository._job_runner
+        with job_runner._conn:
+            for name in ['pred_1', 'pred_2']:
+                job_runner._conn.execute('insert into jobs (job_name, job_version, job_state, unfinished_pred_jobs, user, worker_id)'
+                                         ' values (?, ?, ?, 0, ?, ?)', (name, '1', JobState.RUNNING.value, 'test_user', job_runner._id))
+                job_runner._conn.execute('insert into predecessors (job_name, job_version, predecessor_name, predecessor_version)'
+                                         ' values (?, ?, ?, ?)', ('job', '1', name, '1'))
+            job_runner._conn.execute('insert into jobs (job_name, job_version, job_state, unfinished_pred_jobs, user)'
+                                     ' values (?, ?, ?, 2, ?)', ('job', '1', JobState.WAITING_PRED.value, 'test_user'))
+        job_runner._set_finished('pred_1', '1')
+        job_info = job_runner.get_info('job', '1')
+        self.assertEqual(job_info['job_state'], JobState.WAITING_PRED.value)
+        self.assertEqual(job_info['unfinished_pred_jobs'], 1)
+        job_runner._set_finished('pred_2', '1')
+        job_info = job_runner.get_info('job', '1')
+        self.assertEqual(job_info['job_state'], JobState.WAITING.value)
+        self.assertEqual(job_info['unfinished_pred_jobs'], 0)
+
+    def test_notification(self):
+        """Test that waiting workers are notified when jobs are added
+        """
+        job_runner_2 = SQLiteJobRunner('tmp/job_runner.sqlite', self.repository, sleep=30, worker_id='worker_2')
+        try:
+            job_runner_2._register_worker()
+            self.assertFalse(job_runner_2._wait_for_notification(0.1))
+            start = time.time()
+            self.repository.run_training()
+            self.assertTrue(job_runner_2._wait_for_notification(30))
+            self.assertLess(time.time() - start, 10)
+            # notifications are drained
+            self.assertFalse(job_runner_2._wait_for_notification(0.1))
+        finally:
+            job_runner_2.close_connection()
+
+
+class ProcessPoolJobRunner_Test(SQLiteJobRunner_Test):
+
+    def _get_job_runner_config(self):
+        return {'type': 'process_pool',
+                'config': {
+                    'max_workers': 2
+                }
+                }
+
+    def _get_eval_function(self):
+        # all jobs must finish successfully, including the measure jobs on test_data_2
+        return eval_func_rows_test
+
+    def test_job_runner(self):
+        """Test that the training and all descendant jobs are run respecting the predecessors
+        """
+        job = self.repository.run_training(run_descendants=True)
+        job_runner = self.repository._job_runner
+        self.assertTrue(job_runner.wait(timeout=300))
+        self.assertEqual(len(job_runner.get_waiting_jobs()), 0)
+        self.assertEqual(job_runner.get_info(job[0], job[1]).state, JobState.SUCCESSFULLY_FINISHED.value)
+        for job_info in job_runner._job_info.values():
+            self.assertEqual(job_info.state, JobState.SUCCESSFULLY_FINISHED.value)
+        self.assertEqual(len(job_runner._job_info), 10)
+        self.assertEqual(len(self.repository.get_names(MLObjectType.EVAL_DATA)), 3)
+        self.assertEqual(len(self.repository.get_names(MLObjectType.MEASURE)), 6)
+        # predecessors are finished before the jobs are started
+        training_job = job_runner.get_info(job[0], job[1])
+        for job_info in job_runner._job_info.values():
+            if job_info is not training_job:
+                self.assertGreaterEqual(job_info.start_time, training_job.end_time)
+
+    @unittest.skip('claiming jobs is specific to the SQLiteJobRunner')
+    def test_multiple_workers(self):
+        pass
+
+    @unittest.skip('the write lock of the job queue is specific to the SQLiteJobRunner')
+    def test_workers_mapping(self):
+        pass
+
+    @unittest.skip('the predecessors table is specific to the SQLiteJobRunner')
+    def test_several_predecessors(self):
+        pass
+
+    @unittest.skip('notifications are specific to the SQLiteJobRunner')
+    def test_notification(self):
+        pass
+
+
+class AsyncJobRunner_Test(ProcessPoolJobRunner_Test):
+
+    def _get_job_runner_config(self):
+        return {'type': 'asyncio',
+                'config': {
+                    'max_workers': 4,
+                    'max_concurrency': {'MeasureJob': 1}
+                }
+                }
+
+    def test_job_runner(self):
+        """Test that the jobs are run respecting the predecessors and the concurrency limits
+        """
+        job = self.repository.run_training(run_descendants=True)
+        job_runner = self.repository._job_runner
+        job_info = asyncio.run(job_runner.wait_for_job(job[0], job[1]))
+        self.assertEqual(job_info.state, JobState.SUCCESSFULLY_FINISHED.value)
+        self.assertTrue(job_runner.wait(timeout=300))
+        self.assertEqual(len(job_runner.get_waiting_jobs()), 0)
+        for job_info in job_runner._job_info.values():
+            self.assertEqual(job_info.state, JobState.SUCCESSFULLY_FINISHED.value)
+        self.assertEqual(len(job_runner._job_info), 10)
+        self.assertEqual(len(self.repository.get_names(MLObjectType.EVAL_DATA)), 3)
+        self.assertEqual(len(self.repository.get_names(MLObjectType.MEASURE)), 6)
+        # at most one measure job is running at a time
+        measure_jobs = sorted([v for k, v in job_runner._job_info.items() if '/jobs/measure/' in k],
+                              key=lambda x: x.start_time)
+        self.assertEqual(len(measure_jobs), 6)
+        for i in range(1, len(measure_jobs)):
+            self.assertGreaterEqual(measure_jobs[i].start_time, measure_jobs[i-1].end_time)
+
 
 if __name__ == '__main__':
     unittest.main()
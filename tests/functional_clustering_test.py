@@ -0,0 +1,90 @@
+import unittest
+import numpy as np
+
+import pailab.tools.functional_clustering as functional_clustering
+
+
+def _reference_similarity_matrix(f, g):
+    '''Pairwise computation of the similarity matrix (cosine of the angle between the increments of the functions)
+    '''
+    dx_f = f[:, 1:] - f[:, :-1]
+    dx_g = g[:, 1:] - g[:, :-1]
+    result = np.empty((f.shape[0], g.shape[0]))
+    for i in range(f.shape[0]):
+        for j in range(g.shape[0]):
+            d_i = np.sqrt(np.dot(dx_f[i], dx_f[i]))
+            d_j = np.sqrt(np.dot(dx_g[j], dx_g[j]))
+            if d_i < 0.00001 or d_j < 0.00001:
+                if d_i > 0.0001 or d_j > 0.0001:
+                    result[i, j] = 0.0
+                else:
+                    result[i, j] = 0.98
+            else:
+                result[i, j] = min(np.dot(dx_f[i], dx_g[j]) / (d_i * d_j), 1.0)
+    return result
+
+
+class SimilarityMatrixTest(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(42)
+        x = np.linspace(0.0, 1.0, 20)
+        self.f = np.concatenate([np.random.rand(8, 20),
+                                 np.sin(np.outer(np.arange(1.0, 5.0), x)),
+                                 # constant functions
+                                 np.full((2, 20), 3.0),
+                                 # nearly constant functions (norm of the increments between 1e-5 and 1e-4 and below 1e-5)
+                                 3.0 + 2e-4 * x[np.newaxis, :],
+                                 3.0 + 1e-6 * x[np.newaxis, :]])
+
+    def test_similarity_matrix(self):
+        '''Check the vectorized similarity matrix against the pairwise computation
+        '''
+        expected = _reference_similarity_matrix(self.f, self.f)
+        result = functional_clustering._compute_similarity_matrix(self.f)
+        self.assertEqual(result.dtype, np.float64)
+        self.assertTrue(np.allclose(result, expected, atol=1e-12))
+        self.assertTrue(np.allclose(result, result.T, atol=1e-12))
+        g = self.f[[0, 9, 13, 14]]
+        result = functional_clustering._compute_similarity_matrix(self.f, g)
+        self.assertTrue(np.allclose(result, _reference_similarity_matrix(self.f, g), atol=1e-12))
+
+    def test_similarity_matrix_blocks(self):
+        '''Check that the blocked computation and float32 give the same results
+        '''
+        expected = functional_clustering._compute_similarity_matrix(self.f)
+        for max_block_size in [1, 7, self.f.shape[0], 10000000]:
+            result = functional_clustering._compute_similarity_matrix(
+                self.f, max_block_size=max_block_size)
+            self.assertTrue(np.allclose(result, expected, atol=1e-12))
+        result = functional_clustering._compute_similarity_matrix(
+            self.f, dtype=np.float32, max_block_size=7)
+        self.assertEqual(result.dtype, np.float32)
+        self.assertTrue(np.allclose(result, expected, atol=1e-5))
+
+
+@unittest.skipIf(not functional_clustering.has_sklearn, 'sklearn is not installed')
+class AgglomerativeTest(unittest.TestCase):
+
+    def test_agglomerative(self):
+        '''Check that functions of the same shape are clustered together and the similarities to the cluster centres
+        '''
+        np.random.seed(42)
+        x = np.linspace(0.0, 1.0, 50)
+        f = np.concatenate([x[np.newaxis, :] + 0.01 * np.random.rand(10, 50),
+                            -x[np.newaxis, :] + 0.01 * np.random.rand(10, 50)])
+        clusters, similarity, centers = functional_clustering.agglomerative(
+            f, n_clusters=2)
+        self.assertEqual(clusters.shape, (20,))
+        self.assertEqual(len(set(clusters[:10])), 1)
+        self.assertEqual(len(set(clusters[10:])), 1)
+        self.assertNotEqual(clusters[0], clusters[10])
+        self.assertEqual(centers.shape, (2, 50))
+        self.assertTrue(np.allclose(similarity, _reference_similarity_matrix(f, centers)))
+        result = functional_clustering.agglomerative(
+            f, n_clusters=2, dtype=np.float32, max_block_size=7)
+        self.assertTrue(np.array_equal(result[0], clusters))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,264 @@
+import unittest
+import numpy as np
+
+import pailab.tools.interpretation as interpretation
+from pailab.ml_repo.repo_objects import RawData
+
+if interpretation.has_sklearn:
+    from sklearn.metrics.pairwise import pairwise_kernels
+    from sklearn import preprocessing
+
+
+def _eval_model(model, data):
+    x = data.x_data
+    return np.stack([x.dot(model), np.sin(x[:, 0]) * x[:, -1]], axis=1)
+
+
+class _EvalFunction:
+    '''Simple replacement of the repo's eval function object, creating the function and counting its calls
+    '''
+
+    def __init__(self):
+        self.n_calls = 0
+
+    def create(self):
+        def _eval(model, data):
+            self.n_calls += 1
+            return _eval_model(model, data)
+        return _eval
+
+
+def _reference_ice(data, model, y_coordinate, x_coordinate, x_values, start_index=0, end_index=-1, scale=''):
+    '''ICE computed row by row
+    '''
+    x_data = data.x_data[start_index:end_index, :]
+    result = np.empty((x_data.shape[0], len(x_values)))
+    for i in range(x_data.shape[0]):
+        eval_x_data = np.tile(x_data[i], (len(x_values), 1))
+        eval_x_data[:, x_coordinate] = x_values
+        y = _eval_model(model, RawData(eval_x_data, [
+                        str(k) for k in range(x_data.shape[1])]))[:, y_coordinate]
+        if not isinstance(scale, str):
+            y = y / max(np.linalg.norm(y, ord=scale), 1e-10)
+        result[i] = y
+    return result
+
+
+def _reference_MMD_square(X, Y, metric='rbf', **kwds):
+    '''Squared MMD using the full kernel matrices
+    '''
+    m = float(X.shape[0])
+    n = float(Y.shape[0])
+    return pairwise_kernels(X, metric=metric, **kwds).sum()/(m**2) + pairwise_kernels(Y, metric=metric, **kwds).sum()/(n**2) \
+        - 2.0*pairwise_kernels(X, Y, metric=metric, **kwds).sum()/(m*n)
+
+
+def _reference_prototypes(X, n_prototypes, n_criticisms, metric='rbf', witness_penalty=1.0, **kwds):
+    '''Prototypes and criticisms using the full kernel matrix
+    '''
+    kernel_matrix = pairwise_kernels(X, metric=metric, **kwds)
+    n = float(kernel_matrix.shape[0])
+    prototypes = []
+    for i in range(n_prototypes):
+        m = float(len(prototypes))
+        impact = kernel_matrix[:, prototypes].sum(
+            axis=1)/((m+1)**2) - kernel_matrix.sum(axis=1)/((m+1)*n)
+        impact[prototypes] = np.inf
+        prototypes.append(int(np.argmin(impact)))
+    m = float(len(prototypes))
+    witness = np.abs(kernel_matrix.sum(axis=1)/n -
+                     kernel_matrix[:, prototypes].sum(axis=1)/m)
+    criticisms = []
+    for i in range(n_criticisms):
+        regularizer = kernel_matrix[:, criticisms].max(
+            axis=1) if len(criticisms) > 0 else 0.0
+        cost = witness - witness_penalty*regularizer
+        cost[criticisms] = -np.inf
+        criticisms.append(int(np.argmax(cost)))
+    return prototypes, criticisms
+
+
+class ICETest(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(42)
+        self.data = RawData(np.random.rand(23, 3), ['x0', 'x1', 'x2'])
+        self.model = np.array([1.0, -2.0, 0.5])
+        self.x_values = np.linspace(-1.0, 1.0, 5)
+
+    def test_ice_blocks(self):
+        '''Check that the blocked ICE computation equals the row by row computation for different block sizes
+        '''
+        expected = _reference_ice(
+            self.data, self.model, 1, 0, self.x_values, start_index=1, end_index=-2)
+        for max_block_size in [1, 15, 16, 50, 1000000]:
+            eval_function = _EvalFunction()
+            result = interpretation._compute_ice(self.data, eval_function, self.model, 1, 0, self.x_values,
+                                                 start_index=1, end_index=-2, max_block_size=max_block_size)
+            self.assertEqual(result.shape, (20, 5))
+            self.assertTrue(np.allclose(result, expected, atol=1e-14))
+        # one call of the evaluation function per block of rows
+        eval_function = _EvalFunction()
+        interpretation._compute_ice(self.data, eval_function, self.model, 1, 0, self.x_values,
+                                    start_index=1, end_index=-2, max_block_size=50)
+        self.assertEqual(eval_function.n_calls, 7)
+
+    def test_ice_scale_and_threads(self):
+        '''Check the scaling and the parallel evaluation of the blocks
+        '''
+        expected = _reference_ice(
+            self.data, self.model, 0, 2, self.x_values, scale=2)
+        for n_jobs in [1, 3]:
+            result = interpretation._compute_ice(self.data, _EvalFunction(), self.model, 0, 2, self.x_values,
+                                                 scale=2, max_block_size=16, n_jobs=n_jobs)
+            self.assertTrue(np.allclose(result, expected, atol=1e-14))
+
+
+@unittest.skipIf(not interpretation.has_sklearn, 'sklearn is not installed')
+class MMDTest(unittest.TestCase):
+
+    def setUp(self):
+        random = np.random.RandomState(42)
+        self.X = random.normal(size=(300, 2))
+        self.Y = random.normal(loc=0.5, size=(200, 2))
+
+    def test_quadratic(self):
+        '''Check the blocked quadratic estimator against the computation using the full kernel matrices
+        '''
+        for metric, kwds in [('rbf', {}), ('laplacian', {'gamma': 0.3}), ('linear', {})]:
+            expected = _reference_MMD_square(self.X, self.Y, metric, **kwds)
+            for max_block_size in [1, 999, 10000000]:
+                result = interpretation._compute_MMD_square(self.X, self.Y, metric=metric,
+                                                            max_block_size=max_block_size, **kwds)
+                self.assertAlmostEqual(result, expected, places=12)
+        k_XX = interpretation._compute_MMD_square(self.X, max_block_size=999)
+        self.assertAlmostEqual(k_XX, pairwise_kernels(
+            self.X, metric='rbf').mean(), places=12)
+        result = interpretation._compute_MMD_square(self.X, self.Y, k_XX=k_XX)
+        self.assertAlmostEqual(result, _reference_MMD_square(
+            self.X, self.Y), places=12)
+
+    def test_rff(self):
+        '''Check that the random Fourier features estimator is close to the quadratic estimator and independent of the block size
+        '''
+        for metric in ['rbf', 'laplacian']:
+            expected = interpretation._compute_MMD_square(
+                self.X, self.Y, metric=metric)
+            result = interpretation._compute_MMD_square(self.X, self.Y, metric=metric, estimator='rff',
+                                                        n_features=5000)
+            self.assertAlmostEqual(result, expected, delta=0.2*expected)
+            blocked = interpretation._compute_MMD_square(self.X, self.Y, metric=metric, estimator='rff',
+                                                         n_features=5000, max_block_size=4999)
+            self.assertAlmostEqual(blocked, result, places=12)
+        k_XX = interpretation._compute_MMD_square(
+            self.X, estimator='rff', n_features=5000)
+        self.assertEqual(k_XX.shape, (5000,))
+        self.assertAlmostEqual(interpretation._compute_MMD_square(self.X, self.Y, k_XX=k_XX, estimator='rff', n_features=5000),
+                               interpretation._compute_MMD_square(self.X, self.Y, estimator='rff', n_features=5000), places=12)
+        with self.assertRaises(Exception):
+            interpretation._compute_MMD_square(
+                self.X, self.Y, metric='linear', estimator='rff')
+
+    def test_linear(self):
+        '''Check that the linear estimator is close to the quadratic estimator for different and close to zero for equal distributions
+        '''
+        random = np.random.RandomState(0)
+        X = random.normal(size=(20000, 2))
+        Y = random.normal(loc=0.5, size=(20000, 2))
+        expected = interpretation._compute_MMD_square(
+            X[:2000], Y[:2000])
+        result = interpretation._compute_MMD_square(X, Y, estimator='linear')
+        self.assertAlmostEqual(result, expected, delta=0.2*expected)
+        result = interpretation._compute_MMD_square(
+            X[:10000], X[10000:], estimator='linear')
+        self.assertLess(abs(result), 0.2*expected)
+        self.assertIsNone(interpretation._compute_MMD_square(
+            X, estimator='linear'))
+        with self.assertRaises(Exception):
+            interpretation._compute_MMD_square(X[:1], Y, estimator='linear')
+        with self.assertRaises(Exception):
+            interpretation._compute_MMD_square(X, Y, estimator='cubic')
+
+    def test_percentile(self):
+        '''Check the MMD between X and the percentiles of Y for a single percentile, a list of percentiles and several threads
+        '''
+        random = np.random.RandomState(42)
+        X = random.normal(size=(100, 3))
+        Y = np.stack([X[:, 0] + 0.1*random.normal(size=100),
+                      random.normal(size=100)], axis=1)
+        _X = preprocessing.StandardScaler().fit_transform(X)
+        result = interpretation._get_MMD2_X_vs_X_percentile(
+            X, Y, percentile=0.2)
+        self.assertEqual(result.shape, (3, 2))
+        for j in range(3):
+            for i in range(2):
+                x = _X[:, j:j+1]
+                indices = np.argsort(Y[:, i])[80:]
+                self.assertAlmostEqual(
+                    result[j, i], _reference_MMD_square(x, x[indices]), places=12)
+        # the percentile of the first y-coordinate differs most from X in the first x-coordinate
+        self.assertEqual(np.argmax(result[:, 0]), 0)
+
+        percentiles = [0.1, 0.2, 0.5]
+        result_list = interpretation._get_MMD2_X_vs_X_percentile(
+            X, Y, percentile=percentiles)
+        self.assertEqual(result_list.shape, (3, 3, 2))
+        self.assertTrue(np.array_equal(result_list[1], result))
+        result_threads = interpretation._get_MMD2_X_vs_X_percentile(
+            X, Y, percentile=percentiles, n_jobs=3)
+        self.assertTrue(np.array_equal(result_threads, result_list))
+        for estimator in ['linear', 'rff']:
+            result = interpretation._get_MMD2_X_vs_X_percentile(
+                X, Y, percentile=percentiles, estimator=estimator)
+            self.assertEqual(result.shape, (3, 3, 2))
+            result_threads = interpretation._get_MMD2_X_vs_X_percentile(
+                X, Y, percentile=percentiles, estimator=estimator, n_jobs=2)
+            self.assertTrue(np.array_equal(result_threads, result))
+
+
+@unittest.skipIf(not interpretation.has_sklearn, 'sklearn is not installed')
+class PrototypesTest(unittest.TestCase):
+
+    def setUp(self):
+        random = np.random.RandomState(42)
+        self.X = np.concatenate([random.normal(size=(80, 2)),
+                                 random.normal(loc=4.0, scale=0.5, size=(30, 2))])
+
+    def test_prototypes(self):
+        '''Check the blocked computation of prototypes and criticisms against the computation using the full kernel matrix
+        '''
+        expected = _reference_prototypes(self.X, 5, 3)
+        for max_block_size in [1, 333, 10000000]:
+            result = interpretation._compute_prototypes(
+                self.X, 5, 3, max_block_size=max_block_size)
+            self.assertEqual(result, expected)
+        expected = _reference_prototypes(self.X, 4, 2, metric='laplacian', witness_penalty=0.5, gamma=0.2)
+        result = interpretation._compute_prototypes(self.X, 4, 2, metric='laplacian', witness_penalty=0.5,
+                                                    max_block_size=333, gamma=0.2)
+        self.assertEqual(result, expected)
+        kernel_matrix = pairwise_kernels(self.X, metric='rbf')
+        self.assertEqual(interpretation._compute_prototypes(kernel_matrix, 5, 3, metric='precomputed'),
+                         _reference_prototypes(self.X, 5, 3))
+        prototypes = expected[0]
+        self.assertAlmostEqual(interpretation._compute_MMD2(self.X, prototypes, metric='laplacian', max_block_size=333, gamma=0.2),
+                               _reference_MMD_square(self.X, self.X[prototypes], metric='laplacian', gamma=0.2), places=12)
+
+    def test_nystroem(self):
+        '''Check that the Nyström approximation of the kernel row sums is close to the exact row sums and gives the same prototypes
+        '''
+        row_sums = pairwise_kernels(self.X, metric='rbf').sum(axis=1)
+        approx = interpretation._kernel_row_sums(self.X, n_components=60)
+        self.assertEqual(approx.shape, row_sums.shape)
+        self.assertTrue(np.allclose(approx, row_sums, rtol=0.05))
+        self.assertTrue(np.allclose(interpretation._kernel_row_sums(self.X, max_block_size=333), row_sums))
+        # the Nyström approximation is not used if the number of components is not less than the number of datapoints
+        self.assertTrue(np.allclose(interpretation._kernel_row_sums(
+            self.X, n_components=self.X.shape[0]), row_sums))
+        prototypes, criticisms = interpretation._compute_prototypes(
+            self.X, 5, 3, n_components=60)
+        self.assertEqual((prototypes, criticisms),
+                         _reference_prototypes(self.X, 5, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
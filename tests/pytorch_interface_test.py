@@ -0,0 +1,47 @@
+import unittest
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from pailab.ml_repo.repo_objects import RawData
+from pailab.externals.pytorch_interface import PytorchModelWrapper, eval_pytorch
+
+
+class LinearModel(torch.nn.Module):
+    def __init__(self, n_in, n_out):
+        super(LinearModel, self).__init__()
+        self.linear = torch.nn.Linear(n_in, n_out)
+
+    def forward(self, x):
+        return self.linear(x)
+
+
+class EvalPytorchTest(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(42)
+        pytorch_model = LinearModel(3, 2)
+        self.model = PytorchModelWrapper(pytorch_model, {'n_in': 3, 'n_out': 2},
+                                         eval_batch_size=4, repo_info={})
+        self.pytorch_model = pytorch_model
+
+    def test_eval_batches(self):
+        x = np.random.rand(10, 3)
+        data = RawData(x, ['x0', 'x1', 'x2'], repo_info={})
+        result = eval_pytorch(self.model, data)
+        with torch.no_grad():
+            expected = self.pytorch_model(
+                torch.from_numpy(x).float()).numpy()
+        self.assertEqual(result.shape, (10, 2))
+        self.assertTrue(np.allclose(result, expected, atol=1e-6))
+
+    def test_eval_empty_data(self):
+        data = RawData(np.empty((0, 3)), ['x0', 'x1', 'x2'], repo_info={})
+        result = eval_pytorch(self.model, data)
+        self.assertIsNotNone(result)
+        self.assertEqual(result.shape, (0, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
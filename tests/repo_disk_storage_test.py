@@ -7,6 +7,7 @@ import pailab.ml_repo.repo_objects as repo_objects
 from pailab.ml_repo.repo_store import RepoStore
 import pailab.ml_repo.disk_handler as disk_handler
 import time
+from contextlib import closing
 import logging
 # since we also test for errors we switch off the logging in this level
 logging.basicConfig(level=logging.FATAL)
@@ -142,9 +143,148 @@ class RepoDiskStorageTest(unittest.TestCase):
         n_objs_new = len(self._storage.get('obj', versions = (RepoStore.FIRST_VERSION, RepoStore.LAST_VERSION,)))
         self.assertEqual(n_objs-1, n_objs_new)
 
+    def test_add_many(self):
+        """Test adding a list of objects at once
+        """
+        objs = []
+        for i in range(3):
+            obj = TestClass(repo_info={repo_objects.RepoInfoKey.NAME.value: 'batch_' + str(i), 
+                                       repo_objects.RepoInfoKey.CATEGORY: repo.MLObjectType.MEASURE,
+                                       repo_objects.RepoInfoKey.MODIFICATION_INFO.value: {'obj': self._object_versions[-1]}})
+            objs.append(repo_objects.create_repo_obj_dict(obj))
+        versions = self._storage.add_many(objs)
+        self.assertEqual(len(versions), 3)
+        self.assertEqual(len(self._storage.get_names(repo.MLObjectType.MEASURE.name)), 3)
+        for i in range(3):
+            obj = self._storage.get('batch_' + str(i), modifier_versions={'obj': self._object_versions[-1]})
+            self.assertEqual(len(obj), 1)
+            self.assertEqual(obj[0]['repo_info'][repo_objects.RepoInfoKey.VERSION.value], versions[i])
+
+    def test_add_many_replace(self):
+        """Test that adding objects and replacing existing objects is done in one transaction
+        """
+        replaced = self._storage.get('obj')[0]
+        replaced['repo_info'][repo_objects.RepoInfoKey.DESCRIPTION.value] = 'replaced'
+        obj = TestClass(repo_info={repo_objects.RepoInfoKey.NAME.value: 'batch_replace',
+                                   repo_objects.RepoInfoKey.CATEGORY: repo.MLObjectType.MEASURE})
+        # the existing version of modifier_1 cannot be inserted again, nothing is written
+        duplicate = self._storage.get('modifier_1')[0]
+        with self.assertRaises(Exception):
+            self._storage.add_many([repo_objects.create_repo_obj_dict(obj), duplicate], [replaced])
+        self.assertEqual(len(self._storage.get('batch_replace', throw_error_not_exist=False)), 0)
+        self.assertNotEqual(self._storage.get('obj', repo_info_fields=['description'])[0]['repo_info'].get('description'), 'replaced')
+        self._storage.add_many([repo_objects.create_repo_obj_dict(obj)], [replaced])
+        self.assertEqual(len(self._storage.get('batch_replace')), 1)
+        self.assertEqual(self._storage.get('obj', repo_info_fields=['description'])[0]['repo_info']['description'], 'replaced')
+        self.assertEqual(self._storage.get('obj')[0]['repo_info']['description'], 'replaced')
 
+    def test_version_index(self):
+        """Test that the version index is updated by add and delete and by changes from other connections
+        """
+        self.assertEqual(self._storage.get_version('obj', 1), self._object_versions[0])
+        self.assertEqual(self._storage.get_version('obj', 2), self._object_versions[1])
+        self.assertEqual(self._storage.get_version('obj', -2), self._object_versions[-2])
+        # add object using a second storage working on the same db
+        storage_2 = disk_handler.RepoObjectDiskStorage('tmp_disk_storage')
+        obj = TestClass(repo_info={repo_objects.RepoInfoKey.NAME.value: 'obj', repo_objects.RepoInfoKey.CATEGORY: repo.MLObjectType.TRAINING_DATA})
+        version = storage_2.add(repo_objects.create_repo_obj_dict(obj))
+        storage_2.close_connection()
+        self.assertEqual(self._storage.get_latest_version('obj'), version)
+        obj = self._storage.get('obj', versions=RepoStore.LAST_VERSION)
+        self.assertEqual(obj[0]['repo_info'][repo_objects.RepoInfoKey.VERSION.value], version)
+        self._storage._delete('obj', version)
+        self.assertEqual(self._storage.get_latest_version('obj'), self._object_versions[-1])
 
+    def test_get_versions_by_modifiers(self):
+        """Test the lookup of the versions matching modifier versions for many objects at once
+        """
+        result = self._storage.get_versions_by_modifiers([
+            ('obj', {'modifier_1': self._modifier1_versions[0]}),
+            ('obj', {'modifier_1': self._modifier1_versions[0], 'modifier_2': self._modifier2_versions[1]}),
+            ('obj', {'modifier_1': RepoStore.LAST_VERSION, 'modifier_2': None}),
+            ('unknown', {'modifier_1': self._modifier1_versions[0]})])
+        self.assertEqual(result[0], self._object_versions[0:2])
+        self.assertEqual(result[1], [self._object_versions[1]])
+        self.assertEqual(result[2], self._object_versions[-2:])
+        self.assertEqual(result[3], [])
+
+    def test_get_states(self):
+        """Test that the states of many objects are read from the db at once
+        """
+        obj = TestClass(repo_info={repo_objects.RepoInfoKey.NAME.value: 'job',
+                                   repo_objects.RepoInfoKey.CATEGORY: repo.MLObjectType.JOB})
+        obj_dict = repo_objects.create_repo_obj_dict(obj)
+        obj_dict['state'] = 'running'
+        version = self._storage.add(obj_dict)
+        obj_dict['state'] = 'finished'
+        self._storage.replace(obj_dict)
+        objects = [('job', version), ('obj', self._object_versions[0])]
+        load_function = self._storage._load_function
 
+        def load_not_allowed(file_prefix):
+            raise Exception('Object file ' + file_prefix + ' must not be loaded.')
+        self._storage._load_function = load_not_allowed
+        self.assertEqual(self._storage.get_states(objects), ['finished', None])
+        # rows written before the state column has been added are loaded from disk
+        self._storage._load_function = load_function
+        with closing(self._storage._conn.cursor()) as cursor:
+            cursor.execute('update versions set state = NULL')
+            self._storage._conn.commit()
+        self.assertEqual(self._storage.get_states(objects), ['finished', None])
+
+    def test_schema_migration(self):
+        """Test that the secondary indexes are created on open and that quoted names are handled
+        """
+        with closing(self._storage._conn.cursor()) as cursor:
+            indexes = [row[0] for row in cursor.execute(
+                "select name from sqlite_master where type = 'index'")]
+            self.assertTrue('versions_name_time' in indexes)
+            self.assertTrue('modification_info_modifier_version' in indexes)
+            schema_version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        self.assertEqual(schema_version, disk_handler.RepoObjectDiskStorage._SCHEMA_VERSION)
+        obj = TestClass(repo_info={repo_objects.RepoInfoKey.NAME.value: "o'brien", 
+                                   repo_objects.RepoInfoKey.CATEGORY: repo.MLObjectType.TRAINING_DATA})
+        version = self._storage.add(repo_objects.create_repo_obj_dict(obj))
+        self.assertEqual(self._storage.get_latest_version("o'brien"), version)
+        self.assertTrue("o'brien" in self._storage.get_names(repo.MLObjectType.TRAINING_DATA.name))
+        # rows written before schema version 3 get their integer version keys during the migration
+        with closing(self._storage._conn.cursor()) as cursor:
+            self.assertTrue('versions_name_key' in [row[0] for row in cursor.execute(
+                "select name from sqlite_master where type = 'index'")])
+            cursor.execute('update versions set version_key = NULL')
+            cursor.execute('update modification_info set modifier_version_key = NULL')
+            disk_handler.RepoObjectDiskStorage._fill_version_keys(cursor)
+            self._storage._conn.commit()
+        self._storage._reset_version_index()
+        obj = self._storage.get('obj', versions=(self._object_versions[1], self._object_versions[3]),
+                                modifier_versions={'modifier_1': (self._modifier1_versions[0], self._modifier1_versions[1])})
+        self.assertEqual([x['repo_info'][repo_objects.RepoInfoKey.VERSION.value] for x in obj], self._object_versions[1:4])
+        self.assertEqual(self._storage.get_version('obj', -1), self._object_versions[-1])
+
+
+    def test_projection(self):
+        """Test that only the requested fields are returned and that repo_info fields are served from the db
+        """
+        objs = self._storage.get('obj', versions=(RepoStore.FIRST_VERSION, RepoStore.LAST_VERSION),
+                                 obj_fields=[], repo_info_fields=[repo_objects.RepoInfoKey.VERSION, 'classname'])
+        self.assertEqual(len(objs), len(self._object_versions))
+        for obj in objs:
+            self.assertEqual(set(obj.keys()), set(['repo_info']))
+            self.assertEqual(set(obj['repo_info'].keys()), set(['version', 'classname']))
+            self.assertTrue(obj['repo_info']['version'] in self._object_versions)
+        # projection on member fields needs to load the object
+        obj = self._storage.get('obj', versions=RepoStore.LAST_VERSION, obj_fields=['a'], repo_info_fields=['name'])[0]
+        self.assertEqual(obj, {'repo_info': {'name': 'obj'}, 'a': 1.0})
+        # rows written before the migration do not contain the repo_info columns
+        with closing(self._storage._conn.cursor()) as cursor:
+            cursor.execute('update versions set classname = NULL where name = ?', ('obj',))
+            self._storage._conn.commit()
+        obj = self._storage.get('obj', versions=RepoStore.LAST_VERSION, obj_fields=[], repo_info_fields=['classname'])[0]
+        self.assertEqual(obj['repo_info']['classname'], objs[-1]['repo_info']['classname'])
+        # no projection
+        obj = self._storage.get('obj', versions=RepoStore.LAST_VERSION)[0]
+        self.assertEqual(obj['b'], 2.0)
+        self.assertTrue(repo_objects.RepoInfoKey.MODIFICATION_INFO.value in obj['repo_info'])
 
 
 if __name__ == '__main__':
@@ -3,7 +3,9 @@ from pailab.tools.tests import RegressionTestDefinition
 import unittest
 import os
 import numpy as np
+import h5py
 import tempfile
+import threading
 
 from pailab import RepoInfoKey, MLObjectType, repo_object_init, RepoInfoKey, DataSet, RawData, MLRepo  # pylint: disable=E0401
 from pailab.ml_repo.repo import NamingConventions
@@ -12,7 +14,8 @@ import pailab.tools.tests as ml_tests
 import pailab.ml_repo.repo_objects as repo_objects
 import pailab.ml_repo.memory_handler as memory_handler
 import pailab.ml_repo.repo_store as repo_store
-from pailab.job_runner.job_runner import SimpleJobRunner  # pylint: disable=E0401
+from pailab.job_runner.job_runner import SimpleJobRunner, AsyncJobRunner, JobState  # pylint: disable=E0401
+from pailab.ml_repo.object_cache import RepoObjectCache
 import pailab.ml_repo.repo_store_factory as repo_store_factory
 from pailab.ml_repo.numpy_handler_hdf import NumpyHDFStorage, NumpyHDFRemoteStorage, _get_all_files
 import logging
@@ -151,6 +154,17 @@ def eval_func_test(model, data):
     return np.zeros([data.x_data.shape[0], 1])
 
 
+def eval_func_double_test(model, data):
+    '''Dummy model eval function for testing
+
+        Function returns independent of the model two times the x_data
+    Args:
+        model ():dummy model, not used
+        data ():data to evaluate
+    '''
+    return 2.0 * data.x_data
+
+
 def train_func_test(training_param, data):
     '''Dummy model training function for testing
 
@@ -272,6 +286,73 @@ class RepoTest(unittest.TestCase):
         self.assertEqual(old_num_commits+1, new_num_commits)
         commits = self.repository.get_commits()
 
+    def test_object_cache(self):
+        '''Check that repeated gets of the same version are served from the object cache and that deleted objects are removed from the cache
+        '''
+        cache = self.repository.get_object_cache()
+        obj = self.repository.get('training_param')
+        stats = cache.get_statistics()
+        obj_2 = self.repository.get(
+            'training_param', obj.repo_info[RepoInfoKey.VERSION])
+        self.assertEqual(cache.get_statistics()['hits'], stats['hits'] + 1)
+        self.assertEqual(obj_2.a, obj.a)
+        # objects returned from the cache are copies
+        obj_2.a = 10
+        self.assertEqual(self.repository.get('training_param').a, obj.a)
+        # jobs are not cached since they are updated without new version
+        job = self.repository.get('model/jobs/training')
+        self.assertIsNone(cache.get('model/jobs/training', job.repo_info.version))
+        # deleting an object removes it from the cache
+        self.repository.add(obj)
+        version = obj.repo_info[RepoInfoKey.VERSION]
+        self.repository.get('training_param', version)
+        self.repository.delete('training_param', version)
+        self.assertIsNone(cache.get('training_param', version))
+
+    def test_object_cache_threads(self):
+        '''Check that the object cache can be used by several threads concurrently
+        '''
+        cache = RepoObjectCache(max_size=20000, max_object_size=20000)
+        obj = {'repo_info': {'name': 'obj'}, 'data': list(range(100))}
+        errors = []
+
+        def use_cache(thread):
+            try:
+                for i in range(500):
+                    name = 'obj_' + str((thread + i) % 50)
+                    if cache.get(name, 'v1') is None:
+                        cache.add(name, 'v1', obj)
+                    if i % 7 == 0:
+                        cache.invalidate(name)
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=use_cache, args=(i,))
+                   for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(cache.get_statistics()['size'], sum(
+            len(v) for v in cache._entries.values()))
+        self.assertLessEqual(cache.get_statistics()['size'], cache.max_size)
+
+    def test_async_job_runner_memory(self):
+        '''Check that the AsyncJobRunner runs the jobs on a repo in memory
+        '''
+        job_runner = AsyncJobRunner(self.repository, max_workers=4)
+        self.repository._job_runner = job_runner
+        try:
+            self.repository.add(TestClass(2, 3, repo_info={repo_objects.RepoInfoKey.NAME.value: 'training_param',  # pylint: disable=E1123
+                                                           repo_objects.RepoInfoKey.CATEGORY: MLObjectType.TRAINING_PARAM}))
+            self.repository.run_training(run_descendants=True)
+            self.assertTrue(job_runner.wait(timeout=300))
+            self.assertGreater(len(job_runner._job_info), 1)
+            for job_info in job_runner._job_info.values():
+                self.assertEqual(job_info.state, JobState.SUCCESSFULLY_FINISHED.value)
+        finally:
+            job_runner.close_connection()
+
     def test_DataSet_get(self):
         '''Test if getting a DataSet does include all informations from the underlying RawData (excluding numpy data)
         '''
@@ -282,6 +363,50 @@ class RepoTest(unittest.TestCase):
         for i in range(len(raw_obj.y_coord_names)):
             self.assertEqual(raw_obj.y_coord_names[i], obj.y_coord_names[i])
 
+    def test_DataSet_slice(self):
+        '''Test that only the rows of a DataSet are read from the numpy store and that DataSets on the same rows share their data
+        '''
+        raw_data = repo_objects.RawData(np.arange(100.0).reshape(100, 1), ['x0'], np.arange(100.0), ['y0'],
+                                        repo_info={RepoInfoKey.NAME: 'raw_data_slice'})
+        self.repository.add(raw_data, category=MLObjectType.RAW_DATA)
+        self.repository.add_test_data('test_data_slice', 'raw_data_slice', 90, 100)
+        self.repository.add_test_data('test_data_slice_2', 'raw_data_slice', 90, 100)
+        stats = self.repository.get_data_set_statistics()
+        obj = self.repository.get('test_data_slice', full_object=True)
+        self.assertEqual(obj.n_data, 10)
+        self.assertEqual(obj.x_data.shape, (10, 1))
+        self.assertEqual(obj.x_data[0, 0], 90.0)
+        self.assertEqual(obj.y_data[-1, 0], 99.0)
+        self.assertEqual(self.repository.get_data_set_statistics()['bytes_read'] - stats['bytes_read'],
+                         obj.x_data.nbytes + obj.y_data.nbytes)
+        obj_2 = self.repository.get('test_data_slice_2', full_object=True)
+        self.assertTrue(obj_2.x_data is obj.x_data)
+        self.assertEqual(self.repository.get_data_set_statistics()['shared'], stats['shared'] + 2)
+        # without numpy data the number of rows is the number of rows of the DataSet
+        self.assertEqual(self.repository.get('test_data_slice').n_data, 10)
+
+    def test_DataSet_shared_buffers_read_only(self):
+        '''Test that DataSets share the buffers of the RawData and that modifying the data of one DataSet does not change other DataSets
+        '''
+        raw_data = repo_objects.RawData(np.arange(100.0).reshape(100, 1), ['x0'], np.arange(100.0), ['y0'],
+                                        repo_info={RepoInfoKey.NAME: 'raw_data_shared'})
+        self.repository.add(raw_data, category=MLObjectType.RAW_DATA)
+        self.repository.add_test_data('test_data_shared', 'raw_data_shared', 10, 20)
+        raw_obj = self.repository.get('raw_data_shared', full_object=True)
+        stats = self.repository.get_data_set_statistics()
+        obj = self.repository.get('test_data_shared', full_object=True)
+        # rows are taken from the RawData loaded before
+        self.assertEqual(self.repository.get_data_set_statistics()['bytes_read'], stats['bytes_read'])
+        self.assertEqual(obj.x_data[0, 0], 10.0)
+        with self.assertRaises(ValueError):
+            obj.x_data[:] *= 2
+        with self.assertRaises(ValueError):
+            raw_obj.x_data[10, 0] = -1.0
+        x_data = obj.x_data.copy()
+        x_data *= 2
+        self.assertEqual(raw_obj.x_data[10, 0], 10.0)
+        self.assertEqual(self.repository.get('test_data_shared', full_object=True).x_data[0, 0], 10.0)
+
     def test_DataSet_get_full(self):
         '''Test if getting a DataSet does include all informations from the underlying RawData (including numpy data)
         '''
@@ -344,6 +469,11 @@ class RepoTest(unittest.TestCase):
         self.repository.add(training_data)
         training_data_history = self.repository.get_history('training_data_1')
         self.assertEqual(len(training_data_history), 2)
+        training_data_history = self.repository.get_history('training_data_1', repo_info_fields=['version', 'author'],
+                                                            obj_member_fields=[])
+        self.assertEqual(len(training_data_history), 2)
+        self.assertEqual(training_data_history[0], {'repo_info': {'version': training_data_history[0]['repo_info']['version'],
+                                                                  'author': training_data_history[0]['repo_info']['author']}})
 
     def test_run_eval_defaults(self):
         '''Test running evaluation with default arguments
@@ -404,6 +534,96 @@ class RepoTest(unittest.TestCase):
         self.repository.run_evaluation()
         self.repository.run_measures()
 
+    def test_check_rerun(self):
+        """Test that the batch check_rerun returns the same as the check_rerun of the single jobs
+        """
+        self.repository.run_evaluation()
+        self.repository.run_measures()
+        jobs = [self.repository.get(name) for name in self.repository.get_names(MLObjectType.JOB)]
+        self.assertEqual(self.repository.check_rerun(jobs), [job.check_rerun(self.repository) for job in jobs])
+        self.assertFalse(any(self.repository.check_rerun(jobs)))
+        # after adding a new version of the eval function the evaluation jobs must be rerun
+        self.repository.add_eval_function(eval_func_test, 'eval_func')
+        rerun = self.repository.check_rerun(jobs)
+        self.assertEqual(rerun, [job.check_rerun(self.repository) for job in jobs])
+        self.assertTrue(any(rerun))
+
+    def test_run_eval_chunked(self):
+        """Test the evaluation in blocks of rows
+        """
+        raw_data = repo_objects.RawData(np.arange(10.0).reshape(10, 1), ['x0'], np.zeros(
+            [10, 1]), ['y0'], repo_info={repo_objects.RepoInfoKey.NAME.value: 'raw_2'})
+        self.repository.add(raw_data, category=MLObjectType.RAW_DATA)
+        self.repository.add_eval_function(eval_func_double_test, 'eval_func')
+        self.repository.run_training()
+        self.repository.run_evaluation(chunk_size=3)
+        eval_data = self.repository.get('model/eval/test_data_1', full_object=True)
+        self.assertEqual(eval_data.n_data, 10)
+        self.assertTrue(np.array_equal(eval_data.x_data, 2.0 * np.arange(10.0).reshape(10, 1)))
+        eval_data = self.repository.get('model/eval/test_data_2', full_object=True)
+        self.assertEqual(eval_data.n_data, 2)
+        self.assertEqual(eval_data.x_data.shape, (2, 1))
+        # the blocks are written to the version of the object, no intermediate versions remain in the numpy store
+        versions = [x['repo_info']['version'] for x in self.repository._ml_repo.get('model/eval/test_data_1',
+                    versions=(repo_store.RepoStore.FIRST_VERSION, repo_store.RepoStore.LAST_VERSION))]
+        self.assertEqual(sorted(self.repository._numpy_repo._store['model/eval/test_data_1'].keys()), sorted(versions))
+
+    def test_add_chunked_failure(self):
+        """Test that the numpy data written so far is deleted if a block cannot be written
+        """
+        def numpy_chunks():
+            yield {'x_data': np.ones((2, 1)), 'y_data': np.ones((2, 1))}
+            raise Exception('Reading block failed.')
+        raw_data = repo_objects.RawData(np.zeros((2, 1)), ['x0'], np.zeros((2, 1)), ['y0'],
+                                        repo_info={repo_objects.RepoInfoKey.NAME.value: 'raw_chunked'})
+        with self.assertRaises(Exception):
+            self.repository._add_chunked(raw_data, numpy_chunks(), category=MLObjectType.RAW_DATA)
+        self.assertFalse('raw_chunked' in self.repository._numpy_repo._store)
+        self.assertEqual(self.repository.get('raw_chunked', throw_error_not_exist=False), [])
+
+    def test_preprocessing_cache_commits(self):
+        """Test that adding, using and evicting cache entries does not create commits
+        """
+        cache = self.repository.get_preprocessing_cache()
+        cache.max_size = 1024*1024
+        cache.max_entries = 1
+        n_commits = len(self.repository.get_commits())
+        cache.add('fit_key', 'key_1', np.ones((10, 2)), ['x0', 'x1'])
+        self.assertTrue(np.array_equal(cache.get('fit_key', 'key_1').x_data, np.ones((10, 2))))
+        cache.add('fit_key', 'key_2', np.zeros((10, 2)), ['x0', 'x1'])
+        self.assertEqual(cache.get_statistics()['evictions'], 1)
+        self.assertIsNone(cache.get('fit_key', 'key_1'))
+        self.assertEqual(len(self.repository.get_commits()), n_commits)
+
+    def test_preprocessing_cache(self):
+        """Test that models with the same preprocessing share the preprocessed data
+        """
+        cache = self.repository.get_preprocessing_cache()
+        cache.max_size = 1024*1024
+        for model_name in ['model_2', 'model_3']:
+            self.repository.add_model(model_name, 'eval_func', 'train_func', preprocessors=[
+                                      'test_preprocessor_with_fitting'])
+            self.repository.run_training(model_name)
+        statistics = cache.get_statistics()
+        self.assertEqual(statistics['misses'], 1)
+        self.assertEqual(statistics['hits'], 1)
+        model = self.repository.get('model_3/model')
+        self.assertEqual(model.fitted_preprocessors[0].a, 4)
+        self.repository.run_evaluation('model_2/model')
+        self.repository.run_evaluation('model_3/model')
+        statistics = cache.get_statistics()
+        self.assertEqual(statistics['misses'], 4)
+        self.assertEqual(statistics['hits'], 4)
+        self.assertEqual(len(self.repository.get('preprocessing_cache', version=None)), 4)
+        # the least recently used entries are removed if the maximal number of entries is exceeded
+        cache.max_entries = 2
+        test_data_1 = DataSet('raw_2', 0, 5,
+                              repo_info={repo_objects.RepoInfoKey.NAME.value: 'test_data_1',  repo_objects.RepoInfoKey.CATEGORY: MLObjectType.TEST_DATA})
+        self.repository.add(test_data_1)
+        self.repository.run_evaluation('model_2/model')
+        self.assertEqual(len(self.repository.get('preprocessing_cache', version=None)), 2)
+        self.assertEqual(cache.get_statistics()['evictions'], 3)
+
     def test_run_measure_defaults_restrict_testdata(self):
         model = self.repository.get('model')
         model.test_data = 'test_data_2'
@@ -584,6 +804,39 @@ class RepoTest(unittest.TestCase):
         # now test add_test_data
         ml_repo.add_test_data('test_data_dummy', 'raw_data/test1')
 
+    def test_raw_data_appender(self):
+        """Test appending rows to RawData in batches
+        """
+        ml_repo = MLRepo(user='unittestuser')
+        ml_repo.add_raw_data('stream', np.zeros((2, 2)), [
+                             'x0', 'x1'], np.zeros((2, 1)), ['y0'])
+        ml_repo.add_test_data('test_data_stream', 'raw_data/stream')
+        ml_repo.add_test_data('test_data_stream_fixed',
+                              'raw_data/stream', 0, 2)
+        with ml_repo.raw_data_appender('raw_data/stream', batch_size=4) as appender:
+            for i in range(1, 11):
+                appender.append(np.full((1, 2), float(i)),
+                                np.full((1, 1), float(i)))
+            with self.assertRaises(Exception):
+                appender.append(np.zeros((1, 3)), np.zeros((1, 1)))
+        # two full batches and the rest on exit
+        self.assertEqual(len(ml_repo.get_history('raw_data/stream')), 4)
+        raw_data = ml_repo.get('raw_data/stream', full_object=True)
+        self.assertEqual(raw_data.n_data, 12)
+        self.assertEqual(raw_data.x_data.shape, (12, 2))
+        self.assertEqual(raw_data.y_data[-1, 0], 10.0)
+        # the floating DataSet follows the RawData, the fixed one not
+        data = ml_repo.get('test_data_stream', full_object=True)
+        self.assertEqual(data.raw_data_version,
+                         raw_data.repo_info[RepoInfoKey.VERSION])
+        self.assertEqual(data.x_data.shape[0], 12)
+        data = ml_repo.get('test_data_stream_fixed')
+        self.assertEqual(data.raw_data_version, repo_store.RepoStore.LAST_VERSION)
+        ml_repo.append_raw_data('raw_data/stream', np.ones(
+            (3, 2)), np.ones((3, 1)))
+        data = ml_repo.get('test_data_stream', full_object=True)
+        self.assertEqual(data.x_data.shape[0], 15)
+
     def test_add_label(self):
         """Test adding a label and if adding same label does not change anything
         """
@@ -686,6 +939,43 @@ class MLRepoConstructorTest(unittest.TestCase):
         # end instantiate with workspace
 
 
+class ObjectCacheSharedStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.config = {'user': 'test_user', 'workspace': self.folder,
+                       'repo_store': {'type': 'disk_handler', 'config': {'folder': self.folder + '/objects', 'file_format': 'pickle'}},
+                       'numpy_store': {'type': 'hdf_handler', 'config': {'folder': self.folder + '/numpy'}},
+                       'job_runner': {'type': 'simple', 'config': {}}}
+        self.repos = []
+
+    def tearDown(self):
+        for r in self.repos:
+            r._ml_repo.close_connection()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_test_job_update(self):
+        '''Check that a test job updated through another MLRepo on the same store is not returned from the object cache
+        '''
+        repo_1 = MLRepo(config=self.config)
+        self.repos.append(repo_1)
+        test = ml_tests.RegressionTest('model', 'test_data', repo_info={RepoInfoKey.NAME.value: 'model/tests/regression_test'})
+        repo_1.add(test, category=MLObjectType.TEST)
+        job = repo_1.get('model/tests/regression_test')
+        self.assertEqual(job.state, 'created')
+        repo_2 = MLRepo(config=self.config)
+        self.repos.append(repo_2)
+        job_2 = repo_2.get('model/tests/regression_test')
+        job_2.state = 'running'
+        repo_2._update_job(job_2)
+        job = repo_1.get('model/tests/regression_test', job.repo_info[RepoInfoKey.VERSION])
+        self.assertEqual(job.state, 'running')
+        self.assertIsNone(repo_1.get_object_cache().get(
+            'model/tests/regression_test', job.repo_info[RepoInfoKey.VERSION]))
+        # jobs are not cached, whatever category they have been added with
+        self.assertFalse(MLRepo._is_cacheable(
+            repo_objects.create_repo_obj_dict(job_2)))
+
+
 class NumpyMemoryHandlerTest(unittest.TestCase):
     def test_append(self):
         numpy_store = memory_handler.NumpyMemoryStorage()
@@ -703,6 +993,51 @@ class NumpyMemoryHandlerTest(unittest.TestCase):
         self.assertEqual(numpy_dict_3['b'][5], 5.0)
         self.assertEqual(numpy_dict_3['b'][0], 0.0)
 
+
+class RepoObjectMemoryStorageTest(unittest.TestCase):
+    def test_get(self):
+        store = memory_handler.RepoObjectMemoryStorage()
+        modifier_versions = [store.add({'repo_info': {'name': 'modifier', 'category': 'TEST_DATA', 'version': None}})
+                             for i in range(2)]
+        versions = []
+        for i in range(4):
+            versions.append(store.add({'repo_info': {'name': 'obj', 'category': 'MODEL', 'version': None,
+                                                     'modification_info': {'modifier': modifier_versions[i % 2]}},
+                                       'values': [i]}))
+        # the stored objects cannot be changed by the returned objects
+        obj = store.get('obj', versions[0])[0]
+        obj['values'].append(5)
+        self.assertEqual(store.get('obj', versions[0])[0]['values'], [0])
+        objs = store.get('obj', (versions[1], versions[2]))
+        self.assertEqual([x['values'][0] for x in objs], [1, 2])
+        objs = store.get('obj', modifier_versions={
+                         'modifier': modifier_versions[1]})
+        self.assertEqual([x['values'][0] for x in objs], [1, 3])
+        objs = store.get('obj', versions=(versions[0], versions[2]), modifier_versions={
+                         'modifier': modifier_versions[0]}, obj_fields=[], repo_info_fields=['version'])
+        self.assertEqual(objs, [{'repo_info': {'version': versions[0]}}, {
+                         'repo_info': {'version': versions[2]}}])
+        store._delete('obj', versions[2])
+        objs = store.get('obj', modifier_versions={
+                         'modifier': modifier_versions[0]})
+        self.assertEqual([x['values'][0] for x in objs], [0])
+        self.assertEqual(store.get_version('obj', -1), versions[3])
+
+    def test_custom_versions(self):
+        '''Test that versions which are not uuids are ordered by their insertion
+        '''
+        store = memory_handler.RepoObjectMemoryStorage()
+        versions = ['v1', 'v2', 'v3']
+        for i, v in enumerate(versions):
+            store.add({'repo_info': {'name': 'obj', 'category': 'MODEL', 'version': v}, 'values': [i]})
+        self.assertEqual(store.get('obj', 'v2')[0]['values'], [1])
+        self.assertEqual(store.get_latest_version('obj'), 'v3')
+        self.assertEqual(store.get_version('obj', 0), 'v1')
+        self.assertEqual([x['values'][0] for x in store.get('obj', ('v1', 'v2'))], [0, 1])
+        store._delete('obj', 'v3')
+        self.assertEqual(store.get_latest_version('obj'), 'v2')
+        self.assertEqual(store.get('obj', 'unknown', throw_error_not_exist=False), [])
+
 # define model
 
 
@@ -819,6 +1154,122 @@ class NumpyHDFStorageTest(unittest.TestCase):
         self.assertEqual(test_data[0, 0, 0, 1],
                          test_data_get['test_data'][0, 0, 0, 1])
 
+    def test_get_rows(self):
+        """test reading a range of rows, with and without memory mapping
+        """
+
+        test_data = np.arange(30.0).reshape(10, 3)
+        self.store.add('test_2d', '1', {'test_data': test_data})
+        test_data_get = self.store.get('test_2d', '1', from_index=7)
+        self.assertEqual(test_data_get['test_data'].shape, (3, 3))
+        self.assertEqual(test_data_get['test_data'][0, 0], 21.0)
+        store = NumpyHDFStorage('test_numpy_hdf5/mmap', memory_map=True)
+        store.add('test_2d', '1', {'test_data': test_data})
+        test_data_get = store.get('test_2d', '1', from_index=2, to_index=5)
+        self.assertTrue(isinstance(test_data_get['test_data'], np.memmap))
+        self.assertTrue(np.array_equal(test_data_get['test_data'], test_data[2:5]))
+        store.append('test_2d', '1', '2', {'test_data': np.full((1, 3), -1.0)})
+        test_data_get = store.get('test_2d', '2', from_index=9)
+        self.assertTrue(np.array_equal(test_data_get['test_data'], [test_data[9], [-1.0, -1.0, -1.0]]))
+        test_data_get = store.get('test_2d', '1')
+        self.assertTrue(np.array_equal(test_data_get['test_data'], test_data))
+
+    def test_storage_options(self):
+        """test chunking, compression and dtype options for the default and for a category
+        """
+
+        store = NumpyHDFStorage('test_numpy_hdf5/options', storage_options={'default': {'compression': 'gzip', 'shuffle': True, 'chunk_rows': 4},
+                                                                            'RAW_DATA': {'compression': 'lzf', 'dtype': 'float32'}})
+        test_data = np.arange(30.0).reshape(10, 3)
+        store.add('test_default', '1', {'test_data': test_data})
+        store.add('test_raw', '1', {'test_data': test_data}, 'RAW_DATA')
+        store.append('test_raw', '1', '2', {'test_data': np.full((2, 3), -1.0)})
+        with h5py.File('test_numpy_hdf5/options/test_default.hdf5', 'r') as f:
+            data = f['/data/1/test_data']
+            self.assertEqual(data.compression, 'gzip')
+            self.assertTrue(data.shuffle)
+            self.assertEqual(data.chunks, (4, 3))
+        with h5py.File('test_numpy_hdf5/options/test_raw.hdf5', 'r') as f:
+            data = f['/data/1/test_data']
+            self.assertEqual(data.compression, 'lzf')
+            self.assertEqual(data.dtype, np.float32)
+        self.assertTrue(np.array_equal(store.get('test_default', '1')['test_data'], test_data))
+        test_data_get = store.get('test_raw', '2')['test_data']
+        self.assertEqual(test_data_get.shape, (12, 3))
+        self.assertEqual(test_data_get[9, 2], 29.0)
+        self.assertEqual(test_data_get[11, 2], -1.0)
+
+    def test_deduplicate(self):
+        """test that identical arrays are stored only once and remain if the version storing them is deleted
+        """
+
+        store = NumpyHDFStorage('test_numpy_hdf5/dedup', deduplicate=True)
+        test_data = np.arange(30.0).reshape(10, 3)
+        store.add('test_2d', '1', {'x': test_data, 'y': np.zeros((2,))})
+        store.add('test_2d', '2', {'x': test_data.copy(), 'y': np.ones((2,))})
+        with h5py.File('test_numpy_hdf5/dedup/test_2d.hdf5', 'r') as f:
+            self.assertEqual(f['/data/1/x'].id, f['/data/2/x'].id)
+            self.assertNotEqual(f['/data/1/y'].id, f['/data/2/y'].id)
+        store._delete('test_2d', '1')
+        self.assertTrue(np.array_equal(store.get('test_2d', '2')['x'], test_data))
+        # the data of the deleted version is stored again
+        store.add('test_2d', '3', {'x': np.zeros((2,)), 'y': np.ones((2,))})
+        test_data_get = store.get('test_2d', '3')
+        self.assertTrue(np.array_equal(test_data_get['x'], np.zeros((2,))))
+        self.assertTrue(np.array_equal(test_data_get['y'], np.ones((2,))))
+
+    def test_extend(self):
+        """test appending data to an existing version (using one hdf file, one file per version and deduplicated data)
+        """
+
+        for folder, kwargs in [('extend', {}), ('extend_version_files', {'version_files': True}),
+                               ('extend_dedup', {'deduplicate': True}), ('extend_memory_map', {'memory_map': True})]:
+            store = NumpyHDFStorage('test_numpy_hdf5/' + folder, **kwargs)
+            test_data = np.arange(30.0).reshape(10, 3)
+            store.add('test_2d', '1', {'x': test_data})
+            store.add('test_2d', '2', {'x': test_data.copy()})
+            store._extend('test_2d', '2', {'x': np.full((2, 3), -1.0)})
+            store._extend('test_2d', '2', {'x': np.full((1, 3), -2.0)})
+            self.assertTrue(np.array_equal(store.get('test_2d', '1')['x'], test_data))
+            self.assertTrue(np.array_equal(store.get('test_2d', '2')['x'],
+                                           np.concatenate([test_data, np.full((2, 3), -1.0), np.full((1, 3), -2.0)])))
+
+    def test_deduplicate_append(self):
+        """test that appending to versions sharing a deduplicated dataset does not change the other versions
+        """
+
+        store = NumpyHDFStorage('test_numpy_hdf5/dedup_append', deduplicate=True)
+        test_data = np.arange(30.0).reshape(10, 3)
+        store.add('test_2d', 'A', {'x': test_data})
+        store.add('test_2d', 'B', {'x': test_data.copy()})
+        store.append('test_2d', 'A', 'A2', {'x': np.full((2, 3), -1.0)})
+        store.append('test_2d', 'B', 'B2', {'x': np.full((1, 3), -2.0)})
+        self.assertTrue(np.array_equal(store.get('test_2d', 'A')['x'], test_data))
+        self.assertTrue(np.array_equal(store.get('test_2d', 'B')['x'], test_data))
+        self.assertTrue(np.array_equal(store.get('test_2d', 'A2')['x'],
+                                       np.concatenate([test_data, np.full((2, 3), -1.0)])))
+        self.assertTrue(np.array_equal(store.get('test_2d', 'B2')['x'],
+                                       np.concatenate([test_data, np.full((1, 3), -2.0)])))
+        # the content hash still links to the unchanged data
+        store.add('test_2d', 'C', {'x': test_data.copy()})
+        self.assertTrue(np.array_equal(store.get('test_2d', 'C')['x'], test_data))
+        # appending twice to the same version
+        store.append('test_2d', 'A2', 'A3', {'x': np.full((1, 3), -3.0)})
+        store.append('test_2d', 'A2', 'A4', {'x': np.full((1, 3), -4.0)})
+        self.assertEqual(store.get('test_2d', 'A3')['x'][-1, 0], -3.0)
+        self.assertEqual(store.get('test_2d', 'A4')['x'][-1, 0], -4.0)
+        self.assertEqual(store.get('test_2d', 'A4')['x'].shape, (13, 3))
+        # a dataset used by one version only but linked by its content hash is not changed
+        other_data = np.arange(6.0).reshape(2, 3)
+        store.add('test_2d', 'D', {'x': other_data})
+        with h5py.File('test_numpy_hdf5/dedup_append/test_2d.hdf5', 'r') as f:
+            content_hash = f['/data/D/x'].attrs['content_hash']
+            self.assertEqual(f['/content/'].get(content_hash), f['/data/D/x'])
+        store.append('test_2d', 'D', 'D2', {'x': np.full((1, 3), -5.0)})
+        store.add('test_2d', 'E', {'x': other_data.copy()})
+        self.assertTrue(np.array_equal(store.get('test_2d', 'E')['x'], other_data))
+        self.assertEqual(store.get('test_2d', 'D2')['x'].shape, (3, 3))
+
     def test_append(self):
         """test appending data to existing numpy data (using one hdf file)
         """